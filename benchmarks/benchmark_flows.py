@@ -0,0 +1,201 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+"""
+Benchmarks of the framework overhead of Alexa App page object flows, run against recorded UI hierarchy snapshots
+with the replay driver, so that no phone, appium server, plug or DUT is needed. Every flow reports its driver round
+trips and wall time, and round trips are compared with a baseline to catch regressions.
+Waits which do not involve the driver, such as the off time of a plug power cycle, are left out.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from src.alexa_app_page_objects import AlexaAppPageObjects, SMART_DEVICE_LOCATOR_TEMP, PLUG_DEVICE_POWER_ON_LOCATOR, \
+    PLUG_DEVICE_POWER_OFF_LOCATOR, PLUG_DEVICE_BACK_LOCATOR, SMART_DEVICE_CONFIG_LOCATOR, \
+    SMART_DEVICE_DELETE_LOCATOR, SMART_DEVICE_DELETE_CONFIRM_LOCATOR
+from src.replay_driver import ReplayDriver, ReplayTransition
+from src.tracing import instrument_driver, tracer
+
+SNAPSHOTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshots')
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEVICE_NAMES = ['First plug', 'Second plug', 'First switch']
+# Num of refreshes of Devices page before DUT shows up in wait_until_smart_dut_present flow
+SWIPES_BEFORE_SMART_DUT_PRESENT = 3
+DEFAULT_TOLERANCE = 0.1
+
+# Recorded screens, the same snapshot can be replayed as different screens
+SCREENS = {
+    'devices': 'devices.xml',
+    'devices_without_dut': 'devices_without_dut.xml',
+    'dut': 'dut.xml',
+    'dut_settings': 'dut_settings.xml',
+    'dut_delete_confirm': 'dut_delete_confirm.xml',
+    'dut_plug_off': 'plug_off.xml',
+    'dut_plug_on': 'plug_on.xml',
+    'provisioner_plug_on': 'provisioner_plug_on.xml',
+    'provisioner_plug_off': 'provisioner_plug_off.xml'
+}
+
+
+def tile_of(name):
+    return SMART_DEVICE_LOCATOR_TEMP.replace('NAME', name)
+
+
+def delete_dut_flow():
+    transitions = [
+        ReplayTransition('devices', 'dut', 'click', tile_of(DEVICE_NAMES[2])),
+        ReplayTransition('dut', 'dut_settings', 'click', SMART_DEVICE_CONFIG_LOCATOR),
+        ReplayTransition('dut_settings', 'dut_delete_confirm', 'click', SMART_DEVICE_DELETE_LOCATOR),
+        ReplayTransition('dut_delete_confirm', 'devices_without_dut', 'click', SMART_DEVICE_DELETE_CONFIRM_LOCATOR)
+    ]
+    return 'devices', transitions, lambda pages: pages.delete_dut()
+
+
+def power_cycle_provisioner_flow():
+    transitions = [
+        ReplayTransition('devices', 'provisioner_plug_on', 'click', tile_of(DEVICE_NAMES[1])),
+        ReplayTransition('provisioner_plug_on', 'provisioner_plug_off', 'click', PLUG_DEVICE_POWER_ON_LOCATOR),
+        ReplayTransition('provisioner_plug_off', 'provisioner_plug_on', 'click', PLUG_DEVICE_POWER_OFF_LOCATOR)
+    ]
+    return 'devices', transitions, lambda pages: pages.power_off_and_on_plug(DEVICE_NAMES[1], off_time=0)
+
+
+def power_off_dut_already_off_flow():
+    transitions = [
+        ReplayTransition('devices', 'dut_plug_off', 'click', tile_of(DEVICE_NAMES[0]))
+    ]
+    return 'devices', transitions, lambda pages: pages.power_off_dut()
+
+
+def power_on_dut_flow():
+    transitions = [
+        ReplayTransition('devices_without_dut', 'dut_plug_off', 'click', tile_of(DEVICE_NAMES[0])),
+        ReplayTransition('dut_plug_off', 'dut_plug_on', 'click', PLUG_DEVICE_POWER_OFF_LOCATOR),
+        ReplayTransition('dut_plug_on', 'devices_without_dut', 'click', PLUG_DEVICE_BACK_LOCATOR)
+    ]
+
+    def flow(pages):
+        pages.power_on_dut()
+        pages.click_navigate_back_from_plug_device_page()
+    return 'devices_without_dut', transitions, flow
+
+
+def wait_until_smart_dut_present_flow():
+    transitions = [
+        ReplayTransition('devices_without_dut', 'devices', 'swipe', times=SWIPES_BEFORE_SMART_DUT_PRESENT)
+    ]
+    return 'devices_without_dut', transitions, lambda pages: pages.wait_until_smart_dut_present(60)
+
+
+FLOWS = {
+    'delete_dut': delete_dut_flow,
+    'power_cycle_provisioner': power_cycle_provisioner_flow,
+    'power_off_dut_already_off': power_off_dut_already_off_flow,
+    'power_on_dut': power_on_dut_flow,
+    'wait_until_smart_dut_present': wait_until_smart_dut_present_flow
+}
+
+
+def load_screens():
+    screens = {}
+    for screen, file_name in SCREENS.items():
+        with open(os.path.join(SNAPSHOTS_DIR, file_name), encoding='utf-8') as f:
+            screens[screen] = f.read()
+    return screens
+
+
+def run_flow(name, latency=0.0):
+    """
+    Run the flow against the replay driver
+    :param name: Name of the flow in FLOWS
+    :param latency: Latency of each driver command in seconds
+    :return: Dictionary of round trips, round trips per command, round trips saved by the session driver and wall
+    time in seconds
+    """
+    initial_screen, transitions, flow = FLOWS[name]()
+    driver = ReplayDriver(load_screens(), initial_screen, transitions, latency)
+    pages = AlexaAppPageObjects(driver, DEVICE_NAMES)
+    if tracer.enabled:
+        instrument_driver(driver)
+    time_start = time.perf_counter()
+    with tracer.span(name, 'flow'):
+        flow(pages)
+    return {
+        "round_trips": driver.round_trips,
+        "commands": dict(driver.commands),
+        "saved_round_trips": sum(pages.driver.saved.values()),
+        "wall_time": time.perf_counter() - time_start
+    }
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    Compare round trips of flows with the baseline
+    :param results: Dictionary of flow results keyed by flow name
+    :param baseline: Dictionary of baseline round trips keyed by flow name
+    :param tolerance: Ratio of round trips above baseline allowed
+    :return: List of regression messages
+    """
+    regressions = []
+    for name, result in results.items():
+        if name in baseline and result["round_trips"] > baseline[name] * (1 + tolerance):
+            regressions.append(f'{name}: {result["round_trips"]} round trips, baseline {baseline[name]}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark framework overhead of page object flows offline')
+    parser.add_argument('--flow', action='append', choices=sorted(FLOWS), help='Flow to run, all flows if not given')
+    parser.add_argument('--latency', type=float, default=0.0, help='Latency of each driver command in seconds')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='Json file of baseline round trips per flow')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Ratio of round trips above baseline allowed before failing')
+    parser.add_argument('--update_baseline', action='store_true', help='Save the round trips as the new baseline')
+    parser.add_argument('--trace_dir', help='Folder to export the timeline of the flows to')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(levelname)s %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+
+    if args.trace_dir:
+        tracer.enable()
+    results = {name: run_flow(name, args.latency) for name in args.flow or sorted(FLOWS)}
+    if args.trace_dir:
+        tracer.export(args.trace_dir, prefix='benchmark')
+    for name, result in results.items():
+        commands = ', '.join(f'{command}: {count}' for command, count in sorted(result["commands"].items()))
+        print(f'{name:<32} {result["round_trips"]:>5} round trips {result["saved_round_trips"]:>3} saved '
+              f'{result["wall_time"]:>8.3f} s  ({commands})')
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({name: result["round_trips"] for name, result in results.items()}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        return 0
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+    for regression in regressions:
+        print(f'Regression of {regression}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
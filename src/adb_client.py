@@ -0,0 +1,267 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+In-process client of the adb server, talking its socket protocol on port 5037 instead of spawning an adb process per
+command. A request is its length in 4 hex digits followed by the request, and is answered by "OKAY", or by "FAIL"
+followed by a length prefixed message. Host requests ("host:...") are served by the server itself, while a device
+service ("shell:...") is requested after switching the connection to the transport of a phone, and its output is then
+streamed until the connection closes. The server closes the connection after every request except a device tracker,
+so the state of all phones is kept up to date by one long lived "host:track-devices" connection, and a query of the
+attached phones costs no round trip while it is tracked
+"""
+
+import logging
+import os
+import socket
+import subprocess
+import threading
+
+ADB_SERVER_HOST = '127.0.0.1'
+ADB_SERVER_PORT = int(os.environ.get('ANDROID_ADB_SERVER_PORT', 5037))
+# State of a phone which is attached and authorized, see "adb devices"
+DEVICE_STATE_ONLINE = 'device'
+TIMEOUT_ADB_SOCKET_IN_SECOND = 10
+TIMEOUT_ADB_SERVER_START_IN_SECOND = 30
+SLEEP_TIME_TRACK_DEVICES_RETRY_IN_SECOND = 2
+
+
+class AdbError(Exception):
+    """
+    The adb server fails a request, e.g. the phone is not attached or more than one phone is attached
+    """
+
+
+def _encode_request(request):
+    payload = request.encode('utf-8')
+    return f'{len(payload):04x}'.encode('ascii') + payload
+
+
+def _parse_devices(data):
+    devices = {}
+    for line in data.splitlines():
+        fields = line.split()
+        if len(fields) >= 2:
+            devices[fields[0]] = fields[1]
+    return devices
+
+
+class AdbClient:
+    """
+    The class is used to run adb requests through the socket of the adb server, and to track the attached phones
+    """
+
+    def __init__(self, host=ADB_SERVER_HOST, port=ADB_SERVER_PORT):
+        """
+        Initialize the AdbClient object
+        :param host: Host of the adb server
+        :param port: Port of the adb server, ANDROID_ADB_SERVER_PORT or 5037 by default like adb
+        """
+        self.host = host
+        self.port = port
+        self._devices = None
+        self._devices_lock = threading.Lock()
+        self._tracker = None
+        self._tracker_conn = None
+        self._stop_tracking = threading.Event()
+        self._server_start_lock = threading.Lock()
+
+    def connect(self, timeout=TIMEOUT_ADB_SOCKET_IN_SECOND):
+        """
+        Connect to the adb server, which is started by "adb start-server" if it is not running
+        :param timeout: Timeout in seconds of every socket operation, None to block
+        :return: Socket
+        """
+        try:
+            conn = socket.create_connection((self.host, self.port), TIMEOUT_ADB_SOCKET_IN_SECOND)
+        except ConnectionRefusedError:
+            self.start_server()
+            conn = socket.create_connection((self.host, self.port), TIMEOUT_ADB_SOCKET_IN_SECOND)
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn.settimeout(timeout)
+        return conn
+
+    def start_server(self):
+        """
+        Start the adb server, the only adb process spawned by the client
+        """
+        with self._server_start_lock:
+            logging.info(f'[Adb] Starting adb server on port {self.port}')
+            subprocess.run(['adb', '-P', str(self.port), 'start-server'], stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL, timeout=TIMEOUT_ADB_SERVER_START_IN_SECOND, check=True)
+
+    def host_command(self, request):
+        """
+        Run a host request which answers with one length prefixed message, e.g. "host:devices"
+        :param request: Request without its length
+        :return: String of the answer
+        """
+        with self.connect() as conn:
+            self._request(conn, request)
+            return self._read_message(conn)
+
+    def open_service(self, service, serial=None, timeout=TIMEOUT_ADB_SOCKET_IN_SECOND):
+        """
+        Open a service of a phone, e.g. "shell:logcat", whose output is streamed by the returned socket until it closes
+        :param service: Service request without its length
+        :param serial: Serial number of the phone, the only attached phone if not given
+        :param timeout: Timeout in seconds of every socket operation, None to block
+        :return: Socket, which the caller closes
+        """
+        conn = self.connect(timeout)
+        try:
+            self._request(conn, f'host:transport:{serial}' if serial else 'host:transport-any')
+            self._request(conn, service)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    def shell(self, command, serial=None, timeout=TIMEOUT_ADB_SOCKET_IN_SECOND):
+        """
+        Run a shell command on a phone, the same as "adb -s <serial> shell <command>"
+        :param command: Shell command
+        :param serial: Serial number of the phone, the only attached phone if not given
+        :param timeout: Timeout in seconds of every socket operation
+        :return: String of the output
+        """
+        with self.open_service(f'shell:{command}', serial, timeout) as conn:
+            chunks = []
+            while True:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        return b''.join(chunks).decode('utf-8', errors='replace')
+
+    def version(self):
+        """
+        Version of the adb server protocol
+        :return: Integer
+        """
+        return int(self.host_command('host:version'), 16)
+
+    def devices(self):
+        """
+        Phones known by the adb server, from the tracker if the phones are tracked
+        :return: Dictionary of the state of every phone keyed by serial number, e.g. {"R58M12345": "device"}
+        """
+        with self._devices_lock:
+            if self._devices is not None:
+                return dict(self._devices)
+        return _parse_devices(self.host_command('host:devices'))
+
+    def get_state(self, serial):
+        """
+        State of a phone, see DEVICE_STATE_ONLINE
+        :param serial: Serial number of the phone
+        :return: String, None if the phone is not known by the adb server
+        """
+        return self.devices().get(serial)
+
+    def start_tracking(self):
+        """
+        Track the attached phones in background through one long lived connection, so that devices() and get_state()
+        answer without a round trip to the adb server
+        """
+        if self._tracker and self._tracker.is_alive():
+            return
+        self._stop_tracking.clear()
+        self._tracker = threading.Thread(target=self._track_devices, name='adb-tracker', daemon=True)
+        self._tracker.start()
+
+    def stop_tracking(self):
+        self._stop_tracking.set()
+        conn = self._tracker_conn
+        if conn:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._tracker:
+            self._tracker.join(TIMEOUT_ADB_SOCKET_IN_SECOND)
+        with self._devices_lock:
+            self._devices = None
+
+    def _track_devices(self):
+        while not self._stop_tracking.is_set():
+            try:
+                with self.connect(timeout=None) as conn:
+                    self._tracker_conn = conn
+                    self._request(conn, 'host:track-devices')
+                    # The list of all phones is sent once at first and again whenever a state changes
+                    while True:
+                        devices = _parse_devices(self._read_message(conn))
+                        with self._devices_lock:
+                            self._devices = devices
+            except (AdbError, OSError, subprocess.SubprocessError) as e:
+                if not self._stop_tracking.is_set():
+                    logging.warning(f'[Adb] Tracking phones is interrupted: {e}')
+            finally:
+                self._tracker_conn = None
+                # Not answered from a stale list while reconnecting
+                with self._devices_lock:
+                    self._devices = None
+            self._stop_tracking.wait(SLEEP_TIME_TRACK_DEVICES_RETRY_IN_SECOND)
+
+    def _request(self, conn, request):
+        conn.sendall(_encode_request(request))
+        status = self._read_exactly(conn, 4)
+        if status != b'OKAY':
+            raise AdbError(f'"{request}" failed: {self._read_message(conn)}')
+
+    def _read_message(self, conn):
+        length = int(self._read_exactly(conn, 4), 16)
+        return self._read_exactly(conn, length).decode('utf-8', errors='replace')
+
+    @staticmethod
+    def _read_exactly(conn, size):
+        data = b''
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                raise ConnectionResetError('adb server closed the connection')
+            data += chunk
+        return data
+
+
+# Client of the local adb server shared by the tool
+adb = AdbClient()
+
+
+def get_phone_uuid(serial=None):
+    """
+    Retrieve UUID of connected android phone via adb server
+    :param serial: Serial number of the phone to query, needed when more than one phone is attached
+    :return: String, empty if the phone cannot be queried
+    """
+    try:
+        return adb.shell('getprop ro.serialno', serial).strip()
+    except (AdbError, OSError, subprocess.SubprocessError) as e:
+        logging.warning(f'[Adb] Cannot query the phone {serial or ""}: {e}')
+        return ''
+
+
+def is_phone_attached(serial):
+    """
+    Check if a phone is attached and authorized by the serial the adb server knows it by, which is also the serial of
+    a phone attached over the network ("ip:port") and might differ from its ro.serialno
+    :param serial: Serial number of the phone
+    :return: Boolean, False if the adb server cannot be queried
+    """
+    try:
+        return adb.get_state(serial) == DEVICE_STATE_ONLINE
+    except (AdbError, OSError) as e:
+        logging.warning(f'[Adb] Cannot query the state of the phone {serial}: {e}')
+        return False
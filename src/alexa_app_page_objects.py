@@ -12,35 +12,73 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 
-import re
 import time
 import logging
 
 from selenium.common.exceptions import NoSuchElementException
+from src.device_list_index import DeviceListIndex
+from src.locators import MobileBy, ui_selector
 from src.page_operations import *
-from appium.webdriver.common.mobileby import MobileBy
+from src.phase_steps import run_steps
+from src.session_driver import session_driver
+from src.tracing import traced_methods
 
 """
 Locator for Android Alexa App
-There are main types of selector can be used to find elements, By.XPATH is used here
+There are main types of selector can be used to find elements. Each locator declares the preferred selectors which are
+cheaper on UiAutomator2 (accessibility id and UiSelector), and By.XPATH as the fallback which is also evaluated against
+page snapshots. The selector which actually matched is used first from then on
 Ref: https://github.com/appium/appium-desktop#the-appium-desktop-inspector
 """
-DEVICES_LOCATOR = '//android.widget.LinearLayout[@content-desc="Tab, Devices"]'
-DEVICES_PAGE_TITLE = '//android.view.View[@resource-id="devicePageHeader"]'
-SMART_DEVICE_LOCATOR_TEMP = '//android.widget.TextView[@text="NAME"]'
-SMART_DEVICE_TITLE_LOCATOR_TEMP = '//android.view.View[@text="NAME"]'
-SMART_DEVICE_CONFIG_LOCATOR = '//android.widget.Button[@content-desc="Edit"]'
-SMART_DEVICE_DELETE_LOCATOR = '//android.widget.Button[@content-desc="Delete"]'
-SMART_DEVICE_DELETE_CONFIRM_LOCATOR = '//android.widget.Button[@text="DELETE"]'
-SMART_DEVICE_UNRESPONSIVE = '//android.widget.TextView[@text="Device is unresponsive"]'
-PLUG_DEVICE_POWER_ON_LOCATOR = '//android.widget.Switch[@text="on"]'
-PLUG_DEVICE_POWER_OFF_LOCATOR = '//android.widget.Switch[@text="off"]'
-PLUG_DEVICE_BACK_LOCATOR = '//android.widget.Button[@content-desc="Back"]'
+DEVICES_LOCATOR = ui_selector(
+    'devices_tab', 'new UiSelector().className("android.widget.LinearLayout").description("Tab, Devices")',
+    '//android.widget.LinearLayout[@content-desc="Tab, Devices"]')
+DEVICES_PAGE_TITLE = ui_selector(
+    'devices_page_title', 'new UiSelector().className("android.view.View").resourceId("devicePageHeader")',
+    '//android.view.View[@resource-id="devicePageHeader"]')
+SMART_DEVICE_LOCATOR_TEMP = ui_selector(
+    'smart_device', 'new UiSelector().className("android.widget.TextView").text("NAME")',
+    '//android.widget.TextView[@text="NAME"]')
+SMART_DEVICE_TITLE_LOCATOR_TEMP = ui_selector(
+    'smart_device_title', 'new UiSelector().className("android.view.View").text("NAME")',
+    '//android.view.View[@text="NAME"]')
+SMART_DEVICE_CONFIG_LOCATOR = ui_selector(
+    'smart_device_config', 'new UiSelector().className("android.widget.Button").description("Edit")',
+    '//android.widget.Button[@content-desc="Edit"]')
+SMART_DEVICE_DELETE_LOCATOR = ui_selector(
+    'smart_device_delete', 'new UiSelector().className("android.widget.Button").description("Delete")',
+    '//android.widget.Button[@content-desc="Delete"]')
+SMART_DEVICE_DELETE_CONFIRM_LOCATOR = ui_selector(
+    'smart_device_delete_confirm', 'new UiSelector().className("android.widget.Button").text("DELETE")',
+    '//android.widget.Button[@text="DELETE"]')
+SMART_DEVICE_UNRESPONSIVE = ui_selector(
+    'smart_device_unresponsive', 'new UiSelector().className("android.widget.TextView").text("Device is unresponsive")',
+    '//android.widget.TextView[@text="Device is unresponsive"]')
+PLUG_DEVICE_POWER_ON_LOCATOR = ui_selector(
+    'plug_device_power_on', 'new UiSelector().className("android.widget.Switch").text("on")',
+    '//android.widget.Switch[@text="on"]')
+PLUG_DEVICE_POWER_OFF_LOCATOR = ui_selector(
+    'plug_device_power_off', 'new UiSelector().className("android.widget.Switch").text("off")',
+    '//android.widget.Switch[@text="off"]')
+PLUG_DEVICE_BACK_LOCATOR = ui_selector(
+    'plug_device_back', 'new UiSelector().className("android.widget.Button").description("Back")',
+    '//android.widget.Button[@content-desc="Back"]')
 DEVICE_TYPE_ICONS_Horizontal_ScrollView_CLASS_NAME = 'android.widget.HorizontalScrollView'
 ALL_DEVICES_ScrollView_CLASS_NAME = 'android.widget.ScrollView'
-OK_BUTTON_ON_FST_CARD_LOCATOR = '//android.widget.Button[@resource-id="FullScreenTakeover::PrimaryButton"]'
+OK_BUTTON_ON_FST_CARD_LOCATOR = ui_selector(
+    'ok_button_on_fst_card',
+    'new UiSelector().className("android.widget.Button").resourceId("FullScreenTakeover::PrimaryButton")',
+    '//android.widget.Button[@resource-id="FullScreenTakeover::PrimaryButton"]')
+
+PLUG_STATE_ON = 'on'
+PLUG_STATE_OFF = 'off'
+PLUG_STATE_UNKNOWN = 'unknown'
+DEVICE_HEALTH_RESPONSIVE = 'responsive'
+DEVICE_HEALTH_UNRESPONSIVE = 'unresponsive'
+DEVICE_HEALTH_UNKNOWN = 'unknown'
 
 MAX_SWIPES_OF_SCROLL_TO_END = 5
+MAX_NAVIGATIONS_BACK_TO_TAB_BAR = 3
 
 # Timeouts
 SLEEP_TIME_BEFORE_PROVISIONER_POWER_ON_IN_SECOND = 10
@@ -48,19 +86,23 @@ TIMEOUT_MEDIUM = 10
 TIMEOUT_SMALL = 2
 
 
+@traced_methods('page_object')
 class AlexaAppPageObjects:
     """
     The class is used to define the operations against Alexa App page objects
     """
 
-    def __init__(self, driver, device_names):
+    def __init__(self, driver, device_names, device_list_index=None):
         """
         Initialize the AlexaAppPageObjects object
-        :param driver: WebDriver instance to control application page objects
+        :param driver: WebDriver instance to control application page objects, wrapped by its SessionDriver
         :param device_names: Name of DUT and plugs to control DUT and provisioner
+        :param device_list_index: DeviceListIndex of "Devices" page kept across page objects of the same phone, a new
+        one if not given
         """
-        self.driver = driver
+        self.driver = session_driver(driver)
         self.device_names = device_names
+        self.device_list_index = device_list_index or DeviceListIndex()
         self.smart_plug_of_dut = SMART_DEVICE_LOCATOR_TEMP.replace('NAME', self.device_names[0])
         self.smart_plug_of_provisioner = SMART_DEVICE_LOCATOR_TEMP.replace('NAME', self.device_names[1])
         self.smart_dut = SMART_DEVICE_LOCATOR_TEMP.replace('NAME', self.device_names[2])
@@ -70,28 +112,68 @@ class AlexaAppPageObjects:
         logging.info('[Alexa App] Clicking "Devices" button')
         assert click_element(self.driver, timeout, DEVICES_LOCATOR), 'Cannot click on "Devices" button'
 
+    def get_device_health(self, name_of_device, timeout=TIMEOUT_MEDIUM):
+        """
+        Read the health of the smart device from its page, as soon as the page is loaded
+        :param name_of_device: Name of the smart device whose page is open
+        :param timeout: Timeout in seconds for the page to load
+        :return: String, one of DEVICE_HEALTH_RESPONSIVE, DEVICE_HEALTH_UNRESPONSIVE and DEVICE_HEALTH_UNKNOWN
+        """
+        title = SMART_DEVICE_TITLE_LOCATOR_TEMP.replace('NAME', name_of_device)
+        snapshot = wait_for_page_snapshot(self.driver, timeout, lambda s: s.is_present(title))
+        if snapshot is None:
+            health = DEVICE_HEALTH_UNKNOWN
+        elif snapshot.is_present(SMART_DEVICE_UNRESPONSIVE):
+            health = DEVICE_HEALTH_UNRESPONSIVE
+        else:
+            health = DEVICE_HEALTH_RESPONSIVE
+        logging.info(f'[Alexa App] Smart device "{name_of_device}" is {health}')
+        return health
+
     # DUT might not be responsive, then removing the device from Alexa App might not factory reset it and a hard reset
     # is needed. This is the checking to halt the execution in that case.
     def is_smart_device_responsive(self, timeout=TIMEOUT_MEDIUM):
         logging.info('[Alexa App] Checking "Device is unresponsive" message')
-        if verify_if_element_is_present(self.driver, timeout, self.smart_dut_title):
-            if verify_if_element_is_not_present(self.driver, timeout, SMART_DEVICE_UNRESPONSIVE):
-                return
-        assert False, f'[Alexa App] Smart device "{self.device_names[2]}" not responsive, ' \
-                      f'please do factory reset manually'
+        health = self.get_device_health(self.device_names[2], timeout)
+        if health == DEVICE_HEALTH_UNRESPONSIVE:
+            # The message might be left from the last time the page was loaded
+            snapshot = wait_for_page_snapshot(self.driver, TIMEOUT_SMALL,
+                                              lambda s: not s.is_present(SMART_DEVICE_UNRESPONSIVE))
+            if snapshot:
+                health = DEVICE_HEALTH_RESPONSIVE
+        assert health == DEVICE_HEALTH_RESPONSIVE, f'[Alexa App] Smart device "{self.device_names[2]}" not ' \
+                                                   f'responsive, please do factory reset manually'
+
+    def is_smart_device_online(self, name_of_device, timeout=TIMEOUT_SMALL):
+        logging.info(f'[Alexa App] Checking whether smart device "{name_of_device}" is online')
+        self.click_smart_device_from_devices_page(name_of_device)
+        online = self.get_device_health(name_of_device, timeout) == DEVICE_HEALTH_RESPONSIVE
+        self.click_navigate_back_from_plug_device_page()
+        return online
 
     def is_on_devices_page(self, timeout=TIMEOUT_MEDIUM):
         logging.info('[Alexa App] Checking whether it is on Devices page')
         return verify_if_element_is_present(self.driver, timeout, DEVICES_PAGE_TITLE)
 
-    def click_smart_device_from_devices_page(self, smart_device, timeout=TIMEOUT_MEDIUM):
-        m = re.search('@text="([\\w|\\s]+)"', smart_device)
-        name_of_smart_device = m.group(1)
+    def is_on_smart_device_page(self, name_of_smart_device, timeout=TIMEOUT_MEDIUM):
+        title = SMART_DEVICE_TITLE_LOCATOR_TEMP.replace('NAME', name_of_smart_device)
+        return wait_for_page_snapshot(self.driver, timeout, lambda s: s.is_present(title)) is not None
+
+    def click_smart_device_from_devices_page(self, name_of_smart_device, timeout=TIMEOUT_MEDIUM):
         logging.info(f'[Alexa App] Searching and clicking "{name_of_smart_device}"')
+        position = self.device_list_index.locate(self.driver, name_of_smart_device)
+        if position:
+            self.driver.tap([position])
+            # The list might have scrolled or been re-sorted since it was indexed, then another device is opened
+            if self.is_on_smart_device_page(name_of_smart_device, timeout):
+                return
+            self.device_list_index.invalidate(f'the tile of "{name_of_smart_device}" does not open its page')
+            self.navigate_back_to_tab_bar()
+        # Not found by the index, search the list from the top
         self.driver.find_element(by=MobileBy.ANDROID_UIAUTOMATOR, value=
             'new UiScrollable(new UiSelector().className("' + ALL_DEVICES_ScrollView_CLASS_NAME + '").instance(0))'
             '.scrollIntoView(new UiSelector().text("' + name_of_smart_device + '").instance(0));')
-        assert click_element(self.driver, timeout, smart_device), \
+        assert click_element(self.driver, timeout, SMART_DEVICE_LOCATOR_TEMP.replace('NAME', name_of_smart_device)), \
             f'Cannot click on smart device "{name_of_smart_device}".'
 
     def click_settings_from_smart_device_page(self, timeout=TIMEOUT_MEDIUM):
@@ -106,68 +188,182 @@ class AlexaAppPageObjects:
         logging.info('[Alexa App] Clicking "DELETE" button to confirm')
         assert click_element(self.driver, timeout, SMART_DEVICE_DELETE_CONFIRM_LOCATOR), 'Cannot click "DELETE" button'
 
+    def get_plug_state(self, timeout=TIMEOUT_MEDIUM):
+        """
+        Read the state of the plug from its page, as soon as the power switch is loaded
+        :param timeout: Timeout in seconds for the power switch to load
+        :return: String, one of PLUG_STATE_ON, PLUG_STATE_OFF and PLUG_STATE_UNKNOWN
+        """
+        switches = {PLUG_STATE_ON: PLUG_DEVICE_POWER_ON_LOCATOR, PLUG_STATE_OFF: PLUG_DEVICE_POWER_OFF_LOCATOR}
+        snapshot = wait_for_page_snapshot(self.driver, timeout,
+                                          lambda s: any(s.evaluate(switches.values()).values()))
+        if snapshot is None:
+            return PLUG_STATE_UNKNOWN
+        return next(state for state, locator in switches.items() if snapshot.is_present(locator))
+
     def click_power_off_from_plug_device_page(self, timeout=TIMEOUT_MEDIUM):
         logging.info('[Alexa App] Clicking the power icon to turn it off')
         assert click_element(self.driver, timeout, PLUG_DEVICE_POWER_ON_LOCATOR), 'Cannot click the power icon'
-        assert verify_if_element_is_present(self.driver, timeout, PLUG_DEVICE_POWER_OFF_LOCATOR), \
+        assert wait_for_page_snapshot(self.driver, timeout, lambda s: s.is_present(PLUG_DEVICE_POWER_OFF_LOCATOR)), \
             'Cannot switch to power off'
 
     def click_power_on_from_plug_device_page(self, timeout=TIMEOUT_MEDIUM):
         logging.info('[Alexa App] Clicking the power icon to turn it on')
         assert click_element(self.driver, timeout, PLUG_DEVICE_POWER_OFF_LOCATOR), 'Cannot click the power icon'
-        assert verify_if_element_is_present(self.driver, timeout, PLUG_DEVICE_POWER_ON_LOCATOR), \
+        assert wait_for_page_snapshot(self.driver, timeout, lambda s: s.is_present(PLUG_DEVICE_POWER_ON_LOCATOR)), \
             'Cannot switch to power on'
 
     def is_smart_dut_present(self, timeout=TIMEOUT_SMALL):
+        return self._find_smart_dut(timeout) is not None
+
+    def _find_smart_dut(self, timeout=TIMEOUT_SMALL):
+        """
+        Search smart DUT on "Devices" page, refreshing the page if not found
+        :param timeout: Timeout in seconds for smart DUT to show up after the refresh
+        :return: PageSnapshot where smart DUT is found, None if not found
+        """
         logging.info(f'[Alexa App] Refreshing screen and searching smart device "{self.device_names[2]}"')
-        # Return true is there's a full screen takeover card to notify customer that smart device has been found
-        if verify_if_element_is_present(self.driver, timeout, OK_BUTTON_ON_FST_CARD_LOCATOR):
-            return True
-        else:
+        # Found if there's a full screen takeover card to notify customer that smart device has been found, or
+        # the smart device shows up on Devices page, both are resolved from one snapshot
+        locators = [OK_BUTTON_ON_FST_CARD_LOCATOR, self.smart_dut]
+        snapshot = PageSnapshot.capture(self.driver)
+        if any(snapshot.evaluate(locators).values()):
+            return snapshot
+        # Swipe the screen to refresh Devices page
+        swipe_screen(self.driver, start_x_p=0.50, end_x_p=0.50, start_y_p=0.30, end_y_p=0.70)
+        return wait_for_page_snapshot(self.driver, timeout, lambda s: any(s.evaluate(locators).values()))
+
+    def is_smart_device_listed(self, name_of_device):
+        """
+        Search the whole device list of "Devices" page for the smart device, the list is rescanned as it might have
+        changed since it was indexed
+        :param name_of_device: Name of the smart device
+        :return: Boolean
+        """
+        logging.info(f'[Alexa App] Searching smart device "{name_of_device}" in the device list')
+        self.device_list_index.invalidate(f'searching "{name_of_device}" in the whole list')
+        return self.device_list_index.locate(self.driver, name_of_device) is not None
+
+    def find_smart_devices_present(self, names_of_devices, timeout=TIMEOUT_SMALL):
+        """
+        Refresh "Devices" page and find which of the smart devices show up, all of them resolved from the same
+        snapshots. A full screen takeover card does not tell which device is found, so it is dismissed to see the list
+        :param names_of_devices: Names of the smart devices to search
+        :param timeout: Timeout in seconds for any of them to show up after the refresh
+        :return: List of names of the smart devices found, which are added to the device list index
+        """
+        logging.info(f'[Alexa App] Refreshing screen and searching smart devices {names_of_devices}')
+        locators = {name: SMART_DEVICE_LOCATOR_TEMP.replace('NAME', name) for name in names_of_devices}
+
+        def found_in(snapshot):
+            return [name for name, locator in locators.items() if snapshot.is_present(locator)]
+
+        snapshot = PageSnapshot.capture(self.driver)
+        if snapshot.is_present(OK_BUTTON_ON_FST_CARD_LOCATOR):
+            logging.info('[Alexa App] Dismissing the full screen takeover card')
+            assert click_element(self.driver, timeout, OK_BUTTON_ON_FST_CARD_LOCATOR), \
+                'Cannot click "OK" button on the full screen takeover card'
+            snapshot = PageSnapshot.capture(self.driver)
+        if not found_in(snapshot):
             # Swipe the screen to refresh Devices page
             swipe_screen(self.driver, start_x_p=0.50, end_x_p=0.50, start_y_p=0.30, end_y_p=0.70)
-            return verify_if_element_is_present(self.driver, timeout, self.smart_dut)
+            snapshot = wait_for_page_snapshot(self.driver, timeout, found_in)
+        found = found_in(snapshot) if snapshot else []
+        for name in found:
+            self.device_list_index.add(name, snapshot)
+        return found
 
     def wait_until_smart_dut_present(self, timeout):
+        run_steps(self.wait_until_smart_dut_present_steps(timeout))
+
+    def wait_until_smart_dut_present_steps(self, timeout):
+        """
+        Steps of wait_until_smart_dut_present(), see src/phase_steps.py, every refresh of "Devices" page is a step
+        :param timeout: Timeout in seconds
+        """
         time_start = time.time()
         time_stop = time_start + timeout
         while time.time() < time_stop:
-            if self.is_smart_dut_present():
+            snapshot = self._find_smart_dut()
+            if snapshot:
+                self.device_list_index.add(self.device_names[2], snapshot)
                 return
+            yield 0
         assert False, f'The smart device "{self.device_names[2]}" not found within {timeout/60} minutes'
 
+    def navigate_back_to_tab_bar(self, timeout=TIMEOUT_SMALL):
+        logging.info('[Alexa App] Navigating back to the page with tab bar')
+        for _ in range(MAX_NAVIGATIONS_BACK_TO_TAB_BAR):
+            if verify_if_element_is_present(self.driver, timeout, DEVICES_LOCATOR):
+                return
+            self.driver.back()
+        assert verify_if_element_is_present(self.driver, timeout, DEVICES_LOCATOR), 'Cannot navigate back to tab bar'
+
     def move_to_devices_page(self):
         self.click_devices_from_home_page()
         assert self.is_on_devices_page(), 'Cannot navigate to "Devices" page'
 
     def delete_dut(self):
         # Deregister DUT by deleting it from configuration page
-        self.click_smart_device_from_devices_page(self.smart_dut)
+        self.click_smart_device_from_devices_page(self.device_names[2])
         self.is_smart_device_responsive()
         self.click_settings_from_smart_device_page()
         self.click_delete_from_smart_device_config_page()
         self.click_delete_confirm_from_smart_device_config_page()
+        self.device_list_index.remove(self.device_names[2])
 
-    def power_off_dut(self):
-        self.click_smart_device_from_devices_page(self.smart_plug_of_dut)
-        try:
-            self.click_power_off_from_plug_device_page()
-        except AssertionError:
-            logging.info(f'Plug device "{self.device_names[0]}" is in power off mode')
+    def power_off_plug(self, name_of_plug):
+        self.click_smart_device_from_devices_page(name_of_plug)
+        state = self.get_plug_state()
+        assert state != PLUG_STATE_UNKNOWN, f'Cannot read the state of plug device "{name_of_plug}"'
+        if state == PLUG_STATE_OFF:
+            logging.info(f'Plug device "{name_of_plug}" is in power off mode')
+            return
+        self.click_power_off_from_plug_device_page()
 
-    def power_off_and_on_provisioner(self):
-        self.click_smart_device_from_devices_page(self.smart_plug_of_provisioner)
-        try:
+    def power_off_and_on_plug(self, name_of_plug, off_time=SLEEP_TIME_BEFORE_PROVISIONER_POWER_ON_IN_SECOND,
+                              off_steps=None):
+        run_steps(self.power_off_and_on_plug_steps(name_of_plug, off_time, off_steps))
+
+    def power_off_and_on_plug_steps(self, name_of_plug, off_time=SLEEP_TIME_BEFORE_PROVISIONER_POWER_ON_IN_SECOND,
+                                    off_steps=None):
+        """
+        Steps of power_off_and_on_plug(), see src/phase_steps.py. The plug page is kept open while the plug is off
+        :param name_of_plug: Name of the plug
+        :param off_time: Time in seconds to keep the plug off
+        :param off_steps: Steps keeping the plug off instead of waiting off_time
+        """
+        self.click_smart_device_from_devices_page(name_of_plug)
+        state = self.get_plug_state()
+        assert state != PLUG_STATE_UNKNOWN, f'Cannot read the state of plug device "{name_of_plug}"'
+        if state == PLUG_STATE_OFF:
+            logging.info(f'Plug device "{name_of_plug}" is in power off mode')
+        else:
             self.click_power_off_from_plug_device_page()
-            time.sleep(SLEEP_TIME_BEFORE_PROVISIONER_POWER_ON_IN_SECOND)
-        except AssertionError:
-            logging.info(f'Plug device "{self.device_names[1]}" is in power off mode')
+            if off_steps:
+                yield from off_steps
+            else:
+                yield off_time
         self.click_power_on_from_plug_device_page()
 
-    def power_on_dut(self):
-        self.click_smart_device_from_devices_page(self.smart_plug_of_dut)
+    def power_on_plug(self, name_of_plug):
+        # Unlike powering off, powering on is not a no-op if the plug is on already: the setup time is measured from
+        # the power on, which would never happen for a device left powered
+        self.click_smart_device_from_devices_page(name_of_plug)
+        state = self.get_plug_state()
+        assert state != PLUG_STATE_UNKNOWN, f'Cannot read the state of plug device "{name_of_plug}"'
+        assert state == PLUG_STATE_OFF, f'Plug device "{name_of_plug}" is in power on mode already'
         self.click_power_on_from_plug_device_page()
 
+    def power_off_dut(self):
+        self.power_off_plug(self.device_names[0])
+
+    def power_off_and_on_provisioner(self):
+        self.power_off_and_on_plug(self.device_names[1])
+
+    def power_on_dut(self):
+        self.power_on_plug(self.device_names[0])
+
     def click_navigate_back_from_plug_device_page(self, timeout=TIMEOUT_MEDIUM):
         logging.info('[Alexa App] Clicking the navigate back icon')
         assert click_element(self.driver, timeout, PLUG_DEVICE_BACK_LOCATOR), 'Cannot click the navigate back icon'
@@ -12,26 +12,18 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 
+import json
 import logging
-import subprocess
-import sys
-import time
+import threading
 from contextlib import contextmanager
-from appium.options.android import UiAutomator2Options
-from appium.webdriver import Remote
+from src.appium_server import get_appium_server, stop_appium_servers
+from src.tracing import instrument_driver, tracer
 
-SLEEP_TIME_BEFORE_APPIUM_CLIENT_CONNECT_IN_SECOND = 20
+APPIUM_SERVER_LOG_FILE = 'logs/appium_server_log.txt'
 
-
-def get_phone_uuid():
-    """
-    Retrieve UUID of connected android phone via adb command
-    :return: String
-    """
-    getprop_cmd = f'adb shell getprop ro.serialno'.split()
-    proc = subprocess.Popen(getprop_cmd, stdout=subprocess.PIPE)
-    uuid = proc.communicate()[0].decode("utf-8").strip()
-    return uuid
+# Appium sessions kept alive across connection contexts, keyed by appium server url and desired capabilities
+_session_pool = {}
+_session_pool_lock = threading.Lock()
 
 
 class AppiumConn:
@@ -40,49 +32,60 @@ class AppiumConn:
     """
     port = 4723
 
-    def __init__(self, capabilities):
+    def __init__(self, capabilities, server_port=None, reuse_session=False):
         """
         Initialize the AppiumConn object
         :param capabilities: Desired capabilities of mobile device
+        :param server_port: Port of the local appium server serving this connection, AppiumConn.port if not given
+        :param reuse_session: Keep the session alive after the connection context and reuse it for the next context
+        with the same server and capabilities, instead of starting a new session and cold starting the app every time
         """
         self.caps = capabilities
+        self.server_port = server_port
+        self.reuse_session = reuse_session
+        self.session_reused = False
         self.driver = None
 
     @staticmethod
-    def stop_appium_server():
+    def stop_appium_server(server_port=None):
         """
-        Quit and Kill Appium server process
+        Quit the sessions and stop the appium server processes started by this tool, other node processes on the host
+        are left untouched
+        :param server_port: Port of the appium server to stop, all of them if not given
         """
         try:
-            if sys.platform == 'win32':
-                cleanup_cmd = 'taskkill /f /im node.exe /t'.split()
-            elif sys.platform == 'darwin':
-                cleanup_cmd = 'killall node'.split()
-            elif sys.platform == 'linux':
-                cleanup_cmd = 'killall node'.split()
-            else:
-                cleanup_cmd = ''
-            subprocess.Popen(cleanup_cmd)
-            logging.info(f'Killed Appium Node')
+            AppiumConn.close_sessions(server_port)
+            stop_appium_servers(server_port)
         except Exception as e:
-            logging.exception(f'Failed to Kill Appium Server: {e.args}')
+            logging.exception(f'Failed to stop Appium Server: {e.args}')
             raise
 
     @staticmethod
-    def start_appium_server(server_port):
+    def start_appium_server(server_port, log_file=APPIUM_SERVER_LOG_FILE):
         """
-        Start appium service locally
+        Start appium service locally and wait until it is ready, a warm server on the same port is reused
+        :param server_port: Port for appium server to listen on
+        :param log_file: File to save appium server logs
+        :return: AppiumServer object, None if the port is served by an appium server not started by this tool
         """
-        if sys.platform == 'win32':
-            appium_cmd = 'appium.cmd'
-        else:
-            appium_cmd = 'appium'
-
         AppiumConn.port = server_port
-        start_cmd = f'{appium_cmd} -p {AppiumConn.port} --log logs/appium_server_log.txt'.split()
-        subprocess.Popen(start_cmd)
-        logging.info('Appium Server is up')
-        time.sleep(SLEEP_TIME_BEFORE_APPIUM_CLIENT_CONNECT_IN_SECOND)
+        return get_appium_server(server_port, log_file)
+
+    @staticmethod
+    def close_sessions(server_port=None):
+        """
+        Quit the sessions kept alive for reuse
+        :param server_port: Port of the local appium server whose sessions to quit, all sessions if not given
+        """
+        with _session_pool_lock:
+            keys = [key for key in _session_pool
+                    if server_port is None or key.startswith(f'http://localhost:{server_port}{{')]
+            drivers = [_session_pool.pop(key) for key in keys]
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception as e:
+                logging.debug(f'Failed to quit appium session {driver.session_id}: {type(e).__name__}:{e}')
 
     def start_appium_client(self, ext_appium_server_url):
         """
@@ -91,9 +94,72 @@ class AppiumConn:
         if ext_appium_server_url:
             url = ext_appium_server_url
         else:
-            url = f'http://localhost:{AppiumConn.port}'
-        self.driver = Remote(url, options = UiAutomator2Options().load_capabilities(self.caps))
+            url = f'http://localhost:{self.server_port or AppiumConn.port}'
+        self.driver = None
+        self.session_reused = False
+        if self.reuse_session:
+            session_key = url + json.dumps(self.caps, sort_keys=True)
+            with _session_pool_lock:
+                driver = _session_pool.pop(session_key, None)
+            if driver and self.is_session_healthy(driver):
+                self.driver = driver
+                self.session_reused = True
+                logging.info(f'Appium Client reuses session {driver.session_id}')
+            else:
+                self.driver = self.start_session(url)
+            with _session_pool_lock:
+                _session_pool[session_key] = self.driver
+        else:
+            self.driver = self.start_session(url)
+
+    def start_session(self, url):
+        """
+        Start a new appium session, its commands are traced if tracing is enabled
+        :param url: Url of appium server
+        :return: WebDriver instance
+        """
+        # Imported on the first session, so that commands never starting a session do not pay for the driver stack
+        from appium.options.android import UiAutomator2Options
+        from appium.webdriver import Remote
+        with tracer.span('start_session', 'session', url=url):
+            driver = Remote(url, options = UiAutomator2Options().load_capabilities(self.caps))
         logging.info(f'Appium Client is started')
+        return instrument_driver(driver) if tracer.enabled else driver
+
+    def is_session_healthy(self, driver):
+        """
+        Check if a kept alive session still responds, and bring the app to foreground if it does not show up
+        :param driver: WebDriver instance of the kept alive session
+        :return: Boolean
+        """
+        try:
+            if driver.current_package != self.caps["appPackage"]:
+                driver.activate_app(self.caps["appPackage"])
+            return True
+        except Exception as e:
+            # Besides WebDriverException, a crashed or restarted appium server fails the request by a connection error
+            # of urllib3 or the socket
+            logging.warning(f'Appium session {driver.session_id} is stale and will be reconnected: '
+                            f'{type(e).__name__}:{e}')
+            try:
+                driver.quit()
+            except Exception:
+                pass
+            return False
+
+    def drop_session(self):
+        """
+        Quit the current session and remove it from the kept alive sessions, so that the next context reconnects
+        """
+        with _session_pool_lock:
+            for key in [key for key, driver in _session_pool.items() if driver is self.driver]:
+                del _session_pool[key]
+        try:
+            self.driver.quit()
+        except Exception as e:
+            # The appium server behind the session might be gone
+            logging.debug(f'Failed to quit appium session: {type(e).__name__}:{e}')
+        self.driver = None
 
     @contextmanager
     def appium_conn_context(self, ext_appium_server_url=None):
@@ -105,7 +171,10 @@ class AppiumConn:
             yield self.driver
         except Exception as e:
             logging.error(f'{type(e).__name__}:{e.args}')
+            # The session might be left in a broken state, never reuse it
+            if self.reuse_session and self.driver:
+                self.drop_session()
             raise
         finally:
-            if self.driver:
+            if self.driver and not self.reuse_session:
                 self.driver.quit()
@@ -0,0 +1,278 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+Incremental parser of appium server logs, profiling the latency of every command. A command is the lines between its
+"[HTTP] -->" request and "[HTTP] <--" response, where the response gives the total time spent by appium. With
+timestamps in the log (appium --log-timestamp, given by AppiumServer) the time between proxying a command to
+UiAutomator2 server on the phone and getting its response is the device side time, and the rest is the appium side
+time. The client side time is the round trip measured by the client (see src/tracing.py) minus the total time.
+Commands of one server are expected one at a time, as each bench drives its own server from one session
+"""
+
+import argparse
+import bisect
+import logging
+import os
+import re
+import threading
+from datetime import datetime
+
+from src.stats import percentile
+
+INTERVAL_APPIUM_LOG_POLL_IN_SECOND = 1
+# Upper bounds of the latency histogram buckets, the last bucket holds the rest
+LATENCY_BUCKETS_IN_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+LATENCY_PERCENTILES = [50, 90, 99]
+
+LOG_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S:%f'
+LOG_LINE_PATTERN = re.compile(r'^(?:(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}:\d{3}) - )?(.*)$')
+HTTP_REQUEST_PATTERN = re.compile(r'\[HTTP\] --> (GET|POST|DELETE) (\S+)')
+HTTP_RESPONSE_PATTERN = re.compile(r'\[HTTP\] <-- (GET|POST|DELETE) (\S+) (\d+|-) (\d+(?:\.\d+)?) ms')
+DRIVER_CALL_PATTERN = re.compile(r'Calling AppiumDriver\.(\w+)\(\) with args: \["?([^",\]]*)')
+PROXY_REQUEST_PATTERN = re.compile(r'\[WD Proxy\] Proxying \[')
+PROXY_RESPONSE_PATTERN = re.compile(r'\[WD Proxy\] Got response with status')
+# Segments of a command path which are ids of sessions and elements, e.g. "00000000-0000-0011-ffff-ffff0000001a"
+ID_SEGMENT_PATTERN = re.compile(r'^[0-9a-fA-F-]{8,}$|^\d+$')
+# Commands finding elements are profiled per locator strategy, e.g. "findElement(xpath)"
+FIND_COMMANDS = ['findElement', 'findElements', 'findElementFromElement', 'findElementsFromElement']
+
+
+class CommandLatency:
+    """
+    The class is used to collect the latency of one command and bucket it into a histogram
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.totals = []
+        self.device_times = []
+        self.buckets = [0] * (len(LATENCY_BUCKETS_IN_MS) + 1)
+
+    def add(self, total, device_time=None):
+        """
+        Add one call of the command
+        :param total: Time in ms spent by appium on the command, as reported by its response
+        :param device_time: Time in ms spent by UiAutomator2 server on the phone, None if not known
+        """
+        self.totals.append(total)
+        if device_time is not None:
+            self.device_times.append(min(device_time, total))
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_IN_MS, total)] += 1
+
+    def summary(self):
+        """
+        Statistics of the command
+        :return: Dictionary of count, total time percentiles, mean appium and device side time and histogram
+        """
+        item = {"count": len(self.totals), "sum_ms": sum(self.totals)}
+        for p in LATENCY_PERCENTILES:
+            item[f'p{p}_ms'] = percentile(self.totals, p)
+        item["max_ms"] = max(self.totals) if self.totals else None
+        item["device_ms"] = sum(self.device_times) / len(self.device_times) if self.device_times else None
+        item["appium_ms"] = None
+        if self.device_times and len(self.device_times) == len(self.totals):
+            item["appium_ms"] = sum(self.totals) / len(self.totals) - item["device_ms"]
+        labels = [f'<={bound}' for bound in LATENCY_BUCKETS_IN_MS] + [f'>{LATENCY_BUCKETS_IN_MS[-1]}']
+        item["histogram"] = {label: count for label, count in zip(labels, self.buckets) if count}
+        return item
+
+
+class AppiumLogParser:
+    """
+    The class is used to parse an appium server log incrementally, reading the lines appended since the last poll, and
+    profile the latency of its commands
+    """
+
+    def __init__(self, log_file, from_end=True):
+        """
+        Initialize the AppiumLogParser object
+        :param log_file: Appium server log file
+        :param from_end: Skip the lines already in the file, e.g. the lines of previous rounds of a warm server
+        """
+        self.log_file = log_file
+        self.commands = {}
+        self.unmatched = 0
+        self._offset = os.path.getsize(log_file) if from_end and os.path.exists(log_file) else 0
+        self._inode = os.stat(log_file).st_ino if os.path.exists(log_file) else None
+        self._partial = ''
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def poll(self):
+        """
+        Parse the complete lines appended to the log since the last poll. The log is read from its start again when it
+        is replaced or truncated by a new appium server
+        :return: Num of commands completed by the lines
+        """
+        with self._lock:
+            if not os.path.exists(self.log_file):
+                return 0
+            stat = os.stat(self.log_file)
+            if stat.st_ino != self._inode or stat.st_size < self._offset:
+                self._inode, self._offset, self._partial, self._pending = stat.st_ino, 0, '', []
+            with open(self.log_file, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read()
+            self._offset += len(data)
+            lines = (self._partial + data.decode('utf-8', errors='replace')).split('\n')
+            # The last line is kept until its newline is written
+            self._partial = lines.pop()
+            return len([line for line in lines if self.feed(line)])
+
+    def feed(self, line):
+        """
+        Parse one line of the log
+        :param line: Line without newline
+        :return: Boolean, True if the line completes a command
+        """
+        timestamp, message = LOG_LINE_PATTERN.match(line.rstrip('\r')).groups()
+        time_logged = datetime.strptime(timestamp, LOG_TIMESTAMP_FORMAT).timestamp() if timestamp else None
+        match = HTTP_REQUEST_PATTERN.search(message)
+        if match:
+            self._pending.append({"method": match.group(1), "path": match.group(2), "name": None,
+                                  "device_ms": 0 if time_logged else None, "proxied_at": None})
+            return False
+        match = HTTP_RESPONSE_PATTERN.search(message)
+        if match:
+            return self._complete(match.group(1), match.group(2), float(match.group(4)))
+        if not self._pending:
+            return False
+        command = self._pending[-1]
+        match = DRIVER_CALL_PATTERN.search(message)
+        if match and command["name"] is None:
+            name, first_arg = match.groups()
+            command["name"] = f'{name}({first_arg})' if name in FIND_COMMANDS and first_arg else name
+        elif PROXY_REQUEST_PATTERN.search(message) and time_logged:
+            command["proxied_at"] = time_logged
+        elif PROXY_RESPONSE_PATTERN.search(message) and command["proxied_at"] and command["device_ms"] is not None:
+            command["device_ms"] += (time_logged - command["proxied_at"]) * 1000
+            command["proxied_at"] = None
+        return False
+
+    def _complete(self, method, path, total):
+        for index, command in enumerate(self._pending):
+            if command["method"] == method and command["path"] == path:
+                del self._pending[index]
+                break
+        else:
+            self.unmatched += 1
+            return False
+        name = command["name"] or command_name_of_path(method, path)
+        if name not in self.commands:
+            self.commands[name] = CommandLatency(name)
+        # Commands answered by appium itself, e.g. getting the session, spend no time on the device
+        self.commands[name].add(total, command["device_ms"])
+        return True
+
+    def summary(self):
+        """
+        Statistics of all commands, see CommandLatency.summary()
+        :return: Dictionary keyed by command name, sorted by the total time spent on the command
+        """
+        with self._lock:
+            items = {name: command.summary() for name, command in self.commands.items()}
+        return dict(sorted(items.items(), key=lambda item: -item[1]["sum_ms"]))
+
+
+def command_name_of_path(method, path):
+    """
+    Name of a command from its path when the log does not name it, e.g. "POST element/click"
+    :param method: HTTP method
+    :param path: Path of the command
+    :return: String
+    """
+    segments = [s for s in path.split('?')[0].strip('/').split('/') if s]
+    if segments[:2] == ['wd', 'hub']:
+        segments = segments[2:]
+    segments = [s for s in segments if not ID_SEGMENT_PATTERN.match(s)]
+    if segments[:1] == ['session'] and len(segments) > 1:
+        segments = segments[1:]
+    return f'{method} {"/".join(segments) or "/"}'
+
+
+class AppiumLogTailer:
+    """
+    The class is used to tail an appium server log in the background while rounds run, and log the latency statistics
+    of its commands when stopped
+    """
+
+    def __init__(self, log_file, tag='Appium'):
+        """
+        Initialize the AppiumLogTailer object
+        :param log_file: Appium server log file
+        :param tag: Tag of the logged statistics, e.g. the name of the bench
+        """
+        self.parser = AppiumLogParser(log_file)
+        self.tag = tag
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._tail, name='appium-log-tailer', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Parse the rest of the log and log the latency statistics
+        :return: Statistics of all commands, see AppiumLogParser.summary()
+        """
+        self._stop.set()
+        self._thread.join()
+        self.parser.poll()
+        summary = self.parser.summary()
+        log_command_latency(summary, self.tag)
+        return summary
+
+    def _tail(self):
+        while not self._stop.wait(INTERVAL_APPIUM_LOG_POLL_IN_SECOND):
+            self.parser.poll()
+
+
+def log_command_latency(summary, tag='Appium'):
+    """
+    Log the latency statistics of commands, see AppiumLogParser.summary()
+    """
+    def ms(value):
+        return f'{value:.0f}' if value is not None else 'n/a'
+
+    for name, item in summary.items():
+        logging.info(f'[{tag}] {name}: {item["count"]} calls, total p50/p90/p99/max: {ms(item["p50_ms"])}/'
+                     f'{ms(item["p90_ms"])}/{ms(item["p99_ms"])}/{ms(item["max_ms"])} ms, mean appium/device side: '
+                     f'{ms(item["appium_ms"])}/{ms(item["device_ms"])} ms, histogram: {item["histogram"]}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile the latency of the commands in an appium server log')
+    parser.add_argument('log_file', help='Appium server log file, e.g. logs/appium_server_log.txt')
+    parser.add_argument('--follow', action='store_true', help='Keep tailing the log and log the statistics at Ctrl+C')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+    assert os.path.exists(args.log_file), f'Appium server log "{args.log_file}" does not exist'
+    if args.follow:
+        tailer = AppiumLogTailer(args.log_file).start()
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            tailer.stop()
+    else:
+        log_parser = AppiumLogParser(args.log_file, from_end=False)
+        log_parser.poll()
+        log_command_latency(log_parser.summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+import atexit
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from urllib.error import URLError
+from urllib.request import urlopen
+
+# Timeouts
+TIMEOUT_APPIUM_SERVER_READY_IN_SECOND = 20
+TIMEOUT_APPIUM_SERVER_STOP_IN_SECOND = 10
+INTERVAL_APPIUM_SERVER_STATUS_POLL_IN_SECOND = 0.25
+# Logs of previous appium servers kept as "<log file>.1" (the latest) to "<log file>.N"
+MAX_APPIUM_SERVER_LOG_BACKUPS = 5
+
+# Appium servers started by this process, keyed by port
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def is_appium_server_ready(port, timeout=1):
+    """
+    Check the status endpoint of the appium server on localhost
+    :param port: Port of the appium server
+    :param timeout: Timeout of the status request in seconds
+    :return: Boolean
+    """
+    try:
+        with urlopen(f'http://127.0.0.1:{port}/status', timeout=timeout) as response:
+            status = json.loads(response.read().decode('utf-8'))
+        # Appium 2 reports readiness in the value of status response, older servers only respond once ready
+        return status.get('value', {}).get('ready', True) is not False
+    except (URLError, OSError, ValueError):
+        return False
+
+
+class AppiumServer:
+    """
+    The class is used to define an appium server process started by this tool, tracked by its PID and port
+    """
+
+    def __init__(self, port, log_file):
+        """
+        Initialize the AppiumServer object
+        :param port: Port for appium server to listen on
+        :param log_file: File to save appium server logs
+        """
+        self.port = int(port)
+        self.log_file = log_file
+        self.proc = None
+
+    @property
+    def pid(self):
+        return self.proc.pid if self.proc else None
+
+    def is_running(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self, timeout=TIMEOUT_APPIUM_SERVER_READY_IN_SECOND):
+        """
+        Start appium server process and wait until it is ready to accept sessions
+        :param timeout: Timeout in seconds to wait for the server to be ready
+        """
+        appium_cmd = 'appium.cmd' if sys.platform == 'win32' else 'appium'
+        rotate_log_file(self.log_file)
+        # Timestamps let src/appium_log_parser.py split the time of a command between appium and the phone
+        start_cmd = [appium_cmd, '-p', str(self.port), '--log', self.log_file, '--log-timestamp']
+        self.proc = subprocess.Popen(start_cmd)
+        time_start = time.time()
+        self.wait_until_ready(timeout)
+        logging.info(f'Appium Server (PID {self.pid}) is up on port {self.port} in {time.time() - time_start:.2f} '
+                     f'seconds')
+
+    def wait_until_ready(self, timeout):
+        """
+        Poll the status endpoint until the server is ready, fail if the process exits or timeout
+        :param timeout: Timeout in seconds
+        """
+        time_stop = time.time() + timeout
+        while time.time() < time_stop:
+            assert self.is_running(), f'Appium Server on port {self.port} exited with code {self.proc.returncode}'
+            if is_appium_server_ready(self.port):
+                return
+            time.sleep(INTERVAL_APPIUM_SERVER_STATUS_POLL_IN_SECOND)
+        self.stop()
+        assert False, f'Appium Server on port {self.port} is not ready within {timeout} seconds'
+
+    def stop(self, timeout=TIMEOUT_APPIUM_SERVER_STOP_IN_SECOND):
+        """
+        Shut down this appium server process only, and wait until it exits
+        :param timeout: Timeout in seconds to wait for a graceful exit before killing it
+        """
+        if not self.is_running():
+            return
+        if sys.platform == 'win32':
+            # appium.cmd runs node as a child process, kill the whole process tree
+            subprocess.call(['taskkill', '/f', '/t', '/pid', str(self.pid)], stdout=subprocess.DEVNULL)
+        else:
+            self.proc.terminate()
+        try:
+            self.proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            logging.warning(f'Appium Server (PID {self.pid}) did not exit within {timeout} seconds, killing it')
+            self.proc.kill()
+            self.proc.wait()
+        logging.info(f'Stopped Appium Server (PID {self.pid}) on port {self.port}')
+
+
+def rotate_log_file(log_file, backups=MAX_APPIUM_SERVER_LOG_BACKUPS):
+    """
+    Keep the log of the previous appium server instead of overwriting it by a new server
+    :param log_file: Appium server log file
+    :param backups: Num of previous logs to keep
+    """
+    if not os.path.exists(log_file):
+        return
+    for index in range(backups - 1, 0, -1):
+        if os.path.exists(f'{log_file}.{index}'):
+            os.replace(f'{log_file}.{index}', f'{log_file}.{index + 1}')
+    os.replace(log_file, f'{log_file}.1')
+
+
+def get_appium_server(port, log_file):
+    """
+    Get a ready appium server on the port, a warm server started before is reused
+    :param port: Port of the appium server
+    :param log_file: File to save appium server logs if a new server is started
+    :return: AppiumServer object, None if the port is served by an appium server not started by this tool
+    """
+    port = int(port)
+    with _servers_lock:
+        server = _servers.pop(port, None)
+    if server and server.is_running() and is_appium_server_ready(port):
+        logging.info(f'Appium Server (PID {server.pid}) on port {port} is reused')
+    else:
+        if server:
+            server.stop()
+        if is_appium_server_ready(port):
+            logging.info(f'Appium Server on port {port} is already running and used as it is')
+            return None
+        server = AppiumServer(port, log_file)
+        server.start()
+    with _servers_lock:
+        _servers[port] = server
+    return server
+
+
+def stop_appium_servers(port=None):
+    """
+    Stop appium servers started by this tool
+    :param port: Port of the appium server to stop, all of them if not given
+    """
+    with _servers_lock:
+        ports = [int(port)] if port is not None else list(_servers)
+        for server in [_servers.pop(p) for p in ports if p in _servers]:
+            server.stop()
+
+
+atexit.register(stop_appium_servers)
@@ -0,0 +1,186 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+Artifacts of failed (or sampled) Alexa App contexts: the screenshot, the page source and a logcat window of the phone,
+saved as one zip file per capture named by the round ID. Only the screenshot and page source are fetched from the
+session when the failure is caught, as the failed session is dropped right after. Fetching the logcat window,
+compressing and writing the zip file and rotating old captures are done by a background worker.
+"""
+
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import zipfile
+
+from selenium.common.exceptions import WebDriverException
+from src.adb_client import AdbError, adb
+
+DEFAULT_MAX_ARTIFACTS_IN_MB = 500
+# Logcat of the phone in the window before a capture is saved with it
+LOGCAT_WINDOW_IN_SECOND = 120
+TIMEOUT_LOGCAT_DUMP_IN_SECOND = 10
+# Captures waiting for the worker, new captures are skipped once the queue is full
+MAX_PENDING_CAPTURES = 20
+ARTIFACT_FILE_TEMP = 'ROUND_SEQ_REASON.zip'
+
+
+class Capture:
+    """
+    The class is used to define the artifacts grabbed at a failure or a sample, waiting to be saved by the worker
+    """
+
+    def __init__(self, round_id, reason, serial=None, screenshot=None, page_source=None, error=None):
+        """
+        Initialize the Capture object
+        :param round_id: Id of the round the artifacts belong to
+        :param reason: Reason of the capture, e.g. "failure" or "sample"
+        :param serial: Serial number of the phone to fetch the logcat window from, no logcat if not given
+        :param screenshot: PNG bytes of the screenshot
+        :param page_source: UI hierarchy XML of the page
+        :param error: Exception message of the failure
+        """
+        self.round_id = round_id
+        self.reason = reason
+        self.serial = serial
+        self.screenshot = screenshot
+        self.page_source = page_source
+        self.error = error
+        self.captured_at = time.time()
+
+
+class ArtifactCollector:
+    """
+    The class is used to collect artifacts at failures, or at a sample of passed contexts, and save them in the
+    background to a folder whose disk usage is bounded by removing the oldest captures
+    """
+
+    def __init__(self, folder, max_total_mb=DEFAULT_MAX_ARTIFACTS_IN_MB, sample_rate=0.0,
+                 logcat_window=LOGCAT_WINDOW_IN_SECOND):
+        """
+        Initialize the ArtifactCollector object and start its worker
+        :param folder: Folder to save the artifacts to
+        :param max_total_mb: Max disk usage of the folder in MB, the oldest captures are removed beyond it
+        :param sample_rate: Ratio of passed contexts to capture, between 0 and 1
+        :param logcat_window: Time in seconds of logcat before a capture to save, 0 for no logcat
+        """
+        assert 0 <= sample_rate <= 1, 'Sample rate should be between 0 and 1'
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.max_total_bytes = int(max_total_mb * 1024 * 1024)
+        self.sample_rate = sample_rate
+        self.logcat_window = logcat_window
+        self.saved = 0
+        self.skipped = 0
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(MAX_PENDING_CAPTURES)
+        self._worker = threading.Thread(target=self._work, name='artifact-collector', daemon=True)
+        self._worker.start()
+
+    def should_sample(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def capture(self, driver, round_id, reason='failure', serial=None, error=None):
+        """
+        Grab the screenshot and page source from the session and queue them to be saved with a logcat window. A
+        session which no longer responds only leaves the logcat window
+        :param driver: WebDriver instance of the session, None to save the logcat window only
+        :param round_id: Id of the round the artifacts belong to
+        :param reason: Reason of the capture, e.g. "failure" or "sample"
+        :param serial: Serial number of the phone to fetch the logcat window from
+        :param error: Exception of the failure
+        """
+        error = f'{type(error).__name__}:{error}' if error else None
+        capture = Capture(round_id or 'unknown', reason, serial, error=error)
+        if driver:
+            try:
+                capture.screenshot = driver.get_screenshot_as_png()
+                capture.page_source = driver.page_source
+            except WebDriverException as e:
+                logging.warning(f'[Artifacts] Cannot grab the screenshot or page source: {e.msg}')
+        try:
+            self._queue.put_nowait(capture)
+        except queue.Full:
+            self.skipped += 1
+            logging.warning(f'[Artifacts] Too many captures are pending, the {reason} of round {round_id} is skipped')
+
+    def close(self):
+        """
+        Save the pending captures and stop the worker
+        """
+        self._queue.put(None)
+        self._worker.join()
+        logging.info(f'[Artifacts] {self.saved} captures are saved to "{self.folder}", {self.skipped} skipped')
+
+    def _work(self):
+        while True:
+            capture = self._queue.get()
+            if capture is None:
+                return
+            try:
+                path = self._save(capture)
+                self._rotate()
+                logging.info(f'[Artifacts] The {capture.reason} of round {capture.round_id} is saved to "{path}"')
+            except Exception as e:
+                logging.error(f'[Artifacts] Cannot save the {capture.reason} of round {capture.round_id}: {e}')
+
+    def _save(self, capture):
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        name = ARTIFACT_FILE_TEMP.replace('ROUND', re.sub(r'[^\w.-]', '_', capture.round_id)) \
+            .replace('SEQ', f'{seq:03d}').replace('REASON', capture.reason)
+        path = os.path.join(self.folder, name)
+        temp_path = f'{path}.tmp'
+        with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as f:
+            if capture.screenshot:
+                # PNG is compressed already
+                f.writestr('screenshot.png', capture.screenshot, zipfile.ZIP_STORED)
+            if capture.page_source:
+                f.writestr('page_source.xml', capture.page_source)
+            if capture.serial and self.logcat_window:
+                f.writestr('logcat.txt', self._dump_logcat(capture))
+            f.writestr('capture.txt', f'round: {capture.round_id}\nreason: {capture.reason}\n'
+                                      f'captured_at: {capture.captured_at:.3f}\nerror: {capture.error}\n')
+        os.replace(temp_path, path)
+        self.saved += 1
+        return path
+
+    def _dump_logcat(self, capture):
+        # "-t <epoch>" dumps the lines logged since the time, which is given by "sssss.mmm" with "-v epoch"
+        logcat_cmd = f'logcat -d -v epoch -t {capture.captured_at - self.logcat_window:.3f}'
+        try:
+            return adb.shell(logcat_cmd, capture.serial, TIMEOUT_LOGCAT_DUMP_IN_SECOND)
+        except (AdbError, OSError) as e:
+            return f'Cannot dump logcat: {e}'
+
+    def _rotate(self):
+        files = []
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if name.endswith('.zip') and os.path.isfile(path):
+                files.append((os.path.getmtime(path), os.path.getsize(path), path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_total_bytes:
+                break
+            os.remove(path)
+            total -= size
+            logging.info(f'[Artifacts] "{path}" is removed to keep the artifacts within '
+                         f'{self.max_total_bytes / 1024 / 1024:.0f} MB')
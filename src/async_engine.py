@@ -0,0 +1,187 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+Asyncio engine to drive many benches from one controller process. The steps of the phases (see src/phase_steps.py)
+run in a bounded thread pool, while adb requests (see src/adb_client.py) and the waits between the steps are
+awaitables with deadlines, so the long waits of all benches are overlapped on one event loop without a thread per
+sleep.
+"""
+
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.certification_round import ROUND_PHASES, RoundResult, categorize_failure
+from src.device import is_phase_overridden
+from src.phase_steps import steps_of
+
+# Max num of blocking calls (WebDriver commands, appium server start/stop) running at the same time
+MAX_BLOCKING_WORKERS = 8
+
+
+class Deadline:
+    """
+    The class is used to define a point in time by which an operation has to complete
+    """
+
+    def __init__(self, timeout):
+        """
+        Initialize the Deadline object
+        :param timeout: Time in seconds from now, None for no deadline
+        """
+        self.time_stop = time.monotonic() + timeout if timeout is not None else None
+
+    @property
+    def remaining(self):
+        """
+        Time left in seconds, None if there is no deadline
+        """
+        return max(self.time_stop - time.monotonic(), 0) if self.time_stop is not None else None
+
+
+class AsyncEngine:
+    """
+    The class is used to run blocking calls from coroutines in a bounded thread pool
+    """
+
+    def __init__(self, max_workers=MAX_BLOCKING_WORKERS):
+        """
+        Initialize the AsyncEngine object
+        :param max_workers: Max num of blocking calls running at the same time, the others are queued
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='engine')
+
+    async def run_blocking(self, func, *args, **kwargs):
+        """
+        Run the blocking function in the thread pool. A cancelled call stops being awaited, but the function itself
+        runs to completion in its thread
+        :param func: Function to call
+        :return: Value returned by the function
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def run_in_thread(self, func, *args, **kwargs):
+        """
+        Run a blocking function which may wait for long, e.g. a phase overridden by a device type, in a thread of the
+        event loop instead of the thread pool, so that it does not hold a worker needed by the WebDriver calls
+        :param func: Function to call
+        :return: Value returned by the function
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    async def run_steps(self, steps):
+        """
+        Run the steps of a phase (see src/phase_steps.py), each step in the thread pool and the waits between them on
+        the event loop. Steps cancelled, e.g. by the deadline of the round, are closed in the thread pool once the
+        running step completes, so that their sessions and detectors are cleaned up
+        :param steps: Generator of the steps
+        :return: Value returned by the generator
+        """
+        future = None
+        try:
+            while True:
+                future = self.executor.submit(_resume_steps, steps)
+                done, value = await asyncio.wrap_future(future)
+                if done:
+                    return value
+                await asyncio.sleep(value)
+        except BaseException:
+            if future:
+                future.add_done_callback(lambda _: self.executor.submit(_close_steps, steps))
+            raise
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+def _resume_steps(steps):
+    try:
+        return False, next(steps)
+    except StopIteration as e:
+        return True, e.value
+
+
+def _close_steps(steps):
+    try:
+        steps.close()
+    except Exception as e:
+        logging.warning(f'[Engine] Cannot clean up the cancelled steps: {e}')
+
+
+class AsyncDevice:
+    """
+    The class is used to run the phases of a Device as coroutines. The steps of a phase (see src/phase_steps.py) run
+    in the thread pool of the engine, while the waits between them (provisioner boot, plug off time and refreshes of
+    Alexa App) are awaited on the event loop. A phase overridden by a device type may wait in any way, so it runs as a
+    whole in a thread of its own
+    """
+
+    def __init__(self, device, engine):
+        """
+        Initialize the AsyncDevice object
+        :param device: Device instance of the bench
+        :param engine: AsyncEngine to run blocking calls
+        """
+        self.device = device
+        self.engine = engine
+
+    async def factory_reset_and_power_off(self):
+        await self._run_phase('factory_reset_and_power_off',
+                              lambda: steps_of(self.device.factory_reset_and_power_off))
+
+    async def power_cycle_provisioner(self):
+        await self._run_phase('power_cycle_provisioner', self.device.power_cycle_provisioner_steps)
+
+    async def power_on_and_check_setup(self):
+        return await self._run_phase('power_on_and_check_setup', self.device.power_on_and_check_setup_steps)
+
+    async def _run_phase(self, phase, get_steps):
+        if is_phase_overridden(self.device, phase):
+            return await self.engine.run_in_thread(getattr(self.device, phase))
+        return await self.engine.run_steps(get_steps())
+
+
+async def run_round_async(async_device, result=None, timeout=None):
+    """
+    Run one round of the certification flow as a coroutine, see run_round()
+    :param async_device: AsyncDevice of the bench under test
+    :param result: RoundResult to record the round into, a new one if not given
+    :param timeout: Deadline of the whole round in seconds, no deadline if not given
+    :return: RoundResult
+    """
+    result = result or RoundResult()
+    async_device.device.round_id = result.round_id
+    deadline = Deadline(timeout)
+    name_of_dut = async_device.device.names[2]
+    for phase, banner in ROUND_PHASES:
+        logging.info(banner.replace('NAME', name_of_dut))
+        time_start = time.monotonic()
+        try:
+            value = await asyncio.wait_for(getattr(async_device, phase)(), deadline.remaining)
+        except Exception as e:
+            result.failed_phase = phase
+            result.failure_category = categorize_failure(e)
+            result.error = f'{type(e).__name__}:{e}'
+            raise
+        finally:
+            result.phase_timings[phase] = time.monotonic() - time_start
+        if phase == 'power_cycle_provisioner':
+            result.provisioner_boot_time = async_device.device.provisioner_boot_time
+        elif phase == 'power_on_and_check_setup':
+            result.setup_time = value
+    result.passed = True
+    return result
@@ -0,0 +1,212 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+Batch rounds certifying several DUTs of the same FFS type behind one provisioner/commissioner. The provisioner is
+power cycled once per round and one discovery loop watches Alexa App for all DUTs, so that one round measures the
+setup time of every DUT
+"""
+
+import logging
+import time
+
+from src.alexa_app_page_objects import AlexaAppPageObjects
+from src.certification_round import ROUND_PHASES, RoundResult, categorize_failure
+from src.device import SLEEP_TIME_WAIT_FOR_SMART_DUT_PRESENT_IN_SECOND, is_phase_overridden
+from src.phase_steps import run_steps, steps_of
+from src.tracing import tracer
+
+# How DUTs of a batch are powered on, all at once before the discovery, or one after the previous one is discovered
+POWER_ON_TOGETHER = 'together'
+POWER_ON_SEQUENTIAL = 'sequential'
+POWER_ON_MODES = [POWER_ON_TOGETHER, POWER_ON_SEQUENTIAL]
+
+
+class BatchDut:
+    """
+    The class is used to define one DUT of a batch and the plug powering it
+    """
+
+    def __init__(self, name_of_plug, name_of_dut):
+        """
+        Initialize the BatchDut object
+        :param name_of_plug: Name of the smart plug (displayed on Alexa App) to power on and off DUT
+        :param name_of_dut: Name of DUT displayed on Alexa App after the setup
+        """
+        self.name_of_plug = name_of_plug
+        self.name_of_dut = name_of_dut
+
+
+def load_batch_duts(entries):
+    """
+    Load the DUTs of a batch from the "duts" field of a bench as below
+    [{"name_of_plug_to_control_dut": "First plug", "name_of_dut": "First switch"},
+     {"name_of_plug_to_control_dut": "Third plug", "name_of_dut": "Second switch"}, ...]
+    :param entries: List of DUT dictionaries
+    :return: List of BatchDut
+    """
+    assert entries, 'No DUT is listed in the batch'
+    duts = []
+    for index, entry in enumerate(entries):
+        missing = [field for field in ['name_of_plug_to_control_dut', 'name_of_dut'] if field not in entry]
+        assert not missing, f'DUT #{index} of the batch misses field(s) {missing}'
+        duts.append(BatchDut(entry["name_of_plug_to_control_dut"], entry["name_of_dut"]))
+    for field in ['name_of_plug', 'name_of_dut']:
+        names = [getattr(dut, field) for dut in duts]
+        assert len(set(names)) == len(names), f'The same {field} is listed more than once in the batch: {names}'
+    return duts
+
+
+class BatchRound:
+    """
+    The class is used to run one round of the certification flow on several DUTs at once, with one provisioner power
+    cycle and one appium session. Every DUT has its own RoundResult, where the setup time is measured from the power
+    on of its own plug until it shows up on Alexa App.
+    With POWER_ON_TOGETHER, Alexa App is only searched once all DUTs are powered on, so a DUT powered on early can
+    be set up before the search starts, and its setup time is then measured up to the time taken to power on the DUTs
+    after it. The delay is stored as discovery_delay of the RoundResult of every DUT, a setup time close to it is
+    overestimated, see POWER_ON_SEQUENTIAL for an unbiased measurement
+    """
+
+    def __init__(self, device, duts, power_on=POWER_ON_TOGETHER, round_index=1):
+        """
+        Initialize the BatchRound object
+        :param device: Device instance of the bench, which provides the provisioner, the phone and the power controller
+        :param duts: List of BatchDut
+        :param power_on: One of POWER_ON_MODES
+        :param round_index: Index of the round, starting from 1
+        """
+        for phase, _ in ROUND_PHASES[1:]:
+            assert not is_phase_overridden(device, phase), \
+                f'{type(device).__name__} overrides {phase}(), which cannot be run in batch'
+        assert power_on in POWER_ON_MODES, f'Unknown power on mode "{power_on}", one of {POWER_ON_MODES}'
+        self.device = device
+        self.duts = duts
+        self.power_on = power_on
+        self.results = [RoundResult(round_index, dut.name_of_dut) for dut in duts]
+        self._results = {dut.name_of_dut: result for dut, result in zip(duts, self.results)}
+
+    def run(self):
+        """
+        Run the round as below
+        1. Power cycle the provisioner/commissioner once
+        2. Power on the DUTs together or in sequence, and wait for all of them by one discovery loop
+        3. Deregister the DUTs found and power off all DUTs
+        A DUT not found only fails its own result, while a failure of a phase fails the DUTs not failed yet
+        :return: List of RoundResult in the order of DUTs
+        :raise Exception: The exception of the failed phase
+        """
+        return run_steps(self.steps())
+
+    def steps(self):
+        """
+        Steps of run(), see src/phase_steps.py
+        """
+        # The artifacts of a batch are linked to the round of its first DUT
+        self.device.round_id = self.results[0].round_id
+        with tracer.span('round', 'round', round_index=self.results[0].round_index,
+                         name_of_dut=', '.join(dut.name_of_dut for dut in self.duts)):
+            if is_phase_overridden(self.device, 'power_cycle_provisioner'):
+                provisioner_steps = steps_of(self.device.power_cycle_provisioner)
+            else:
+                provisioner_steps = self.device.power_cycle_provisioner_steps()
+            yield from self._phase_steps('power_cycle_provisioner', provisioner_steps)
+            for result in self.results:
+                result.provisioner_boot_time = self.device.provisioner_boot_time
+            yield from self._phase_steps('power_on_and_check_setup', self.power_on_and_check_setup_steps())
+            yield from self._phase_steps('factory_reset_and_power_off', steps_of(self.factory_reset_and_power_off))
+        for result in self.results:
+            result.passed = result.failed_phase is None
+        return self.results
+
+    def power_on_and_check_setup_steps(self):
+        with self.device.alexa_app_pages_context() as alexa_pages:
+            power_controller = self.device.get_power_controller(alexa_pages)
+            groups = [self.duts] if self.power_on == POWER_ON_TOGETHER else [[dut] for dut in self.duts]
+            for group in groups:
+                times_power_on = {}
+                for dut in group:
+                    power_controller.power_on(dut.name_of_plug)
+                    times_power_on[dut.name_of_dut] = time.time()
+                    power_controller.return_to_devices_page()
+                time_discovery = time.time()
+                for name_of_dut, time_power_on in times_power_on.items():
+                    self._results[name_of_dut].discovery_delay = time_discovery - time_power_on
+                yield from self.wait_until_smart_duts_present_steps(alexa_pages, times_power_on)
+
+    def wait_until_smart_duts_present_steps(self, alexa_pages, times_power_on):
+        """
+        Search all DUTs not found yet on every refresh of "Devices" page, until all of them are found or timed out.
+        Every refresh is a step, see src/phase_steps.py
+        :param alexa_pages: AlexaAppPageObjects instance on "Devices" page
+        :param times_power_on: Dictionary of the times when DUTs were powered on keyed by the name of DUT
+        """
+        pending = dict(times_power_on)
+        while pending:
+            found = alexa_pages.find_smart_devices_present(list(pending))
+            time_found = time.time()
+            for name_of_dut in found:
+                setup_time = time_found - pending.pop(name_of_dut)
+                self._results[name_of_dut].setup_time = setup_time
+                logging.info(f'The setup time of smart device "{name_of_dut}" is {setup_time:.3f} seconds')
+            for name_of_dut, time_power_on in list(pending.items()):
+                if time_found - time_power_on >= SLEEP_TIME_WAIT_FOR_SMART_DUT_PRESENT_IN_SECOND:
+                    del pending[name_of_dut]
+                    self._fail(name_of_dut, 'power_on_and_check_setup', AssertionError(
+                        f'The smart device "{name_of_dut}" not found within '
+                        f'{SLEEP_TIME_WAIT_FOR_SMART_DUT_PRESENT_IN_SECOND / 60} minutes'))
+            if pending:
+                yield 0
+
+    def factory_reset_and_power_off(self):
+        with self.device.alexa_app_pages_context() as alexa_pages:
+            for dut in self.duts:
+                if self._results[dut.name_of_dut].setup_time is None:
+                    # DUT was not set up, so there is nothing to deregister
+                    continue
+                pages = AlexaAppPageObjects(alexa_pages.driver, [dut.name_of_plug, self.device.names[1],
+                                                                 dut.name_of_dut], self.device.device_list_index)
+                try:
+                    pages.delete_dut()
+                except AssertionError as e:
+                    self._fail(dut.name_of_dut, 'factory_reset_and_power_off', e)
+                    alexa_pages.navigate_back_to_tab_bar()
+                    alexa_pages.move_to_devices_page()
+            power_controller = self.device.get_power_controller(alexa_pages)
+            for dut in self.duts:
+                power_controller.power_off(dut.name_of_plug)
+
+    def _phase_steps(self, phase, steps):
+        banner = dict(ROUND_PHASES)[phase]
+        logging.info(banner.replace('NAME', ', '.join(dut.name_of_dut for dut in self.duts)))
+        time_start = time.monotonic()
+        try:
+            with tracer.span(phase, 'phase'):
+                yield from steps
+        except Exception as e:
+            for dut in self.duts:
+                self._fail(dut.name_of_dut, phase, e)
+            raise
+        finally:
+            for result in self.results:
+                result.phase_timings[phase] = time.monotonic() - time_start
+
+    def _fail(self, name_of_dut, phase, exception):
+        result = self._results[name_of_dut]
+        if result.failed_phase is not None:
+            return
+        logging.error(f'Smart device "{name_of_dut}" failed in phase {phase}: {exception}')
+        result.failed_phase = phase
+        result.failure_category = categorize_failure(exception)
+        result.error = f'{type(exception).__name__}:{exception}'
@@ -0,0 +1,397 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.adb_client import is_phone_attached
+from src.appium_conn import AppiumConn
+from src.appium_log_parser import AppiumLogTailer
+from src.artifacts import DEFAULT_MAX_ARTIFACTS_IN_MB, ArtifactCollector
+from src.async_engine import MAX_BLOCKING_WORKERS, AsyncDevice, AsyncEngine, run_round_async
+from src.batch_round import POWER_ON_MODES, POWER_ON_TOGETHER, BatchRound, load_batch_duts
+from src.certification_round import RoundResult, run_round
+from src.devices.device_types import DEVICE_TYPES
+from src.locators import log_locator_stats
+from src.phase_steps import run_steps
+from src.session_driver import log_round_trip_stats
+from src.tracing import tracer
+from src.power_controller import load_power_controller
+from src.readiness import get_provisioner_probes
+from src.results_store import ResultsStore
+
+# Default values of the optional bench inventory fields, the same as pytest options from conftest.py
+BENCH_DEFAULTS = {
+    "ffs_type": "MSS",
+    "name_of_plug_to_control_dut": "First plug",
+    "name_of_plug_to_control_provisioner": "Second plug",
+    "system_port": None,
+    "logcat_discovery_pattern": None,
+    "power_controller_config": None,
+    "provisioner_host": None,
+    "provisioner_probe_port": None,
+    "probe_provisioner_on_alexa_app": False,
+    "firmware_tag": None,
+    "duts": None,
+    "power_on_duts": POWER_ON_TOGETHER
+}
+BENCH_REQUIRED_FIELDS = ["phone_serial", "appium_server_port", "name_of_dut"]
+APPIUM_SERVER_LOG_FILE_TEMP = 'logs/appium_server_log_PORT.txt'
+
+
+def load_bench_inventory(inventory_file):
+    """
+    Load bench inventory from a json file which holds a list of benches as below
+    [{"name": "bench-1", "phone_serial": "R58M12345", "appium_server_port": 4723, "system_port": 8200,
+      "ffs_type": "MSS", "name_of_plug_to_control_dut": "First plug",
+      "name_of_plug_to_control_provisioner": "Second plug", "name_of_dut": "First switch"}, ...]
+    A bench can list several DUTs of the same FFS type behind its provisioner instead of one, which run as a batch
+    sharing one provisioner power cycle per round, see load_batch_duts()
+    {"name": "bench-2", "phone_serial": "R58M67890", "appium_server_port": 4733, "power_on_duts": "together",
+     "duts": [{"name_of_plug_to_control_dut": "First plug", "name_of_dut": "First switch"}, ...]}
+    :param inventory_file: Path of the bench inventory file
+    :return: List of bench dictionaries with defaults filled in
+    """
+    with open(inventory_file) as f:
+        inventory = json.load(f)
+    benches = []
+    ports = set()
+    for index, entry in enumerate(inventory):
+        required_fields = [f for f in BENCH_REQUIRED_FIELDS if not ("duts" in entry and f == "name_of_dut")]
+        missing = [field for field in required_fields if field not in entry]
+        assert not missing, f'Bench #{index} in "{inventory_file}" misses field(s) {missing}'
+        bench = dict(BENCH_DEFAULTS, **entry)
+        bench.setdefault("name", f'bench-{index + 1}')
+        if bench["duts"]:
+            bench["duts"] = load_batch_duts(bench["duts"])
+            # The first DUT of the batch stands for the bench wherever one DUT is expected
+            bench["name_of_plug_to_control_dut"] = bench["duts"][0].name_of_plug
+            bench["name_of_dut"] = bench["duts"][0].name_of_dut
+            assert bench["power_on_duts"] in POWER_ON_MODES, \
+                f'Unknown power_on_duts "{bench["power_on_duts"]}" of {bench["name"]}, one of {POWER_ON_MODES}'
+        assert bench["ffs_type"].lower() in DEVICE_TYPES, f'Unknown FFS type "{bench["ffs_type"]}" of {bench["name"]}'
+        assert bench["appium_server_port"] not in ports, \
+            f'Appium server port {bench["appium_server_port"]} of {bench["name"]} is used by another bench'
+        ports.add(bench["appium_server_port"])
+        benches.append(bench)
+    return benches
+
+
+class BenchScheduler:
+    """
+    The class is used to run certification rounds on several benches (phone, plugs, provisioner and DUT) at once,
+    every bench has its own appium server, session and Device pipeline running in a worker pool
+    """
+
+    def __init__(self, benches, rounds=1, max_workers=None, stop_on_failure=False, reuse_session=False,
+                 results_store=None, firmware_tag=None, artifact_collector=None, profile_appium_log=False):
+        """
+        Initialize the BenchScheduler object
+        :param benches: List of bench dictionaries, see load_bench_inventory()
+        :param rounds: Num of rounds to run on each bench
+        :param max_workers: Max num of benches running at the same time, all benches if not given
+        :param stop_on_failure: Stop the rounds of a bench once one of them failed
+        :param reuse_session: Keep one appium session alive per bench for all phases and rounds
+        :param results_store: ResultsStore to store every round to
+        :param firmware_tag: Firmware version of DUTs of the benches which do not tag their own
+        :param artifact_collector: ArtifactCollector shared by the benches to capture failed Alexa App operations
+        :param profile_appium_log: Tail the appium server log of every bench and log the latency of its commands
+        """
+        self.benches = benches
+        self.rounds = rounds
+        self.max_workers = max_workers or len(benches)
+        self.stop_on_failure = stop_on_failure
+        self.reuse_session = reuse_session
+        self.results_store = results_store
+        self.firmware_tag = firmware_tag
+        self.artifact_collector = artifact_collector
+        self.profile_appium_log = profile_appium_log
+        self.results = []
+        self._lock = threading.Lock()
+
+    def run(self):
+        """
+        Run all benches in the worker pool and wait for them to complete
+        :return: Summary of the results, see summarize()
+        """
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for future in [executor.submit(self.run_bench, bench) for bench in self.benches]:
+                    future.result()
+        finally:
+            AppiumConn.stop_appium_server()
+        return summarize(self.results)
+
+    def run_bench(self, bench):
+        """
+        Run all rounds of one bench in the current worker
+        :param bench: Bench dictionary
+        """
+        threading.current_thread().name = bench["name"]
+        if not is_phone_attached(bench["phone_serial"]):
+            self._add_phone_not_attached(bench)
+            return
+        device = self.create_device(bench)
+        port = bench["appium_server_port"]
+        # The appium server of the bench is kept warm for all its rounds
+        log_file = APPIUM_SERVER_LOG_FILE_TEMP.replace('PORT', str(port))
+        AppiumConn.start_appium_server(port, log_file)
+        log_tailer = AppiumLogTailer(log_file, bench["name"]).start() if self.profile_appium_log else None
+        try:
+            for round_index in range(1, self.rounds + 1):
+                logging.info(f'========== {bench["name"]}: round {round_index} of {self.rounds} ==========')
+                if bench["duts"]:
+                    passed = self.run_batch_round(bench, device, round_index)
+                else:
+                    result = RoundResult(round_index)
+                    try:
+                        run_round(device, result)
+                    except Exception:
+                        logging.exception(f'{bench["name"]}: round {round_index} failed')
+                    finally:
+                        self._add_result(bench, result)
+                    passed = result.passed
+                if not passed and self.stop_on_failure:
+                    return
+        finally:
+            if log_tailer:
+                log_tailer.stop()
+            AppiumConn.stop_appium_server(port)
+
+    def run_batch_round(self, bench, device, round_index):
+        """
+        Run one round on all DUTs of the bench as a batch, see BatchRound
+        :param bench: Bench dictionary listing its DUTs
+        :param device: Device of the bench
+        :param round_index: Index of the round
+        :return: Boolean, True if all DUTs passed
+        """
+        return run_steps(self.batch_round_steps(bench, device, round_index))
+
+    def batch_round_steps(self, bench, device, round_index):
+        """
+        Steps of run_batch_round(), see src/phase_steps.py
+        """
+        batch = BatchRound(device, bench["duts"], bench["power_on_duts"], round_index)
+        try:
+            yield from batch.steps()
+        except Exception:
+            logging.exception(f'{bench["name"]}: round {round_index} failed')
+        finally:
+            for result in batch.results:
+                self._add_result(bench, result)
+        return all(result.passed for result in batch.results)
+
+    def run_async(self, max_blocking_workers=MAX_BLOCKING_WORKERS):
+        """
+        Run all benches as coroutines on one event loop and wait for them to complete
+        :param max_blocking_workers: Max num of blocking WebDriver calls of all benches running at the same time
+        :return: Summary of the results, see summarize()
+        """
+        async def run_benches():
+            engine = AsyncEngine(max_blocking_workers)
+            semaphore = asyncio.Semaphore(self.max_workers)
+            try:
+                await asyncio.gather(*[self.run_bench_async(engine, semaphore, bench) for bench in self.benches])
+            finally:
+                await engine.run_blocking(AppiumConn.stop_appium_server)
+                engine.shutdown()
+        asyncio.run(run_benches())
+        return summarize(self.results)
+
+    async def run_bench_async(self, engine, semaphore, bench):
+        """
+        Run all rounds of one bench as a coroutine
+        :param engine: AsyncEngine to run blocking calls
+        :param semaphore: Semaphore limiting the benches running at the same time
+        :param bench: Bench dictionary
+        """
+        async with semaphore:
+            if not await engine.run_blocking(is_phone_attached, bench["phone_serial"]):
+                self._add_phone_not_attached(bench)
+                return
+            device = await engine.run_blocking(self.create_device, bench)
+            port = bench["appium_server_port"]
+            log_file = APPIUM_SERVER_LOG_FILE_TEMP.replace('PORT', str(port))
+            await engine.run_blocking(AppiumConn.start_appium_server, port, log_file)
+            log_tailer = AppiumLogTailer(log_file, bench["name"]).start() if self.profile_appium_log else None
+            try:
+                for round_index in range(1, self.rounds + 1):
+                    logging.info(f'========== {bench["name"]}: round {round_index} of {self.rounds} ==========')
+                    if bench["duts"]:
+                        passed = await engine.run_steps(self.batch_round_steps(bench, device, round_index))
+                    else:
+                        result = RoundResult(round_index)
+                        try:
+                            await run_round_async(AsyncDevice(device, engine), result)
+                        except Exception:
+                            logging.exception(f'{bench["name"]}: round {round_index} failed')
+                        finally:
+                            self._add_result(bench, result)
+                        passed = result.passed
+                    if not passed and self.stop_on_failure:
+                        return
+            finally:
+                if log_tailer:
+                    await engine.run_blocking(log_tailer.stop)
+                await engine.run_blocking(AppiumConn.stop_appium_server, port)
+
+    def create_device(self, bench):
+        """
+        Create the Device of the bench
+        :param bench: Bench dictionary
+        :return: Device
+        """
+        names = [bench["name_of_plug_to_control_dut"], bench["name_of_plug_to_control_provisioner"],
+                 bench["name_of_dut"]]
+        device = DEVICE_TYPES[bench["ffs_type"].lower()](names, udid=bench["phone_serial"],
+                                                         server_port=bench["appium_server_port"],
+                                                         system_port=bench["system_port"],
+                                                         reuse_session=self.reuse_session,
+                                                         logcat_patterns=bench["logcat_discovery_pattern"],
+                                                         power_controller=load_power_controller(
+                                                             bench["power_controller_config"]))
+        device.provisioner_probes = get_provisioner_probes(device, bench["provisioner_host"],
+                                                           bench["provisioner_probe_port"],
+                                                           bench["probe_provisioner_on_alexa_app"])
+        device.artifact_collector = self.artifact_collector
+        return device
+
+    def _add_phone_not_attached(self, bench):
+        logging.error(f'Phone "{bench["phone_serial"]}" of {bench["name"]} is not attached')
+        result = RoundResult(0)
+        result.error = 'Phone is not attached'
+        self._add_result(bench, result)
+
+    def _add_result(self, bench, result):
+        if self.results_store:
+            self.results_store.add(result, bench["name"], bench["ffs_type"], bench["firmware_tag"] or self.firmware_tag,
+                                   bench["name_of_dut"])
+        with self._lock:
+            self.results.append({
+                "bench": bench["name"],
+                "round": result.round_index,
+                "name_of_dut": result.name_of_dut or bench["name_of_dut"],
+                "passed": result.passed,
+                "setup_time": result.setup_time,
+                "discovery_delay": result.discovery_delay,
+                "provisioner_boot_time": result.provisioner_boot_time,
+                "phase_timings": result.phase_timings,
+                "error": result.error,
+                "finished_at": time.time()
+            })
+
+
+def summarize(results):
+    """
+    Aggregate results of all rounds per bench and for all benches
+    :param results: List of round results collected by BenchScheduler
+    :return: Dictionary of summaries keyed by bench name, "all" for all benches, and "<bench>/<DUT>" for every DUT of
+    a bench running batches
+    """
+    groups = {"all": results}
+    for result in results:
+        groups.setdefault(result["bench"], []).append(result)
+    for result in results:
+        if len({r["name_of_dut"] for r in groups[result["bench"]]}) > 1:
+            groups.setdefault(f'{result["bench"]}/{result["name_of_dut"]}', []).append(result)
+    summary = {}
+    for name, group in groups.items():
+        setup_times = [r["setup_time"] for r in group if r["passed"] and r["setup_time"] is not None]
+        summary[name] = {
+            "rounds": len(group),
+            "passed": len([r for r in group if r["passed"]]),
+            "failed": len([r for r in group if not r["passed"]]),
+            "min_setup_time": min(setup_times) if setup_times else None,
+            "avg_setup_time": sum(setup_times) / len(setup_times) if setup_times else None,
+            "max_setup_time": max(setup_times) if setup_times else None
+        }
+    return summary
+
+
+def log_summary(summary):
+    """
+    Log the summary of benches, see summarize()
+    """
+    for name, item in summary.items():
+        setup_times = 'n/a'
+        if item["avg_setup_time"] is not None:
+            setup_times = f'{item["min_setup_time"]:.2f}/{item["avg_setup_time"]:.2f}/{item["max_setup_time"]:.2f}'
+        logging.info(f'[{name}] rounds: {item["rounds"]}, passed: {item["passed"]}, failed: {item["failed"]}, '
+                     f'setup time min/avg/max: {setup_times} seconds')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run certification rounds on several benches in parallel')
+    parser.add_argument('--bench_inventory', required=True, help='Json file listing the benches to run')
+    parser.add_argument('--rounds', type=int, default=1, help='Num of rounds to run on each bench')
+    parser.add_argument('--max_workers', type=int, help='Max num of benches running at the same time')
+    parser.add_argument('-x', '--stop_on_failure', action='store_true',
+                        help='Stop the rounds of a bench once one of them failed')
+    parser.add_argument('--reuse_appium_session', action='store_true',
+                        help='Keep one appium session alive per bench for all phases and rounds')
+    parser.add_argument('--trace_dir', help='Folder to export the timeline of all benches to')
+    parser.add_argument('--results_db', help='SQLite database file to store every round to')
+    parser.add_argument('--firmware_tag', help='Firmware version of DUTs to store with their rounds, unless a bench '
+                                               'gives its own "firmware_tag"')
+    parser.add_argument('--artifact_dir', help='Folder to save the screenshot, page source and logcat window of '
+                                               'failed Alexa App operations of all benches to')
+    parser.add_argument('--artifact_max_mb', type=float, default=DEFAULT_MAX_ARTIFACTS_IN_MB,
+                        help='Max disk usage of --artifact_dir in MB, the oldest artifacts are removed beyond it')
+    parser.add_argument('--artifact_sample_rate', type=float, default=0,
+                        help='Ratio of passed Alexa App operations to save the artifacts of as well')
+    parser.add_argument('--profile_appium_log', action='store_true',
+                        help='Tail the appium server log of every bench and log the latency of its commands')
+    parser.add_argument('--async_engine', action='store_true',
+                        help='Run all benches as coroutines on one event loop instead of one thread per bench')
+    parser.add_argument('--max_blocking_workers', type=int, default=MAX_BLOCKING_WORKERS,
+                        help='Max num of blocking WebDriver calls running at the same time with --async_engine')
+    args = parser.parse_args()
+    os.makedirs('logs', exist_ok=True)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s [%(threadName)s] %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+
+    if args.trace_dir:
+        tracer.enable()
+    results_store = ResultsStore(args.results_db) if args.results_db else None
+    artifact_collector = ArtifactCollector(args.artifact_dir, args.artifact_max_mb, args.artifact_sample_rate) \
+        if args.artifact_dir else None
+    scheduler = BenchScheduler(load_bench_inventory(args.bench_inventory), args.rounds, args.max_workers,
+                               args.stop_on_failure, args.reuse_appium_session, results_store, args.firmware_tag,
+                               artifact_collector, args.profile_appium_log)
+    try:
+        summary = scheduler.run_async(args.max_blocking_workers) if args.async_engine else scheduler.run()
+    finally:
+        if args.trace_dir:
+            tracer.export(args.trace_dir)
+        if results_store:
+            results_store.close()
+        if artifact_collector:
+            artifact_collector.close()
+    log_summary(summary)
+    log_locator_stats()
+    log_round_trip_stats()
+    return 0 if summary["all"]["failed"] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+import itertools
+import logging
+import os
+import time
+
+from selenium.common.exceptions import WebDriverException
+from src.tracing import tracer
+
+# Phases of a round in order, with the banner logged before each phase
+ROUND_PHASES = [
+    ('power_cycle_provisioner',
+     '========== Before Test: Power cycle the provisioner/commissioner for BSS, ZSS or MSS ==========='),
+    ('power_on_and_check_setup',
+     '================= Test Run: Power on "NAME" and observe the behavior ================='),
+    ('factory_reset_and_power_off',
+     '============ After Test: Remove "NAME" from Alexa App to factory reset it ============')
+]
+
+# Failure categories
+FAILURE_DUT = 'dut'
+FAILURE_UI = 'ui'
+FAILURE_SESSION = 'session'
+FAILURE_OTHER = 'other'
+DUT_FAILURE_MESSAGES = ['not responsive', 'not found within']
+
+# Sequence of the rounds in this process, which makes round IDs unique across benches
+_round_seq = itertools.count(1)
+
+
+def categorize_failure(exception):
+    """
+    Categorize the failure of a round by its exception
+    :param exception: Exception raised by the round
+    :return: String, one of FAILURE_DUT, FAILURE_UI, FAILURE_SESSION and FAILURE_OTHER
+    """
+    if isinstance(exception, AssertionError):
+        message = str(exception)
+        return FAILURE_DUT if any(m in message for m in DUT_FAILURE_MESSAGES) else FAILURE_UI
+    if isinstance(exception, WebDriverException):
+        return FAILURE_SESSION
+    return FAILURE_OTHER
+
+
+class RoundResult:
+    """
+    The class is used to define the result of one round with the timings of its phases
+    """
+
+    def __init__(self, round_index=1, name_of_dut=None):
+        """
+        Initialize the RoundResult object
+        :param round_index: Index of the round, starting from 1
+        :param name_of_dut: Name of DUT the round measures, needed when a round measures several DUTs
+        """
+        self.round_index = round_index
+        self.name_of_dut = name_of_dut
+        self.started_at = time.time()
+        # Id linking the round to its artifacts and stored result
+        self.round_id = f'{time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started_at))}-{os.getpid()}-' \
+                        f'{next(_round_seq)}'
+        self.passed = False
+        self.setup_time = None
+        # Time from the power on of DUT until Alexa App is first searched for it, a setup shorter than it is measured
+        # as the delay, None for a round of one DUT, which is searched for right after the power on
+        self.discovery_delay = None
+        self.provisioner_boot_time = None
+        self.phase_timings = {}
+        # Num of retries of each phase
+        self.retries = {}
+        self.failed_phase = None
+        self.failure_category = None
+        self.error = None
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, fields):
+        """
+        Rebuild a RoundResult from the dictionary of to_dict(), e.g. a result sent by a lab worker
+        :param fields: Dictionary of the fields of the result
+        :return: RoundResult
+        """
+        result = cls(fields.get("round_index", 1), fields.get("name_of_dut"))
+        for name in vars(result):
+            if name in fields:
+                setattr(result, name, fields[name])
+        return result
+
+
+def run_round(device, result=None):
+    """
+    Run one round of the certification flow as below
+    1. Power cycle the provisioner/commissioner
+    2. Power on DUT and check the registration
+    3. Deregister the DUT and power it off
+    :param device: Device instance of the bench under test
+    :param result: RoundResult to record the round into, a new one if not given. It also holds the timings and the
+    failure of the round if an exception is raised
+    :return: RoundResult, setup_time is None if the device type does not measure it
+    """
+    result = result or RoundResult()
+    device.round_id = result.round_id
+    name_of_dut = device.names[2]
+    with tracer.span('round', 'round', round_index=result.round_index, name_of_dut=name_of_dut):
+        for phase, banner in ROUND_PHASES:
+            logging.info(banner.replace('NAME', name_of_dut))
+            time_start = time.monotonic()
+            try:
+                with tracer.span(phase, 'phase'):
+                    value = getattr(device, phase)()
+            except Exception as e:
+                result.failed_phase = phase
+                result.failure_category = categorize_failure(e)
+                result.error = f'{type(e).__name__}:{e}'
+                raise
+            finally:
+                result.phase_timings[phase] = time.monotonic() - time_start
+            if phase == 'power_cycle_provisioner':
+                result.provisioner_boot_time = getattr(device, 'provisioner_boot_time', None)
+            elif phase == 'power_on_and_check_setup':
+                result.setup_time = value
+    result.passed = True
+    return result
@@ -13,9 +13,20 @@
 #    limitations under the License.
 
 import logging
+import re
 import time
-from src.appium_conn import get_phone_uuid, AppiumConn
-from src.alexa_app_page_objects import AlexaAppPageObjects
+from contextlib import contextmanager
+from src.adb_client import get_phone_uuid
+from src.appium_conn import AppiumConn
+from src.alexa_app_page_objects import AlexaAppPageObjects, SLEEP_TIME_BEFORE_PROVISIONER_POWER_ON_IN_SECOND, \
+    PLUG_STATE_OFF, PLUG_STATE_ON, PLUG_STATE_UNKNOWN, TIMEOUT_SMALL
+from src.device_list_index import DeviceListIndex
+from src.logcat_detector import LogcatDetector
+from src.power_controller import AlexaAppPowerController
+from src.phase_steps import run_steps
+from src.readiness import TcpReachabilityProbe, provisioner_offline_steps, provisioner_ready_steps
+from src.screen_recorder import ScreenRecorder
+from src.tracing import tracer
 
 # Timeouts
 SLEEP_TIME_WAIT_FOR_PROVISIONER_IN_SECOND = 60
@@ -24,8 +35,24 @@ SLEEP_TIME_WAIT_FOR_SMART_DUT_PRESENT_IN_SECOND = 300
 
 class Device:
 
-    def __init__(self, names):
+    def __init__(self, names, udid=None, server_port=None, system_port=None, reuse_session=False,
+                 logcat_patterns=None, power_controller=None, provisioner_probes=None):
+        """
+        Initialize the Device object
+        :param names: Name of plug to control DUT, plug to control provisioner and DUT
+        :param udid: Serial number of the phone running Alexa App, the only attached phone if not given
+        :param server_port: Port of the appium server dedicated to this phone, AppiumConn.port if not given
+        :param system_port: UiAutomator2 server port on the phone, must be unique per phone when running in parallel
+        :param reuse_session: Keep one appium session alive for all phases and rounds instead of one per phase
+        :param logcat_patterns: List of regex patterns of the DUT discovery/registration event in phone logcat, "NAME"
+        is replaced with the name of DUT. The setup time is measured from the event if given, and from Alexa App UI if
+        the event is not found
+        :param power_controller: PowerController to switch the plugs, plugs are switched on Alexa App if not given
+        :param provisioner_probes: List of ReadinessProbe to detect when the provisioner is back online after its power
+        cycle, the fixed SLEEP_TIME_WAIT_FOR_PROVISIONER_IN_SECOND is waited if not given
+        """
         self.names = names
+        self.logcat_patterns = [p.replace('NAME', re.escape(names[2])) for p in logcat_patterns or []]
         self.alexa_app_desired_caps = {
             "platformName": "Android",
             "deviceName": "Android",
@@ -34,44 +61,212 @@ class Device:
             "newCommandTimeout": 0,
             "noReset": True,
             "forceAppLaunch": True,
-            "udid": get_phone_uuid(),
+            "udid": udid or get_phone_uuid(),
             "automationName": "UiAutomator2"
         }
-        self.alexa_app = AppiumConn(self.alexa_app_desired_caps)
+        if system_port:
+            self.alexa_app_desired_caps["systemPort"] = int(system_port)
+        self.alexa_app = AppiumConn(self.alexa_app_desired_caps, server_port, reuse_session)
+        # Device list of Alexa App indexed once and kept across phases and rounds
+        self.device_list_index = DeviceListIndex()
+        self.power_controller = power_controller
+        self.provisioner_probes = provisioner_probes or []
+        self.provisioner_boot_time = None
+        self.time_provisioner_power_on = None
+        # ArtifactCollector capturing failed (and sampled) Alexa App contexts of the round in round_id
+        self.artifact_collector = None
+        self.round_id = None
+        # Folder to save the screen recordings of the setup time window to, for src/frame_analyzer.py
+        self.screen_recording_dir = None
 
-    def factory_reset(self):
+    @contextmanager
+    def alexa_app_pages_context(self, navigate=True):
+        """
+        Define a context for operations on Alexa App which starts from "Devices" page
+        :param navigate: Navigate to "Devices" page, otherwise the app is left on the page where the reused session was
+        """
         with self.alexa_app.appium_conn_context() as driver:
-            alexa_pages = AlexaAppPageObjects(driver, self.names)
-            alexa_pages.move_to_devices_page()
+            try:
+                alexa_pages = AlexaAppPageObjects(driver, self.names, self.device_list_index)
+                if navigate:
+                    self.navigate_to_devices_page(alexa_pages)
+                yield alexa_pages
+            except Exception as e:
+                # Grabbed before the failed session is dropped by appium_conn_context
+                if self.artifact_collector:
+                    self.artifact_collector.capture(driver, self.round_id, 'failure',
+                                                    self.alexa_app_desired_caps["udid"], e)
+                raise
+            if self.artifact_collector and self.artifact_collector.should_sample():
+                self.artifact_collector.capture(driver, self.round_id, 'sample', self.alexa_app_desired_caps["udid"])
+
+    def navigate_to_devices_page(self, alexa_pages):
+        if self.alexa_app.session_reused:
+            # The app is not relaunched for a reused session and might be left on a smart device page
+            alexa_pages.navigate_back_to_tab_bar()
+        alexa_pages.move_to_devices_page()
+
+    @contextmanager
+    def power_controller_context(self):
+        """
+        Define a context for switching plugs, an appium session is only started for plugs switched on Alexa App
+        """
+        if self.power_controller:
+            yield self.power_controller
+        else:
+            with self.alexa_app_pages_context() as alexa_pages:
+                yield AlexaAppPowerController(alexa_pages)
+
+    def get_power_controller(self, alexa_pages):
+        return self.power_controller or AlexaAppPowerController(alexa_pages)
+
+    def factory_reset(self):
+        with self.alexa_app_pages_context() as alexa_pages:
             alexa_pages.delete_dut()
 
     def power_off(self):
-        with self.alexa_app.appium_conn_context() as driver:
-            alexa_pages = AlexaAppPageObjects(driver, self.names)
-            alexa_pages.move_to_devices_page()
-            alexa_pages.power_off_dut()
+        with self.power_controller_context() as power_controller:
+            power_controller.power_off(self.names[0])
 
     def factory_reset_and_power_off(self):
-        with self.alexa_app.appium_conn_context() as driver:
-            alexa_pages = AlexaAppPageObjects(driver, self.names)
-            alexa_pages.move_to_devices_page()
+        with self.alexa_app_pages_context() as alexa_pages:
             alexa_pages.delete_dut()
-            alexa_pages.power_off_dut()
+            self.get_power_controller(alexa_pages).power_off(self.names[0])
 
-    def power_cycle_provisioner(self):
-        with self.alexa_app.appium_conn_context() as driver:
-            alexa_pages = AlexaAppPageObjects(driver, self.names)
-            alexa_pages.move_to_devices_page()
-            alexa_pages.power_off_and_on_provisioner()
-        time.sleep(SLEEP_TIME_WAIT_FOR_PROVISIONER_IN_SECOND)
+    def reset_dut(self):
+        """
+        Deregister DUT if it is still listed on Alexa App and power it off, whichever step left it powered on or
+        registered, so that the steps of a round can be retried
+        """
+        with self.alexa_app_pages_context() as alexa_pages:
+            if alexa_pages.is_smart_device_listed(self.names[2]):
+                alexa_pages.delete_dut()
+            else:
+                logging.info(f'Smart device "{self.names[2]}" is not listed on Alexa App')
+            self.get_power_controller(alexa_pages).power_off(self.names[0])
 
-    def power_on_and_check_setup(self):
-        with self.alexa_app.appium_conn_context() as driver:
-            alexa_pages = AlexaAppPageObjects(driver, self.names)
-            alexa_pages.move_to_devices_page()
-            alexa_pages.power_on_dut()
-            setup_time = time.time()
-            alexa_pages.click_navigate_back_from_plug_device_page()
-            alexa_pages.wait_until_smart_dut_present(SLEEP_TIME_WAIT_FOR_SMART_DUT_PRESENT_IN_SECOND)
-            setup_time = time.time() - setup_time
-            logging.info(f'The setup time of smart device "{self.names[2]}" is {setup_time:.2f} seconds')
+    def power_cycle_provisioner(self, wait_ready=True):
+        """
+        Power cycle the provisioner/commissioner and wait for it to boot
+        :param wait_ready: Wait for the provisioner to boot, otherwise call wait_for_provisioner() later
+        """
+        run_steps(self.power_cycle_provisioner_steps(wait_ready))
+
+    def power_cycle_provisioner_steps(self, wait_ready=True):
+        """
+        Steps of power_cycle_provisioner(), see src/phase_steps.py
+        """
+        self.provisioner_boot_time = None
+        for probe in self.provisioner_probes:
+            probe.reset()
+        # Only LAN probes are used while the plug is off, as Alexa App is busy on the plug page
+        lan_probes = [p for p in self.provisioner_probes if isinstance(p, TcpReachabilityProbe)]
+        off_steps = None
+        if lan_probes:
+            off_steps = provisioner_offline_steps(lan_probes, SLEEP_TIME_BEFORE_PROVISIONER_POWER_ON_IN_SECOND)
+        with self.power_controller_context() as power_controller:
+            yield from power_controller.power_off_and_on_steps(self.names[1], off_steps=off_steps)
+            self.time_provisioner_power_on = time.time()
+        if wait_ready:
+            yield from self.wait_for_provisioner_steps()
+
+    def wait_for_provisioner(self):
+        """
+        Wait for the provisioner/commissioner to boot since it was powered on, detected by the readiness probes if
+        any, otherwise wait the fixed SLEEP_TIME_WAIT_FOR_PROVISIONER_IN_SECOND
+        """
+        run_steps(self.wait_for_provisioner_steps())
+
+    def wait_for_provisioner_steps(self):
+        """
+        Steps of wait_for_provisioner(), see src/phase_steps.py
+        """
+        if not self.provisioner_probes:
+            yield max(self.time_provisioner_power_on + SLEEP_TIME_WAIT_FOR_PROVISIONER_IN_SECOND - time.time(), 0)
+            return
+        self.provisioner_boot_time = yield from provisioner_ready_steps(
+            self.provisioner_probes, self.time_provisioner_power_on, SLEEP_TIME_WAIT_FOR_PROVISIONER_IN_SECOND)
+
+    def prepare_dut_plug(self):
+        """
+        Start the appium session and open the page of the plug of DUT ahead of power_on_and_check_setup(prepared=True),
+        e.g. while the provisioner is booting. The session should be reused to keep the page open
+        """
+        with self.alexa_app_pages_context() as alexa_pages:
+            if not self.power_controller:
+                alexa_pages.click_smart_device_from_devices_page(self.names[0])
+                assert alexa_pages.get_plug_state() != PLUG_STATE_UNKNOWN, \
+                    f'Cannot read the state of plug device "{self.names[0]}"'
+
+    def power_on_and_check_setup(self, prepared=False):
+        """
+        Power on DUT and measure its setup time, from the moment the plug is switched on until DUT shows up on Alexa App
+        (or its logcat event if any). It is measured the same way whether the plug page is prepared or not
+        :param prepared: The page of the plug of DUT is opened by prepare_dut_plug()
+        :return: Setup time in seconds
+        """
+        return run_steps(self.power_on_and_check_setup_steps(prepared))
+
+    def power_on_and_check_setup_steps(self, prepared=False):
+        """
+        Steps of power_on_and_check_setup(), see src/phase_steps.py
+        """
+        detector = None
+        if self.logcat_patterns:
+            detector = LogcatDetector(self.logcat_patterns, self.alexa_app_desired_caps["udid"])
+        with self.alexa_app_pages_context(navigate=not prepared) as alexa_pages:
+            if detector:
+                detector.start()
+            recorder = None
+            if self.screen_recording_dir:
+                recorder = ScreenRecorder(alexa_pages.driver, self.screen_recording_dir)
+                recorder.start()
+            time_power_on = time_found = None
+            try:
+                power_controller = self.get_power_controller(alexa_pages)
+                on_plug_page = prepared and not self.power_controller
+                state = alexa_pages.get_plug_state(TIMEOUT_SMALL) if on_plug_page else PLUG_STATE_UNKNOWN
+                assert state != PLUG_STATE_ON, f'Plug device "{self.names[0]}" is in power on mode already'
+                if state == PLUG_STATE_OFF:
+                    alexa_pages.click_power_on_from_plug_device_page()
+                else:
+                    if prepared:
+                        self.navigate_to_devices_page(alexa_pages)
+                    power_controller.power_on(self.names[0])
+                time_power_on = time.time()
+                with tracer.span('setup_time', 'measurement', name_of_dut=self.names[2]):
+                    power_controller.return_to_devices_page()
+                    yield from alexa_pages.wait_until_smart_dut_present_steps(
+                        SLEEP_TIME_WAIT_FOR_SMART_DUT_PRESENT_IN_SECOND)
+                time_found = time.time()
+                setup_time = time_found - time_power_on
+                if detector:
+                    # Alexa App UI only confirms the event, which is timestamped by logcat if detected after the power
+                    # on, a line logged before the power on is left from the previous round
+                    event = detector.wait(0, since=time_power_on)
+                    if event:
+                        logging.info(f'The setup time of smart device "{self.names[2]}" observed on Alexa App is '
+                                     f'{setup_time:.2f} seconds')
+                        setup_time = event.time - time_power_on
+                    else:
+                        logging.warning(f'No logcat event of smart device "{self.names[2]}" is found after the power '
+                                        f'on, setup time is observed on Alexa App')
+            finally:
+                if detector:
+                    detector.stop()
+                if recorder:
+                    # The video is only fetched from the phone once the setup time window is over, and discarded if
+                    # DUT is not powered on
+                    recorder.stop(self.round_id, self.names[2], time_power_on, time_found)
+            logging.info(f'The setup time of smart device "{self.names[2]}" is {setup_time:.3f} seconds')
+            return setup_time
+
+
+def is_phase_overridden(device, phase):
+    """
+    Check if the device type runs a phase of its own instead of the phase of Device
+    :param device: Device instance
+    :param phase: Name of the phase method, see ROUND_PHASES
+    :return: Boolean
+    """
+    return getattr(type(device), phase) is not getattr(Device, phase)
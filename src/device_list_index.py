@@ -0,0 +1,264 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import logging
+
+from src.page_snapshot import PageSnapshot
+from src.session_driver import session_driver
+
+"""
+Locators of the device list on "Devices" page, evaluated against page snapshots. The name of a device tile is the
+first text of the clickable tile
+"""
+DEVICE_LIST_LOCATOR = '//android.widget.ScrollView'
+DEVICE_TILE_NAME_LOCATOR = '//android.widget.ScrollView//*[@clickable="true"]/android.widget.TextView[1]'
+
+MAX_PAGES_OF_DEVICE_LIST = 100
+# Scrolls by one page to correct the offset, in case the list does not scroll by the same offset near its ends
+MAX_SCROLL_CORRECTIONS = 3
+# Ratio of the device list height kept as margin at both ends of a scroll
+SCROLL_MARGIN_RATIO = 0.1
+# A slow drag scrolls the list by the dragged distance without fling, so that every scroll moves the same offset
+SWIPE_DURATION_OF_DEVICE_LIST_SCROLL_IN_MS = 800
+
+
+class DeviceTile:
+    """
+    The class is used to define the position of a device tile in the device list
+    """
+
+    def __init__(self, name, order, page, bounds):
+        """
+        Initialize the DeviceTile object
+        :param name: Name of the device
+        :param order: Order of the tile in the list
+        :param page: Num of scrolls from the top of the list until the tile is fully visible
+        :param bounds: Tuple of (left, top, right, bottom) of the tile name on screen at that scroll offset
+        """
+        self.name = name
+        self.order = order
+        self.page = page
+        self.bounds = bounds
+
+
+class DeviceListIndex:
+    """
+    The class is used to define an index of the device list on "Devices" page, built by one scan of the list, which
+    keeps the scroll offset and bounds of every device tile. Navigating to a device then scrolls straight to its
+    offset and taps it by coordinates, instead of searching the list from the top by UiScrollable every time.
+    A device added to or deleted from the list is updated in place, and the index is invalidated when the list is
+    found different from the one scanned
+    """
+
+    def __init__(self):
+        self.tiles = {}
+        self.list_bounds = None
+        self.scans = 0
+
+    @property
+    def scanned(self):
+        return self.list_bounds is not None
+
+    def invalidate(self, reason):
+        if self.scanned:
+            logging.info(f'[Device list] Index is invalidated: {reason}')
+        self.tiles = {}
+        self.list_bounds = None
+
+    def add(self, name_of_device, snapshot):
+        """
+        Insert the tile of a device added to the list next to the indexed tiles around it on the screen, instead of
+        rescanning the list. The tiles after it move to the positions of their next tiles
+        :param name_of_device: Name of the device
+        :param snapshot: PageSnapshot of "Devices" page where the device is found
+        """
+        if not self.scanned or name_of_device in self.tiles:
+            return
+        visible = self.visible_tiles(snapshot, self.list_bounds)
+        if name_of_device not in visible:
+            self.invalidate(f'"{name_of_device}" is added out of the visible list')
+            return
+        top = visible[name_of_device][1]
+        above = [name for name in visible if name in self.tiles and visible[name][1] < top]
+        below = [name for name in visible if name in self.tiles and visible[name][1] > top]
+        if above:
+            order = self.tiles[max(above, key=lambda name: visible[name][1])].order + 1
+        elif below:
+            order = self.tiles[min(below, key=lambda name: visible[name][1])].order
+        else:
+            self.invalidate(f'No indexed device is around "{name_of_device}"')
+            return
+        tiles = sorted(self.tiles.values(), key=lambda tile: tile.order)
+        slots = [(tile.page, tile.bounds) for tile in tiles]
+        for tile in tiles[order:]:
+            tile.order += 1
+            # The last tile is taken as on the last page, correct_offset() scrolls further if not
+            tile.page, tile.bounds = slots[min(tile.order, len(slots) - 1)]
+        self.tiles[name_of_device] = DeviceTile(name_of_device, order, *slots[min(order, len(slots) - 1)])
+        logging.info(f'[Device list] "{name_of_device}" is indexed as device {order + 1} of {len(self.tiles)}')
+
+    def remove(self, name_of_device):
+        """
+        Drop the tile of a device deleted from the list, the tiles after it move to the positions of their previous
+        tiles
+        :param name_of_device: Name of the device
+        """
+        removed = self.tiles.get(name_of_device)
+        if removed is None:
+            return
+        tiles = sorted(self.tiles.values(), key=lambda tile: tile.order)
+        slots = [(tile.page, tile.bounds) for tile in tiles]
+        del self.tiles[name_of_device]
+        for tile in tiles[removed.order + 1:]:
+            tile.order -= 1
+            tile.page, tile.bounds = slots[tile.order]
+        logging.info(f'[Device list] "{name_of_device}" is removed from the index')
+
+    @staticmethod
+    def visible_tiles(snapshot, list_bounds):
+        """
+        Find the device tiles fully visible in the device list
+        :param snapshot: PageSnapshot of "Devices" page
+        :param list_bounds: Tuple of (left, top, right, bottom) of the device list on screen
+        :return: Dictionary of tile name bounds keyed by device name
+        """
+        tiles = {}
+        for element in snapshot.find_all(DEVICE_TILE_NAME_LOCATOR):
+            name = element.attributes.get('text')
+            bounds = element.bounds
+            if not name or not bounds or not element.displayed or name in tiles:
+                continue
+            if bounds[1] >= list_bounds[1] and bounds[3] <= list_bounds[3]:
+                tiles[name] = bounds
+        return tiles
+
+    def scroll(self, driver, pages):
+        """
+        Scroll the device list by the same offset per page
+        :param driver: WebDriver instance to control application objects
+        :param pages: Num of pages to scroll, towards the end of the list if positive and the top if negative
+        """
+        left, top, right, bottom = self.list_bounds
+        x = (left + right) // 2
+        margin = int((bottom - top) * SCROLL_MARGIN_RATIO)
+        start_y, end_y = bottom - margin, top + margin
+        if pages < 0:
+            start_y, end_y = end_y, start_y
+        if pages:
+            session_driver(driver).swipes([(x, start_y, x, end_y)] * abs(pages),
+                                          SWIPE_DURATION_OF_DEVICE_LIST_SCROLL_IN_MS)
+
+    def scan(self, driver, snapshot=None):
+        """
+        Scroll the device list to the top, then scroll it to the end page by page and record every tile
+        :param driver: WebDriver instance to control application objects
+        :param snapshot: PageSnapshot of "Devices" page if already captured
+        :return: PageSnapshot of the end of the list
+        """
+        snapshot = snapshot or PageSnapshot.capture(driver)
+        device_list = snapshot.find(DEVICE_LIST_LOCATOR)
+        assert device_list and device_list.bounds, 'Cannot find the device list on "Devices" page'
+        self.invalidate('rescanning the device list')
+        self.list_bounds = device_list.bounds
+        self.scans += 1
+        logging.info('[Device list] Scanning the device list')
+        visible = self.visible_tiles(snapshot, self.list_bounds)
+        for _ in range(MAX_PAGES_OF_DEVICE_LIST):
+            self.scroll(driver, -1)
+            snapshot = PageSnapshot.capture(driver)
+            top_visible = self.visible_tiles(snapshot, self.list_bounds)
+            if top_visible == visible:
+                break
+            visible = top_visible
+        for page in range(MAX_PAGES_OF_DEVICE_LIST):
+            for name, bounds in sorted(visible.items(), key=lambda item: item[1][1]):
+                if name not in self.tiles:
+                    self.tiles[name] = DeviceTile(name, len(self.tiles), page, bounds)
+            self.scroll(driver, 1)
+            snapshot = PageSnapshot.capture(driver)
+            next_visible = self.visible_tiles(snapshot, self.list_bounds)
+            if next_visible == visible:
+                break
+            visible = next_visible
+        pages = max([tile.page for tile in self.tiles.values()], default=0) + 1
+        logging.info(f'[Device list] {len(self.tiles)} devices are indexed in {pages} pages')
+        return snapshot
+
+    def current_page_of(self, visible):
+        """
+        Figure out the scroll offset of the list from the tiles visible on it
+        :param visible: Dictionary of visible tile name bounds keyed by device name
+        :return: Num of pages scrolled from the top, None if the tiles do not match the index
+        """
+        if not visible or any(name not in self.tiles for name in visible):
+            return None
+        return max(self.tiles[name].page for name in visible)
+
+    def locate(self, driver, name_of_device):
+        """
+        Scroll the device list to the tile of the device by the index, scanning the list first if not indexed yet
+        :param driver: WebDriver instance to control application objects
+        :param name_of_device: Name of the device
+        :return: Tuple of (x, y) of the tile on screen to tap, None if the device is not found in the list
+        """
+        snapshot = PageSnapshot.capture(driver)
+        device_list = snapshot.find(DEVICE_LIST_LOCATOR)
+        if not self.scanned and device_list and device_list.bounds:
+            # No need to scan the list for a device already on the screen
+            visible = self.visible_tiles(snapshot, device_list.bounds)
+            if name_of_device in visible:
+                return center_of(visible[name_of_device])
+        for _ in range(2):
+            if not self.scanned:
+                snapshot = self.scan(driver, snapshot)
+            visible = self.visible_tiles(snapshot, self.list_bounds)
+            current_page = self.current_page_of(visible)
+            if name_of_device not in visible and current_page is not None:
+                tile = self.tiles.get(name_of_device)
+                if tile is None:
+                    return None
+                self.scroll(driver, tile.page - current_page)
+                snapshot = PageSnapshot.capture(driver)
+                visible = self.correct_offset(driver, tile, snapshot)
+            if visible and name_of_device in visible:
+                return center_of(visible[name_of_device])
+            self.invalidate(f'"{name_of_device}" is not found at its offset')
+        return None
+
+    def correct_offset(self, driver, tile, snapshot):
+        """
+        Scroll the list page by page until the tile is fully visible, by its order among the visible tiles
+        :param driver: WebDriver instance to control application objects
+        :param tile: DeviceTile to scroll to
+        :param snapshot: PageSnapshot of "Devices" page after scrolling to the offset of the tile
+        :return: Dictionary of visible tile name bounds keyed by device name, None if the list does not match the
+        index
+        """
+        for _ in range(MAX_SCROLL_CORRECTIONS + 1):
+            visible = self.visible_tiles(snapshot, self.list_bounds)
+            if tile.name in visible:
+                return visible
+            if self.current_page_of(visible) is None:
+                return None
+            orders = [self.tiles[name].order for name in visible]
+            if min(orders) < tile.order < max(orders):
+                # The tile should be between the visible tiles
+                return None
+            self.scroll(driver, 1 if tile.order > max(orders) else -1)
+            snapshot = PageSnapshot.capture(driver)
+        return None
+
+
+def center_of(bounds):
+    return (bounds[0] + bounds[2]) // 2, (bounds[1] + bounds[3]) // 2
@@ -17,8 +17,8 @@ from src.device import *
 
 class ACKDevice(Device):
 
-    def __init__(self, names):
-        super().__init__(names)
+    def __init__(self, names, **kwargs):
+        super().__init__(names, **kwargs)
 
     def factory_reset_and_power_off(self):
         logging.info("ACK device has not been supported by this certification tool yet")
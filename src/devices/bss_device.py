@@ -17,5 +17,5 @@ from src.device import *
 
 class BSSDevice(Device):
 
-    def __init__(self, names):
-        super().__init__(names)
+    def __init__(self, names, **kwargs):
+        super().__init__(names, **kwargs)
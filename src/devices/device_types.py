@@ -0,0 +1,29 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+from src.devices.ack_device import ACKDevice
+from src.devices.bss_device import BSSDevice
+from src.devices.wss_device import WSSDevice
+from src.devices.zss_device import ZSSDevice
+from src.devices.mss_device import MSSDevice
+
+# Device classes keyed by lower case FFS protocol type
+DEVICE_TYPES = {
+    "ack": ACKDevice,
+    "bss": BSSDevice,
+    "wss": WSSDevice,
+    "zss": ZSSDevice,
+    "mss": MSSDevice
+}
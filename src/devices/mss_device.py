@@ -17,8 +17,8 @@ from src.device import *
 
 class MSSDevice(Device):
 
-    def __init__(self, names):
-        super().__init__(names)
+    def __init__(self, names, **kwargs):
+        super().__init__(names, **kwargs)
 
     # def power_cycle_provisioner(self):
     #    logging.info('No need to power cycle commissioner for Matter device ZTS setup')
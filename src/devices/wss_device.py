@@ -17,9 +17,9 @@ from src.device import *
 
 class WSSDevice(Device):
 
-    def __init__(self, names):
+    def __init__(self, names, **kwargs):
         logging.info("Need to override __init__() to support WSS")
-        super().__init__(names)
+        super().__init__(names, **kwargs)
         # Please define appium connection instance with 3P app desired capabilities here and take the example below
         # as reference.
         '''
@@ -30,7 +30,7 @@ class WSSDevice(Device):
             "appActivity": "<class name of your application's launcher activity>",
             "newCommandTimeout": 0,
             "noReset": True,
-            "udid": get_phone_uuid(),
+            "udid": self.alexa_app_desired_caps["udid"],
             "automationName": "UiAutomator2"
         }
         
@@ -0,0 +1,236 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+Offline analyzer of the screen recordings saved by src/screen_recorder.py, finding the first frame where the FST card
+or the tile of DUT appears on Alexa App. Frames are compared with their previous frame to skip the frames where the
+screen does not change, and the changed frames are matched against template images of the card or the tile by
+normalized cross correlation, computed for all positions and a batch of frames at once by FFT. The setup time is then
+accurate to a frame instead of the cadence of the UI polling
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is only needed to analyze recordings offline
+    np = None
+
+# Frames and templates are downscaled by the factor before matching
+ANALYSIS_SCALE = 4
+# Screen changes are measured per tile of the downscaled frames, so that a small card appearing is not averaged out
+CHANGE_TILE_SIZE = 8
+# Mean absolute change of gray level of any tile from the previous frame to take the screen as changed
+SCREEN_CHANGE_THRESHOLD = 4.0
+# Normalized cross correlation between a template and a region of a frame to take the template as present
+TEMPLATE_MATCH_THRESHOLD = 0.85
+# Num of frames matched in one FFT batch, which bounds the memory used
+MAX_FRAMES_PER_MATCH_BATCH = 16
+TIMEOUT_DECODE_IN_SECOND = 300
+
+
+def frame_differences(frames, tile=CHANGE_TILE_SIZE):
+    """
+    Change of every frame from its previous frame, as the max of the mean absolute change of its tiles
+    :param frames: Array of gray frames in shape (num of frames, height, width)
+    :param tile: Size of the square tiles, frames smaller than a tile are taken as one tile
+    :return: Array of the changes, infinite for the first frame
+    """
+    changes = np.abs(np.diff(frames.astype(np.int16), axis=0))
+    num, height, width = changes.shape
+    tile_h, tile_w = min(tile, height), min(tile, width)
+    changes = changes[:, :height - height % tile_h, :width - width % tile_w]
+    tiles = changes.reshape(num, height // tile_h, tile_h, width // tile_w, tile_w).mean(axis=(2, 4))
+    return np.concatenate([[np.inf], tiles.max(axis=(1, 2))])
+
+
+def match_template(frames, template):
+    """
+    Normalized cross correlation of a template at every position of every frame
+    :param frames: Array of gray frames in shape (num of frames, height, width)
+    :param template: Array of the gray template in shape (height, width), smaller than the frames
+    :return: Tuple of the best score of every frame, and the (y, x) position of the best score of every frame
+    """
+    frames = frames.astype(np.float64)
+    num, height, width = frames.shape
+    h, w = template.shape
+    assert h <= height and w <= width, f'Template {template.shape} is larger than the frames {frames.shape[1:]}'
+    t = template.astype(np.float64) - template.mean()
+    t_norm = np.sqrt((t ** 2).sum())
+    assert t_norm > 0, 'Template is flat, it matches any flat region'
+    # Circular cross correlation by FFT, the positions where the template fits in the frame do not wrap around
+    spectrum = np.fft.rfft2(frames, s=(height, width)) * np.conj(np.fft.rfft2(t, s=(height, width)))
+    correlation = np.fft.irfft2(spectrum, s=(height, width))[:, :height - h + 1, :width - w + 1]
+    # Sums of the frame and its square under the template at every position, by integral images
+    sums = _window_sums(frames, h, w)
+    square_sums = _window_sums(frames ** 2, h, w)
+    variance = np.maximum(square_sums - sums ** 2 / (h * w), 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = np.where(variance > 1e-6, correlation / (np.sqrt(variance) * t_norm), 0)
+    flat = scores.reshape(num, -1)
+    best = flat.argmax(axis=1)
+    positions = np.stack(np.unravel_index(best, scores.shape[1:]), axis=1)
+    return flat[np.arange(num), best], positions
+
+
+def _window_sums(frames, h, w):
+    integral = np.zeros((frames.shape[0], frames.shape[1] + 1, frames.shape[2] + 1))
+    integral[:, 1:, 1:] = frames.cumsum(axis=1).cumsum(axis=2)
+    return integral[:, h:, w:] - integral[:, :-h, w:] - integral[:, h:, :-w] + integral[:, :-h, :-w]
+
+
+def find_first_appearance(frames, timestamps, templates, start_time=0.0, match_threshold=TEMPLATE_MATCH_THRESHOLD,
+                          change_threshold=SCREEN_CHANGE_THRESHOLD):
+    """
+    Find the first frame from the start time where any of the templates is present. Only the frames where the screen
+    changes are matched, as an unchanged frame matches the same as its previous frame
+    :param frames: Array of gray frames in shape (num of frames, height, width)
+    :param timestamps: Array of the times of the frames in seconds
+    :param templates: List of gray template arrays, e.g. the FST card and the tile of DUT
+    :param start_time: Time from which to search, e.g. the power on of DUT
+    :param match_threshold: Min normalized cross correlation for a template to be present
+    :param change_threshold: Min mean absolute change of gray level for the screen to be changed
+    :return: Dictionary of frame (index), time, template (index), score and position (y, x), None if not found
+    """
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    changed = frame_differences(frames) >= change_threshold
+    # The first frame from the start time is matched even if the screen does not change
+    first = int(np.searchsorted(timestamps, start_time))
+    if first >= len(frames):
+        return None
+    changed[first] = True
+    candidates = np.flatnonzero(changed[first:]) + first
+    for batch_start in range(0, len(candidates), MAX_FRAMES_PER_MATCH_BATCH):
+        batch = candidates[batch_start:batch_start + MAX_FRAMES_PER_MATCH_BATCH]
+        matches = []
+        for index, template in enumerate(templates):
+            scores, positions = match_template(frames[batch], template)
+            present = np.flatnonzero(scores >= match_threshold)
+            if present.size:
+                matches.append((present[0], index, scores[present[0]], positions[present[0]]))
+        if matches:
+            position, index, score, (y, x) = min(matches, key=lambda match: match[0])
+            frame = int(batch[position])
+            return {"frame": frame, "time": float(timestamps[frame]), "template": index, "score": float(score),
+                    "position": (int(y), int(x))}
+    return None
+
+
+def _probe(path, entries):
+    probe_cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', entries, '-of', 'csv=p=0', path]
+    output = subprocess.run(probe_cmd, stdout=subprocess.PIPE, check=True, timeout=TIMEOUT_DECODE_IN_SECOND,
+                            encoding='utf-8').stdout
+    return [line.strip().rstrip(',') for line in output.splitlines() if line.strip()]
+
+
+def _decode_gray(path, scale, passthrough=False):
+    width, height = [int(v) for v in _probe(path, 'stream=width,height')[0].split(',')]
+    width, height = max(width // scale, 1), max(height // scale, 1)
+    decode_cmd = ['ffmpeg', '-v', 'error', '-i', path, '-vf', f'scale={width}:{height}', '-pix_fmt', 'gray']
+    if passthrough:
+        # One output frame per recorded frame, screenrecord only records a frame when the screen changes
+        decode_cmd += ['-fps_mode', 'passthrough']
+    decode_cmd += ['-f', 'rawvideo', '-']
+    data = subprocess.run(decode_cmd, stdout=subprocess.PIPE, check=True, timeout=TIMEOUT_DECODE_IN_SECOND).stdout
+    return np.frombuffer(data, dtype=np.uint8).reshape(-1, height, width)
+
+
+def load_frames(video, scale=ANALYSIS_SCALE):
+    """
+    Decode a video into downscaled gray frames by ffmpeg
+    :param video: Path of the video
+    :param scale: Downscale factor
+    :return: Tuple of the frames in shape (num of frames, height, width) and their times in seconds
+    """
+    timestamps = np.array([float(t) for t in _probe(video, 'frame=best_effort_timestamp_time') if t != 'N/A'])
+    frames = _decode_gray(video, scale, passthrough=True)
+    assert len(frames) == len(timestamps), f'{len(frames)} frames are decoded from "{video}" with ' \
+                                           f'{len(timestamps)} timestamps'
+    return frames, timestamps
+
+
+def load_template(image, scale=ANALYSIS_SCALE):
+    """
+    Load a template image cropped from a frame of a recording, e.g. the FST card or the tile of DUT
+    :param image: Path of the image, e.g. a PNG file
+    :param scale: Downscale factor, the same as the frames
+    :return: Array of the gray template
+    """
+    return _decode_gray(image, scale)[0]
+
+
+def analyze_recording(meta_file, templates, scale=ANALYSIS_SCALE, match_threshold=TEMPLATE_MATCH_THRESHOLD):
+    """
+    Measure the setup time of a round from its screen recording
+    :param meta_file: Json file saved with the recording by ScreenRecorder
+    :param templates: List of gray template arrays loaded by load_template()
+    :param scale: Downscale factor of the templates
+    :param match_threshold: Min normalized cross correlation for a template to be present
+    :return: Dictionary of the round, the setup time observed by the UI polling, the setup time from the first
+    frame where a template is present (None if not found) and its uncertainty in seconds by the start of the recording
+    """
+    with open(meta_file) as f:
+        meta = json.load(f)
+    frames, timestamps = load_frames(os.path.join(os.path.dirname(meta_file), meta["video"]), scale)
+    time_recording_started, uncertainty = recording_start_of(meta)
+    time_power_on = meta["time_power_on"] - time_recording_started
+    match = find_first_appearance(frames, timestamps, templates, time_power_on, match_threshold)
+    item = {"round_id": meta["round_id"], "name_of_dut": meta["name_of_dut"], "frames": len(frames),
+            "setup_time_on_alexa_app": None, "setup_time_from_frames": None, "setup_time_uncertainty": uncertainty,
+            "match": match}
+    if meta["time_found_on_alexa_app"]:
+        item["setup_time_on_alexa_app"] = meta["time_found_on_alexa_app"] - meta["time_power_on"]
+    if match:
+        item["setup_time_from_frames"] = match["time"] - time_power_on
+    return item
+
+
+def recording_start_of(meta):
+    """
+    Time when the recording started, taken in the middle of the start command, as the phone starts recording at some
+    point between the request and the response
+    :param meta: Dictionary loaded from the json file saved with the recording by ScreenRecorder
+    :return: Tuple of the time and its uncertainty in seconds, which is 0 for a recording saved without the request time
+    """
+    time_requested, time_started = meta.get("time_recording_start_requested"), meta["time_recording_started"]
+    if time_requested is None:
+        return time_started, 0.0
+    return (time_requested + time_started) / 2, (time_started - time_requested) / 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the setup time from screen recordings to a frame')
+    parser.add_argument('recordings', nargs='+', help='Json files saved with the recordings')
+    parser.add_argument('--template', action='append', required=True,
+                        help='Image of the FST card or the tile of DUT cropped from a frame of a recording')
+    parser.add_argument('--scale', type=int, default=ANALYSIS_SCALE, help='Downscale factor of frames')
+    parser.add_argument('--threshold', type=float, default=TEMPLATE_MATCH_THRESHOLD,
+                        help='Min normalized cross correlation for a template to be present')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+    assert np is not None, 'numpy is needed to analyze recordings, please install it by "pip install numpy"'
+    templates = [load_template(path, args.scale) for path in args.template]
+    for meta_file in args.recordings:
+        item = analyze_recording(meta_file, templates, args.scale, args.threshold)
+        print(json.dumps(item))
+
+
+if __name__ == '__main__':
+    main()
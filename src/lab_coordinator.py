@@ -0,0 +1,440 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+Lab coordinator holding one queue of certification jobs for the benches of all USB hosts of a lab. A lab worker on
+every host (src/lab_worker.py) advertises its benches, leases the jobs matching them and streams the round results
+back over HTTP/JSON. A lease is renewed by heartbeats and results, and the job of a worker which stops renewing it is
+requeued for its remaining rounds
+"""
+
+import argparse
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from src.certification_round import RoundResult
+from src.results_store import ResultsStore
+
+JOB_STATUS_QUEUED = 'queued'
+JOB_STATUS_LEASED = 'leased'
+JOB_STATUS_DONE = 'done'
+JOB_STATUS_FAILED = 'failed'
+# Fields of a job which must equal the fields of a bench to run it, "bench" is the name of the bench
+JOB_MATCH_FIELDS = ['bench', 'ffs_type', 'name_of_dut', 'name_of_plug_to_control_dut',
+                    'name_of_plug_to_control_provisioner']
+# Fields of a job which override the fields of the bench running it
+JOB_OVERRIDE_FIELDS = ['logcat_discovery_pattern', 'firmware_tag']
+LEASE_TIME_IN_SECOND = 60
+# A job is failed once its lease expired the num of times, e.g. when it kills the worker running it
+MAX_JOB_ATTEMPTS = 3
+# A worker not heard from within the time is listed as offline
+TIMEOUT_WORKER_OFFLINE_IN_SECOND = 2 * LEASE_TIME_IN_SECOND
+TIMEOUT_COORDINATOR_REQUEST_IN_SECOND = 10
+MAX_COORDINATOR_REQUEST_RETRIES = 3
+SLEEP_TIME_BEFORE_REQUEST_RETRY_IN_SECOND = 2
+# Header carrying the shared token of the lab, required by every POST once the coordinator has a token
+TOKEN_HEADER = 'X-Lab-Token'
+# Environment variable holding the shared token, used when it is not given on the command line
+TOKEN_ENV = 'LAB_COORDINATOR_TOKEN'
+
+
+class LeaseLost(Exception):
+    """
+    The lease of a job expired or was taken over, so the worker should stop running the job
+    """
+
+
+class LabCoordinator:
+    """
+    The class is used to define the coordinator HTTP server keeping the job queue, the leases and the workers in
+    memory, see _handler_class() for the endpoints
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, lease_time=LEASE_TIME_IN_SECOND, results_store=None, token=None):
+        """
+        Initialize the LabCoordinator object
+        :param host: Host to listen on, only reachable from this machine by default, e.g. "0.0.0.0" to serve the lab
+        :param port: Port to listen on, a free port if 0
+        :param lease_time: Time in seconds a lease is valid without heartbeat or result
+        :param results_store: ResultsStore to store the rounds of all workers to
+        :param token: Shared token every POST has to carry in TOKEN_HEADER, no token required if not given
+        """
+        if not token and host not in ('127.0.0.1', 'localhost', '::1'):
+            logging.warning(f'[Coordinator] Listening on {host} without a token, anyone on the network can queue jobs '
+                            f'and post results')
+        self.lease_time = lease_time
+        self.token = token
+        self.results_store = results_store
+        self.jobs = []
+        self.workers = {}
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{"127.0.0.1" if host == "0.0.0.0" else host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='lab-coordinator', daemon=True)
+        self._thread.start()
+        logging.info(f'[Coordinator] Lab coordinator is up on {self.url}')
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def submit(self, spec):
+        """
+        Queue a job as below, "rounds" is 1 if not given and the other fields are optional
+        {"ffs_type": "MSS", "name_of_dut": "First switch", "name_of_plug_to_control_dut": "First plug",
+         "name_of_plug_to_control_provisioner": "Second plug", "rounds": 10, "bench": "bench-1",
+         "firmware_tag": "1.2.3", "logcat_discovery_pattern": ["Discovered .*NAME"]}
+        :param spec: Job dictionary, it runs on the first idle bench whose fields equal its JOB_MATCH_FIELDS
+        :return: Job dictionary with its id and status
+        """
+        assert "name_of_dut" in spec or "bench" in spec, 'A job should give "name_of_dut" or "bench"'
+        unknown = [field for field in spec if field not in JOB_MATCH_FIELDS + JOB_OVERRIDE_FIELDS + ['rounds']]
+        assert not unknown, f'Unknown job field(s) {unknown}'
+        rounds = spec.get("rounds", 1)
+        assert isinstance(rounds, int) and rounds > 0, f'Num of rounds should be a positive integer, not {rounds}'
+        job = {
+            "job_id": uuid.uuid4().hex[:12],
+            "spec": dict(spec, rounds=rounds),
+            "status": JOB_STATUS_QUEUED,
+            "attempts": 0,
+            "worker": None,
+            "bench": None,
+            "lease_id": None,
+            "lease_expires_at": None,
+            "rounds_done": 0,
+            "rounds_done_before_lease": 0,
+            "results": [],
+            "error": None,
+            "submitted_at": time.time(),
+            "finished_at": None
+        }
+        with self._lock:
+            self.jobs.append(job)
+            self._jobs[job["job_id"]] = job
+        logging.info(f'[Coordinator] Job {job["job_id"]} is queued: {json.dumps(spec)}')
+        return job
+
+    def heartbeat_worker(self, worker, benches):
+        """
+        Record a heartbeat of a worker with the benches it advertises
+        :param worker: Name of the worker
+        :param benches: List of bench dictionaries of the worker, see lab_worker.advertise_bench()
+        """
+        with self._lock:
+            if worker not in self.workers:
+                logging.info(f'[Coordinator] Worker {worker} joined with benches {[b["bench"] for b in benches]}')
+            self.workers[worker] = {"benches": benches, "last_seen": time.time()}
+
+    def lease(self, worker, bench):
+        """
+        Lease the first queued job matching the bench to the worker
+        :param worker: Name of the worker
+        :param bench: Bench dictionary advertised by the worker
+        :return: Dictionary of job_id, lease_id, lease_time, rounds (the remaining rounds) and spec, None if no job
+        matches the bench
+        """
+        with self._lock:
+            self._requeue_expired()
+            for job in self.jobs:
+                if job["status"] == JOB_STATUS_QUEUED and matches_bench(job["spec"], bench):
+                    job.update(status=JOB_STATUS_LEASED, worker=worker, bench=bench["bench"],
+                               lease_id=uuid.uuid4().hex, lease_expires_at=time.time() + self.lease_time,
+                               rounds_done_before_lease=job["rounds_done"])
+                    job["attempts"] += 1
+                    logging.info(f'[Coordinator] Job {job["job_id"]} is leased to {worker}/{bench["bench"]}, '
+                                 f'attempt {job["attempts"]}')
+                    return {"job_id": job["job_id"], "lease_id": job["lease_id"], "lease_time": self.lease_time,
+                            "rounds": job["spec"]["rounds"] - job["rounds_done"], "spec": job["spec"]}
+        return None
+
+    def renew(self, job_id, lease_id):
+        """
+        Renew the lease of a job on a heartbeat of the worker running it
+        :raise LeaseLost: If the lease expired or is not the lease of the job
+        """
+        with self._lock:
+            self._leased_job(job_id, lease_id)
+
+    def add_result(self, job_id, lease_id, result):
+        """
+        Record a round of a job and renew its lease
+        :param job_id: Id of the job
+        :param lease_id: Id of the lease
+        :param result: Dictionary of RoundResult.to_dict(), round_index counts from 1 in the lease
+        :raise LeaseLost: If the lease expired or is not the lease of the job
+        """
+        with self._lock:
+            job = self._leased_job(job_id, lease_id)
+            # The rounds of a requeued job continue the rounds done by its previous leases
+            result = RoundResult.from_dict(result)
+            result.round_index += job["rounds_done_before_lease"]
+            job["rounds_done"] = max(job["rounds_done"], result.round_index)
+            job["results"].append(result.to_dict())
+        if self.results_store:
+            spec = job["spec"]
+            self.results_store.add(result, job["bench"], spec.get("ffs_type"), spec.get("firmware_tag"),
+                                   spec.get("name_of_dut"))
+
+    def complete(self, job_id, lease_id, error=None):
+        """
+        Complete a job, it is done unless the worker gives an error
+        :raise LeaseLost: If the lease expired or is not the lease of the job
+        """
+        with self._lock:
+            job = self._leased_job(job_id, lease_id)
+            job.update(status=JOB_STATUS_FAILED if error else JOB_STATUS_DONE, error=error, lease_id=None,
+                       lease_expires_at=None, finished_at=time.time())
+        passed = len([r for r in job["results"] if r["passed"]])
+        logging.info(f'[Coordinator] Job {job_id} is {job["status"]} by {job["worker"]}/{job["bench"]}, '
+                     f'{passed} of {len(job["results"])} rounds passed')
+
+    def status(self):
+        """
+        Status of the jobs and workers
+        :return: Dictionary of jobs (without their results) and workers with their online state
+        """
+        with self._lock:
+            self._requeue_expired()
+            jobs = [dict({k: v for k, v in job.items() if k != "results"},
+                         passed=len([r for r in job["results"] if r["passed"]])) for job in self.jobs]
+            workers = {name: dict(worker, online=time.time() - worker["last_seen"] < TIMEOUT_WORKER_OFFLINE_IN_SECOND)
+                       for name, worker in self.workers.items()}
+        return {"jobs": jobs, "workers": workers}
+
+    def job(self, job_id):
+        with self._lock:
+            self._requeue_expired()
+            return self._jobs.get(job_id)
+
+    def _leased_job(self, job_id, lease_id):
+        self._requeue_expired()
+        job = self._jobs.get(job_id)
+        if not job or job["status"] != JOB_STATUS_LEASED or job["lease_id"] != lease_id:
+            raise LeaseLost(f'Job {job_id} is not leased by {lease_id}')
+        job["lease_expires_at"] = time.time() + self.lease_time
+        return job
+
+    def _requeue_expired(self):
+        now = time.time()
+        for job in self.jobs:
+            if job["status"] != JOB_STATUS_LEASED or job["lease_expires_at"] > now:
+                continue
+            if job["attempts"] >= MAX_JOB_ATTEMPTS:
+                job.update(status=JOB_STATUS_FAILED, error=f'Lease expired {job["attempts"]} times',
+                           finished_at=now)
+                logging.error(f'[Coordinator] Job {job["job_id"]} failed, its lease expired {job["attempts"]} times')
+            else:
+                job["status"] = JOB_STATUS_QUEUED
+                logging.warning(f'[Coordinator] The lease of job {job["job_id"]} by {job["worker"]}/{job["bench"]} '
+                                f'expired, {job["spec"]["rounds"] - job["rounds_done"]} rounds are requeued')
+            job.update(lease_id=None, lease_expires_at=None)
+
+    def _handler_class(self):
+        coordinator = self
+
+        class CoordinatorRequestHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                parts = self.path.strip('/').split('/')
+                if parts == ['status']:
+                    self._send(200, coordinator.status())
+                elif len(parts) == 2 and parts[0] == 'jobs' and coordinator.job(parts[1]):
+                    self._send(200, coordinator.job(parts[1]))
+                else:
+                    self._send(404, {"error": f'Unknown path {self.path}'})
+
+            def do_POST(self):
+                parts = self.path.strip('/').split('/')
+                if coordinator.token and not hmac.compare_digest(self.headers.get(TOKEN_HEADER, ''), coordinator.token):
+                    self._send(401, {"error": f'Missing or wrong {TOKEN_HEADER} header'})
+                    return
+                try:
+                    body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                    if parts == ['jobs']:
+                        specs = body if isinstance(body, list) else [body]
+                        self._send(200, [coordinator.submit(spec)["job_id"] for spec in specs])
+                    elif parts == ['workers', 'heartbeat']:
+                        coordinator.heartbeat_worker(body["worker"], body["benches"])
+                        self._send(200, {})
+                    elif parts == ['jobs', 'lease']:
+                        lease = coordinator.lease(body["worker"], body["bench"])
+                        self._send(200 if lease else 204, lease)
+                    elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'heartbeat':
+                        coordinator.renew(parts[1], body["lease_id"])
+                        self._send(200, {})
+                    elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'results':
+                        coordinator.add_result(parts[1], body["lease_id"], body["result"])
+                        self._send(200, {})
+                    elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'complete':
+                        coordinator.complete(parts[1], body["lease_id"], body.get("error"))
+                        self._send(200, {})
+                    else:
+                        self._send(404, {"error": f'Unknown path {self.path}'})
+                except LeaseLost as e:
+                    self._send(409, {"error": str(e)})
+                except (AssertionError, KeyError, ValueError) as e:
+                    self._send(400, {"error": f'{type(e).__name__}:{e}'})
+
+            def _send(self, code, body):
+                data = json.dumps(body).encode('utf-8') if body is not None else b''
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                logging.debug(f'[Coordinator] {format % args}')
+
+        return CoordinatorRequestHandler
+
+
+def matches_bench(spec, bench):
+    """
+    Check if a job can run on a bench
+    :param spec: Job dictionary
+    :param bench: Bench dictionary advertised by a worker
+    :return: Boolean, True if every JOB_MATCH_FIELDS given by the job equals the field of the bench
+    """
+    for field in JOB_MATCH_FIELDS:
+        if field not in spec:
+            continue
+        if field == 'ffs_type':
+            if str(spec[field]).lower() != str(bench.get(field)).lower():
+                return False
+        elif spec[field] != bench.get(field):
+            return False
+    return True
+
+
+class CoordinatorClient:
+    """
+    The class is used to call the coordinator from workers and the command line. Requests failed by the network are
+    retried, while a lost lease raises LeaseLost
+    """
+
+    def __init__(self, url, timeout=TIMEOUT_COORDINATOR_REQUEST_IN_SECOND, token=None):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.token = token
+
+    def submit(self, specs):
+        return self._request('POST', '/jobs', specs)
+
+    def status(self):
+        return self._request('GET', '/status')
+
+    def heartbeat_worker(self, worker, benches):
+        self._request('POST', '/workers/heartbeat', {"worker": worker, "benches": benches})
+
+    def lease(self, worker, bench):
+        return self._request('POST', '/jobs/lease', {"worker": worker, "bench": bench})
+
+    def renew(self, job_id, lease_id):
+        self._request('POST', f'/jobs/{job_id}/heartbeat', {"lease_id": lease_id})
+
+    def add_result(self, job_id, lease_id, result):
+        self._request('POST', f'/jobs/{job_id}/results', {"lease_id": lease_id, "result": result.to_dict()})
+
+    def complete(self, job_id, lease_id, error=None):
+        self._request('POST', f'/jobs/{job_id}/complete', {"lease_id": lease_id, "error": error})
+
+    def _request(self, method, path, body=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        for attempt in range(1, MAX_COORDINATOR_REQUEST_RETRIES + 1):
+            headers = {"Content-Type": "application/json"}
+            if self.token:
+                headers[TOKEN_HEADER] = self.token
+            request = Request(f'{self.url}{path}', data=data, method=method, headers=headers)
+            try:
+                with urlopen(request, timeout=self.timeout) as response:
+                    body = response.read().decode('utf-8')
+                return json.loads(body) if body else None
+            except HTTPError as e:
+                error = e.read().decode('utf-8', errors='replace')
+                if e.code == 409:
+                    raise LeaseLost(error)
+                raise AssertionError(f'Coordinator request {method} {path} failed with {e.code}: {error}')
+            except OSError as e:
+                if attempt == MAX_COORDINATOR_REQUEST_RETRIES:
+                    raise
+                logging.warning(f'[Coordinator] Request {method} {path} failed: {e}, retrying')
+                time.sleep(SLEEP_TIME_BEFORE_REQUEST_RETRY_IN_SECOND)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the lab coordinator, or submit jobs to it')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve = subparsers.add_parser('serve', help='Run the coordinator')
+    serve.add_argument('--host', default='127.0.0.1',
+                       help='Host to listen on, "0.0.0.0" to take workers of other hosts, which needs --token')
+    serve.add_argument('--port', type=int, default=8470, help='Port to listen on')
+    serve.add_argument('--jobs', help='Json file listing the jobs to queue at start')
+    serve.add_argument('--lease_time', type=float, default=LEASE_TIME_IN_SECOND,
+                       help='Time in seconds a lease is valid without heartbeat')
+    serve.add_argument('--results_db', help='SQLite database file to store the rounds of all workers to')
+    submit = subparsers.add_parser('submit', help='Queue the jobs of a json file')
+    submit.add_argument('--coordinator', required=True, help='Url of the coordinator')
+    submit.add_argument('--jobs', required=True, help='Json file listing the jobs')
+    status = subparsers.add_parser('status', help='Print the status of the jobs and workers')
+    status.add_argument('--coordinator', required=True, help='Url of the coordinator')
+    for subparser in [serve, submit, status]:
+        subparser.add_argument('--token', default=os.environ.get(TOKEN_ENV),
+                               help=f'Shared token of the lab required by every POST, {TOKEN_ENV} by default')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+
+    if args.command == 'serve':
+        results_store = ResultsStore(args.results_db) if args.results_db else None
+        coordinator = LabCoordinator(args.host, args.port, args.lease_time, results_store, args.token)
+        if args.jobs:
+            with open(args.jobs) as f:
+                for spec in json.load(f):
+                    coordinator.submit(spec)
+        logging.info(f'[Coordinator] Lab coordinator is up on port {args.port}')
+        try:
+            coordinator.httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            coordinator.httpd.server_close()
+            if results_store:
+                results_store.close()
+    elif args.command == 'submit':
+        with open(args.jobs) as f:
+            print(json.dumps(CoordinatorClient(args.coordinator, token=args.token).submit(json.load(f))))
+    else:
+        print(json.dumps(CoordinatorClient(args.coordinator, token=args.token).status(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+Lab worker running on every USB host of a lab. It advertises the benches of its bench inventory to the lab
+coordinator (src/lab_coordinator.py), leases the jobs matching every idle bench, runs their rounds like the bench
+scheduler and streams every round result back. The lease is renewed by a heartbeat thread while the job runs, and the
+job is abandoned once its lease is lost
+"""
+
+import argparse
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.adb_client import adb, is_phone_attached
+from src.appium_conn import AppiumConn
+from src.bench_scheduler import BenchScheduler, load_bench_inventory
+from src.lab_coordinator import JOB_OVERRIDE_FIELDS, TOKEN_ENV, CoordinatorClient, LeaseLost
+
+SLEEP_TIME_POLL_JOBS_IN_SECOND = 10
+INTERVAL_WORKER_HEARTBEAT_IN_SECOND = 15
+
+
+class WorkerStopped(Exception):
+    """
+    The worker is stopped while running a job, which is left to the coordinator to requeue once its lease expires
+    """
+
+
+def advertise_bench(bench, attached=True):
+    """
+    Fields of a bench advertised to the coordinator to match jobs against, see JOB_MATCH_FIELDS
+    :param bench: Bench dictionary, see load_bench_inventory()
+    :param attached: Whether the phone of the bench is attached
+    :return: Dictionary of the bench
+    """
+    return {"bench": bench["name"], "ffs_type": bench["ffs_type"], "name_of_dut": bench["name_of_dut"],
+            "name_of_plug_to_control_dut": bench["name_of_plug_to_control_dut"],
+            "name_of_plug_to_control_provisioner": bench["name_of_plug_to_control_provisioner"],
+            "phone_serial": bench["phone_serial"], "attached": attached}
+
+
+class LabJobRunner(BenchScheduler):
+    """
+    The class is used to run the rounds of one leased job on one bench like BenchScheduler, streaming every round
+    result to the coordinator instead of collecting it
+    """
+
+    def __init__(self, client, lease, stopped, reuse_session=False):
+        """
+        Initialize the LabJobRunner object
+        :param client: CoordinatorClient
+        :param lease: Lease of the job returned by the coordinator
+        :param stopped: Event set when the worker is stopped, the job stops after the current round
+        :param reuse_session: Keep one appium session alive for all phases and rounds of the job
+        """
+        super().__init__([], lease["rounds"], reuse_session=reuse_session)
+        self.client = client
+        self.lease = lease
+        self.stopped = stopped
+        self.lease_lost = threading.Event()
+
+    def _add_result(self, bench, result):
+        if self.lease_lost.is_set():
+            raise LeaseLost(f'The lease of job {self.lease["job_id"]} is lost')
+        self.client.add_result(self.lease["job_id"], self.lease["lease_id"], result)
+        logging.info(f'[Worker] Round {result.round_index} of job {self.lease["job_id"]} is sent, '
+                     f'passed: {result.passed}')
+        if self.stopped.is_set():
+            raise WorkerStopped(f'The worker is stopped after round {result.round_index}')
+
+
+class LabWorker:
+    """
+    The class is used to run the benches of one host as a lab worker, each bench pulling jobs in its own thread
+    """
+
+    def __init__(self, client, benches, name=None, reuse_session=False):
+        """
+        Initialize the LabWorker object
+        :param client: CoordinatorClient
+        :param benches: List of bench dictionaries, see load_bench_inventory()
+        :param name: Name of the worker, the host name and process id if not given
+        :param reuse_session: Keep one appium session alive per bench for all phases and rounds of a job
+        """
+        self.client = client
+        self.benches = benches
+        self.name = name or f'{socket.gethostname()}-{os.getpid()}'
+        self.reuse_session = reuse_session
+        self._stop = threading.Event()
+
+    def run(self):
+        """
+        Advertise the benches and run jobs on them until stopped
+        """
+        # The benches are polled for being attached from the tracked phones, without a round trip per poll
+        adb.start_tracking()
+        heartbeat = threading.Thread(target=self._heartbeat_worker, name='worker-heartbeat', daemon=True)
+        heartbeat.start()
+        executor = ThreadPoolExecutor(max_workers=len(self.benches))
+        try:
+            for future in [executor.submit(self.run_bench, bench) for bench in self.benches]:
+                future.result()
+        finally:
+            # The running jobs stop after their current round
+            self._stop.set()
+            executor.shutdown()
+            AppiumConn.stop_appium_server()
+            adb.stop_tracking()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_bench(self, bench):
+        """
+        Lease and run the jobs matching the bench until the worker is stopped
+        :param bench: Bench dictionary
+        """
+        threading.current_thread().name = bench["name"]
+        while not self._stop.is_set():
+            lease = None
+            if self._is_attached(bench):
+                try:
+                    lease = self.client.lease(self.name, advertise_bench(bench))
+                except OSError as e:
+                    logging.warning(f'[Worker] Cannot reach the coordinator: {e}')
+            if lease:
+                self.run_job(bench, lease)
+            else:
+                self._stop.wait(SLEEP_TIME_POLL_JOBS_IN_SECOND)
+
+    def run_job(self, bench, lease):
+        """
+        Run the remaining rounds of a leased job on the bench, and complete it unless its lease is lost
+        :param bench: Bench dictionary
+        :param lease: Lease of the job returned by the coordinator
+        """
+        spec = lease["spec"]
+        logging.info(f'[Worker] Running {lease["rounds"]} rounds of job {lease["job_id"]} on {bench["name"]}')
+        job_bench = dict(bench, **{field: spec[field] for field in JOB_OVERRIDE_FIELDS if field in spec})
+        runner = LabJobRunner(self.client, lease, self._stop, self.reuse_session)
+        job_done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat_job, args=(runner, job_done),
+                                     name=f'{bench["name"]}-heartbeat', daemon=True)
+        heartbeat.start()
+        error = None
+        try:
+            runner.run_bench(job_bench)
+        except (LeaseLost, WorkerStopped) as e:
+            logging.error(f'[Worker] Job {lease["job_id"]} is abandoned: {e}')
+            return
+        except Exception as e:
+            logging.exception(f'[Worker] Job {lease["job_id"]} failed')
+            error = f'{type(e).__name__}:{e}'
+        finally:
+            job_done.set()
+            heartbeat.join()
+        try:
+            self.client.complete(lease["job_id"], lease["lease_id"], error)
+        except (LeaseLost, OSError) as e:
+            logging.error(f'[Worker] Job {lease["job_id"]} cannot be completed: {e}')
+
+    def _heartbeat_job(self, runner, done):
+        # Renewed several times within the lease time, so that one missed heartbeat does not lose the lease
+        while not done.wait(runner.lease["lease_time"] / 4):
+            try:
+                self.client.renew(runner.lease["job_id"], runner.lease["lease_id"])
+            except LeaseLost as e:
+                logging.error(f'[Worker] {e}, the job stops after the current round')
+                runner.lease_lost.set()
+                return
+            except OSError as e:
+                logging.warning(f'[Worker] Heartbeat of job {runner.lease["job_id"]} failed: {e}')
+
+    def _heartbeat_worker(self):
+        while True:
+            try:
+                self.client.heartbeat_worker(self.name, [advertise_bench(bench, self._is_attached(bench))
+                                                         for bench in self.benches])
+            except OSError as e:
+                logging.warning(f'[Worker] Cannot reach the coordinator: {e}')
+            if self._stop.wait(INTERVAL_WORKER_HEARTBEAT_IN_SECOND):
+                return
+
+    @staticmethod
+    def _is_attached(bench):
+        return is_phone_attached(bench["phone_serial"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the benches of this host as a lab worker')
+    parser.add_argument('--coordinator', required=True, help='Url of the lab coordinator')
+    parser.add_argument('--bench_inventory', required=True, help='Json file listing the benches of this host')
+    parser.add_argument('--name', help='Name of the worker, the host name and process id by default')
+    parser.add_argument('--reuse_appium_session', action='store_true',
+                        help='Keep one appium session alive per bench for all phases and rounds of a job')
+    parser.add_argument('--token', default=os.environ.get(TOKEN_ENV),
+                        help=f'Shared token of the lab required by the coordinator, {TOKEN_ENV} by default')
+    args = parser.parse_args()
+    os.makedirs('logs', exist_ok=True)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s [%(threadName)s] %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+
+    client = CoordinatorClient(args.coordinator, token=args.token)
+    worker = LabWorker(client, load_bench_inventory(args.bench_inventory), args.name, args.reuse_appium_session)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+import logging
+import threading
+from collections import Counter
+
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.by import By
+
+# Locators keyed by name, shared by all page objects so that the strategy learned for an element is kept
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class MobileBy:
+    """
+    Appium locator strategies, the same as appium.webdriver.common.mobileby which imports the whole appium WebDriver
+    """
+    ACCESSIBILITY_ID = 'accessibility id'
+    ANDROID_UIAUTOMATOR = '-android uiautomator'
+
+
+class Locator:
+    """
+    The class is used to define how an element is located, by a list of strategies from the preferred (fastest on
+    UiAutomator2) to the fallback ones, XPath always being the last one which is also used against page snapshots.
+    The strategy which actually matched is recorded and tried first from then on, the others are tried in the same
+    lookup when it misses, and whichever matches is tried first from then on
+    """
+
+    def __init__(self, name, *strategies, xpath):
+        """
+        Initialize the Locator object
+        :param name: Name of the element
+        :param strategies: Tuples of (strategy, value), e.g. (MobileBy.ACCESSIBILITY_ID, "Edit"), preferred first
+        :param xpath: XPATH locator of the element as the last fallback
+        """
+        self.name = name
+        self.xpath = xpath
+        self.strategies = list(strategies) + [(By.XPATH, xpath)]
+        self.matched = Counter()
+        self.active = None
+
+    def __str__(self):
+        return self.xpath
+
+    def replace(self, placeholder, value):
+        """
+        Fill the placeholder of a locator template in all strategies
+        :param placeholder: Placeholder in the template, e.g. "NAME"
+        :param value: Value to fill in
+        :return: Locator, the same instance for the same template and value
+        """
+        strategies = [(by, v.replace(placeholder, value)) for by, v in self.strategies[:-1]]
+        return register(Locator(f'{self.name}[{value}]', *strategies, xpath=self.xpath.replace(placeholder, value)))
+
+    def candidates(self):
+        """
+        Strategies to try in order, the one matched before if any and then the others in their preferred order
+        :return: List of (strategy, value)
+        """
+        active = self.active
+        if not active:
+            return self.strategies
+        return [active] + [strategy for strategy in self.strategies if strategy != active]
+
+    def find(self, driver):
+        """
+        Find the element by the candidate strategies
+        :param driver: WebDriver instance to control application objects
+        :return: WebElement
+        """
+        for by, value in self.candidates():
+            try:
+                element = driver.find_element(by, value)
+            except NoSuchElementException:
+                continue
+            self._record(by, value)
+            return element
+        raise NoSuchElementException(f'Cannot locate "{self.name}" by {[by for by, _ in self.candidates()]}')
+
+    def reset(self):
+        """
+        Forget the matched strategy, so that all strategies are tried again
+        """
+        self.active = None
+
+    def _record(self, by, value):
+        with _registry_lock:
+            self.matched[by] += 1
+            if self.active != (by, value):
+                if self.active is None:
+                    logging.debug(f'Locator "{self.name}" matched by {by}')
+                self.active = (by, value)
+
+
+def register(locator):
+    """
+    Register the locator by its name, or get the one registered before with the same name
+    :param locator: Locator
+    :return: Locator
+    """
+    with _registry_lock:
+        return _registry.setdefault(locator.name, locator)
+
+
+def as_locator(locator):
+    """
+    Convert a plain XPATH locator to Locator
+    :param locator: Locator or XPATH locator string
+    :return: Locator
+    """
+    if isinstance(locator, Locator):
+        return locator
+    return register(Locator(locator, xpath=locator))
+
+
+def locator_stats():
+    """
+    Strategies which matched for every located element
+    :return: Dictionary of matched counts per strategy keyed by locator name
+    """
+    with _registry_lock:
+        return {name: dict(locator.matched) for name, locator in _registry.items() if locator.matched}
+
+
+def log_locator_stats():
+    for name, matched in sorted(locator_stats().items()):
+        logging.info(f'[Locator] "{name}" matched by ' + ', '.join(f'{by}: {count}' for by, count in matched.items()))
+
+
+def accessibility_id(name, value, xpath):
+    return register(Locator(name, (MobileBy.ACCESSIBILITY_ID, value), xpath=xpath))
+
+
+def ui_selector(name, selector, xpath):
+    return register(Locator(name, (MobileBy.ANDROID_UIAUTOMATOR, selector), xpath=xpath))
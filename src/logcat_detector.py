@@ -0,0 +1,199 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+import logging
+import re
+import socket
+import threading
+import time
+
+from src.adb_client import adb
+
+# Format of "adb logcat -v epoch" lines: <seconds.milliseconds> <pid> <tid> <level> <tag>: <message>
+LOGCAT_EPOCH_LINE_PATTERN = re.compile(r'^\s*(\d+\.\d+)\s+(\d+)\s+(\d+)\s+([VDIWEF])\s+(.*?)\s*: (.*)$')
+TIMEOUT_LOGCAT_READER_STOP_IN_SECOND = 5
+# Reads of the phone clock to measure its offset from the host clock, the read of the shortest round trip is kept
+CLOCK_OFFSET_SAMPLES = 5
+
+
+class LogcatEvent:
+    """
+    The class is used to define a logcat line matching one of the detector patterns
+    """
+
+    def __init__(self, pattern, line, host_time, device_time=None, clock_offset=None):
+        """
+        Initialize the LogcatEvent object
+        :param pattern: Regex pattern matched by the line
+        :param line: The logcat line
+        :param host_time: Time when the line was read on the test machine
+        :param device_time: Time logged on the phone with millisecond resolution, None if it cannot be parsed
+        :param clock_offset: Offset in seconds of the phone clock from the host clock, None if not measured
+        """
+        self.pattern = pattern
+        self.line = line
+        self.host_time = host_time
+        self.device_time = device_time
+        self.clock_offset = clock_offset
+
+    @property
+    def time(self):
+        """
+        Time of the event on the host clock, logged by the phone and corrected by the clock offset, which leaves out the
+        delay of streaming logcat. It is the time the line was read if the phone time is unknown
+        """
+        if self.device_time is None or self.clock_offset is None:
+            return self.host_time
+        return self.device_time - self.clock_offset
+
+
+class LogcatDetector:
+    """
+    The class is used to detect events from a streamed logcat of the phone in a background reader, and timestamp
+    the lines matching any of the patterns
+    """
+
+    def __init__(self, patterns, serial=None, filter_specs=None, stream=None, clock_offset=None):
+        """
+        Initialize the LogcatDetector object
+        :param patterns: List of regex patterns of the event to detect
+        :param serial: Serial number of the phone, the only attached phone if not given
+        :param filter_specs: List of logcat filter specs such as "ActivityManager:I", all logs if not given
+        :param stream: Iterable of logcat lines in epoch format to read instead of running adb, e.g. a fake stream
+        :param clock_offset: Offset in seconds of the phone clock from the host clock, measured when streaming from
+        adb if not given
+        """
+        self.patterns = [re.compile(pattern) for pattern in patterns]
+        self.serial = serial
+        self.filter_specs = filter_specs or []
+        self.stream = stream
+        self.clock_offset = clock_offset
+        self.conn = None
+        self.events = []
+        self.time_started = None
+        self._condition = threading.Condition()
+        self._reader = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        """
+        Start streaming logcat from now on and reading it in background
+        """
+        if self.stream is None and self.clock_offset is None:
+            self.clock_offset = measure_clock_offset(self.serial)
+        self.time_started = time.time()
+        if self.stream is None:
+            # Only the logs from now on by the phone clock are streamed, the host clock is taken as the phone clock if
+            # the offset is not measured, then the logs read before the start are skipped by wait()
+            time_start = self.time_started + (self.clock_offset or 0)
+            logcat_cmd = ' '.join(['logcat', '-v', 'epoch', '-T', f"'{time_start:.3f}'"] + self.filter_specs)
+            # Streamed through the adb server until the connection is shut down
+            self.conn = adb.open_service(f'shell:{logcat_cmd}', self.serial, timeout=None)
+            self.stream = self.conn.makefile('r', encoding='utf-8', errors='replace')
+        self._reader = threading.Thread(target=self._read, name='logcat-detector', daemon=True)
+        self._reader.start()
+        logging.info(f'Logcat detector is started for pattern(s) {[p.pattern for p in self.patterns]}')
+
+    def stop(self):
+        """
+        Stop streaming logcat
+        """
+        if self.conn:
+            try:
+                self.conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.conn.close()
+            self.conn = None
+        if self._reader:
+            self._reader.join(TIMEOUT_LOGCAT_READER_STOP_IN_SECOND)
+
+    def wait(self, timeout, since=None):
+        """
+        Wait until the event is detected
+        :param timeout: timeout in seconds
+        :param since: Host time from which the event counts, e.g. the power on of DUT, the start if not given
+        :return: First LogcatEvent from the time, None if not detected within timeout
+        """
+        since = self.time_started if since is None else since
+        with self._condition:
+            self._condition.wait_for(lambda: self._first_event(since), timeout)
+            return self._first_event(since)
+
+    def _first_event(self, since):
+        return next((event for event in self.events if event.time >= since), None)
+
+    def _read(self):
+        for line in self.stream:
+            self._match(line.rstrip('\r\n'), time.time())
+
+    def _match(self, line, host_time):
+        m = LOGCAT_EPOCH_LINE_PATTERN.match(line)
+        message = m.group(6) if m else line
+        for pattern in self.patterns:
+            if pattern.search(message):
+                event = LogcatEvent(pattern.pattern, line, host_time, float(m.group(1)) if m else None,
+                                    self.clock_offset)
+                with self._condition:
+                    self.events.append(event)
+                    self._condition.notify_all()
+                logging.info(f'Logcat detector matched "{pattern.pattern}": {line}')
+                return
+
+
+def measure_clock_offset(serial=None, samples=CLOCK_OFFSET_SAMPLES):
+    """
+    Measure the offset of the phone clock from the host clock, by reading the phone clock over adb and taking it as
+    read in the middle of the round trip
+    :param serial: Serial number of the phone, the only attached phone if not given
+    :param samples: Num of reads, the read of the shortest round trip is the most accurate
+    :return: Offset in seconds (phone time minus host time), None if the phone clock cannot be read to sub-second
+    resolution, e.g. by a date command without %N
+    """
+    best = None
+    for _ in range(samples):
+        time_sent = time.time()
+        output = adb.shell('date +%s.%N', serial).strip()
+        time_received = time.time()
+        try:
+            device_time = float(output)
+        except ValueError:
+            logging.warning(f'Cannot read the clock of the phone to sub-second resolution: "{output}", logcat events '
+                            f'are timestamped when they are read')
+            return None
+        if best is None or time_received - time_sent < best[1]:
+            best = (device_time - (time_sent + time_received) / 2, time_received - time_sent)
+    logging.info(f'The clock of the phone is {best[0]:+.3f} seconds from the host, measured within {best[1] / 2:.3f} '
+                 f'seconds')
+    return best[0]
+
+
+def fake_logcat_stream(messages, interval=0.0, tag='FakeTag'):
+    """
+    Generate logcat lines in epoch format for running the detector offline
+    :param messages: List of log messages
+    :param interval: Delay in seconds before each line
+    :param tag: Log tag of the lines
+    :return: Generator of logcat lines
+    """
+    for message in messages:
+        time.sleep(interval)
+        yield f'{time.time():.3f}  1234  1234 I {tag}: {message}\n'
@@ -12,24 +12,85 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 
-from selenium.common.exceptions import TimeoutException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions
-from selenium.webdriver.support.wait import WebDriverWait
+import time
+
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException, TimeoutException
+from src.locators import as_locator
+from src.page_snapshot import PageSnapshot
+from src.session_driver import record_saved_round_trips
+
+INTERVAL_PAGE_SNAPSHOT_POLL_IN_SECOND = 0.5
+
+
+def visibility_of_element_located(locator):
+    """
+    An expectation of the element being visible, located by the strategies of the locator
+    :param locator: Locator of the element
+    :return: Function taking the driver and returning the element once it is visible, False otherwise
+    """
+    def _predicate(driver):
+        try:
+            element = locator.find(driver)
+            return element if element.is_displayed() else False
+        except (NoSuchElementException, StaleElementReferenceException):
+            return False
+    return _predicate
+
+
+def invisibility_of_element_located(locator):
+    """
+    An expectation of the element being invisible or not present, located by the strategies of the locator
+    :param locator: Locator of the element
+    :return: Function taking the driver and returning True once it is invisible, False otherwise
+    """
+    def _predicate(driver):
+        try:
+            return not locator.find(driver).is_displayed()
+        except (NoSuchElementException, StaleElementReferenceException):
+            return True
+    return _predicate
 
 
 def click_element(driver, timeout, locator):
     """
-    Click the element based on its locator
+    Click the element based on its locator, the element found by the wait is clicked without finding it again
     :param driver: WebDriver instance to control application objects
-    :param locator: XPATH locator of the element
+    :param locator: Locator or XPATH locator of the element
     :param timeout: timeout to find the element
     :return: Boolean
     """
-    if verify_if_element_is_present(driver, timeout, locator):
-        driver.find_element(By.XPATH, locator).click()
-        return True
-    return False
+    element = wait_for_element(driver, timeout, locator)
+    if element is None:
+        return False
+    try:
+        element.click()
+        record_saved_round_trips(driver, 'element_reuse')
+    except StaleElementReferenceException:
+        as_locator(locator).find(driver).click()
+    return True
+
+
+def _web_driver_wait(driver, timeout):
+    # The wait module imports the whole selenium WebDriver stack, which is only needed once a driver is used
+    from selenium.webdriver.support.wait import WebDriverWait
+    return WebDriverWait(driver, timeout)
+
+
+def wait_for_element(driver, timeout, locator):
+    """
+    Wait for the element to be visible
+    :param driver: WebDriver instance to control application objects
+    :param timeout: timeout in seconds
+    :param locator: Locator or XPATH locator of the element
+    :return: WebElement, None if element is always invisible within timeout
+    """
+    locator = as_locator(locator)
+    try:
+        return _web_driver_wait(driver, timeout).until(visibility_of_element_located(locator))
+    except TimeoutException:
+        # The strategy matched before might not work any more, try all strategies next time
+        locator.reset()
+        return None
 
 
 def verify_if_element_is_present(driver, timeout, locator):
@@ -37,14 +98,10 @@ def verify_if_element_is_present(driver, timeout, locator):
     Verify if the element is visible, return false if element is always invisible within timeout
     :param driver: WebDriver instance to control application objects
     :param timeout: timeout in seconds
-    :param locator: XPATH locator of the element
+    :param locator: Locator or XPATH locator of the element
     :return: Boolean
     """
-    try:
-        WebDriverWait(driver, timeout).until(expected_conditions.visibility_of_element_located((By.XPATH, locator)))
-        return True
-    except TimeoutException:
-        return False
+    return wait_for_element(driver, timeout, locator) is not None
 
 
 def verify_if_element_is_not_present(driver, timeout, locator):
@@ -52,16 +109,36 @@ def verify_if_element_is_not_present(driver, timeout, locator):
     Verify if the element is invisible, return false if element is always visible within timeout
     :param driver: WebDriver instance to control application objects
     :param timeout: timeout in seconds
-    :param locator: XPATH locator of the element
+    :param locator: Locator or XPATH locator of the element
     :return: Boolean
     """
     try:
-        WebDriverWait(driver, timeout).until(expected_conditions.invisibility_of_element_located((By.XPATH, locator)))
+        _web_driver_wait(driver, timeout).until(invisibility_of_element_located(as_locator(locator)))
         return True
     except TimeoutException:
         return False
 
 
+def wait_for_page_snapshot(driver, timeout, condition, poll_frequency=INTERVAL_PAGE_SNAPSHOT_POLL_IN_SECOND):
+    """
+    Fetch page snapshots until one of them meets the condition, every poll is one page source request no matter how
+    many locators the condition checks
+    :param driver: WebDriver instance to control application objects
+    :param timeout: timeout in seconds, the first snapshot is always checked
+    :param condition: Function taking a PageSnapshot and returning Boolean
+    :param poll_frequency: interval between snapshots in seconds
+    :return: PageSnapshot meeting the condition, None if no snapshot meets it within timeout
+    """
+    time_stop = time.time() + timeout
+    while True:
+        snapshot = PageSnapshot.capture(driver)
+        if condition(snapshot):
+            return snapshot
+        if time.time() + poll_frequency > time_stop:
+            return None
+        time.sleep(poll_frequency)
+
+
 def swipe_screen(driver, start_x_p, end_x_p, start_y_p, end_y_p, duration=1000):
     """
     Swipe from start point to end point
@@ -73,6 +150,7 @@ def swipe_screen(driver, start_x_p, end_x_p, start_y_p, end_y_p, duration=1000):
     :param duration: time to take the swipe, in ms
     :return: None
     """
+    # The window size is cached by the session driver
     size = driver.get_window_size()
     start_x = int(size['width'] * start_x_p)
     end_x = int(size['width'] * end_x_p)
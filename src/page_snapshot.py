@@ -0,0 +1,140 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+import re
+import time
+import xml.etree.ElementTree as ElementTree
+
+try:
+    from lxml import etree
+except ImportError:
+    # lxml is optional, the XPath subset supported by ElementTree covers the locators of this tool
+    etree = None
+
+BOUNDS_PATTERN = re.compile(r'\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]')
+
+# Compiled XPath locators shared by all snapshots
+_compiled_locators = {}
+
+
+def compile_locator(locator):
+    """
+    Compile the XPath locator once for local evaluation against page sources
+    :param locator: Locator or XPATH locator of the element
+    :return: Function taking the root of a page source and returning the list of matched nodes
+    """
+    locator = str(locator)
+    compiled = _compiled_locators.get(locator)
+    if compiled is None:
+        if etree is not None:
+            compiled = etree.XPath(locator)
+        else:
+            path = '.' + locator if locator.startswith('/') else locator
+            compiled = lambda root: root.findall(path)
+        _compiled_locators[locator] = compiled
+    return compiled
+
+
+class ElementState:
+    """
+    The class is used to define the state of an element found in a page snapshot
+    """
+
+    def __init__(self, attributes):
+        """
+        Initialize the ElementState object
+        :param attributes: Attributes of the element node from page source
+        """
+        self.attributes = dict(attributes)
+
+    @property
+    def displayed(self):
+        return self.attributes.get('displayed', 'true') == 'true'
+
+    @property
+    def bounds(self):
+        """
+        Bounds of the element on screen
+        :return: Tuple of (left, top, right, bottom), None if unknown
+        """
+        m = BOUNDS_PATTERN.match(self.attributes.get('bounds', ''))
+        return tuple(int(v) for v in m.groups()) if m else None
+
+    @property
+    def center(self):
+        """
+        Center point of the element on screen
+        :return: Tuple of (x, y), None if unknown
+        """
+        bounds = self.bounds
+        return ((bounds[0] + bounds[2]) // 2, (bounds[1] + bounds[3]) // 2) if bounds else None
+
+
+class PageSnapshot:
+    """
+    The class is used to define a snapshot of the whole UI hierarchy fetched by one page source request, against
+    which many locators are evaluated locally instead of one server side XPath query per locator
+    """
+
+    def __init__(self, page_source, captured_at=None):
+        """
+        Initialize the PageSnapshot object
+        :param page_source: UI hierarchy XML returned by driver.page_source
+        :param captured_at: Time when the page source was fetched
+        """
+        data = page_source.encode('utf-8')
+        self.root = etree.fromstring(data) if etree is not None else ElementTree.fromstring(data)
+        self.captured_at = captured_at if captured_at is not None else time.time()
+
+    @staticmethod
+    def capture(driver):
+        """
+        Fetch the page source once and build a snapshot of it
+        :param driver: WebDriver instance to control application objects
+        :return: PageSnapshot
+        """
+        return PageSnapshot(driver.page_source, time.time())
+
+    def find_all(self, locator):
+        """
+        Find all elements matching the locator
+        :param locator: Locator or XPATH locator of the element
+        :return: List of ElementState
+        """
+        return [ElementState(node.attrib) for node in compile_locator(locator)(self.root)]
+
+    def find(self, locator):
+        """
+        Find the first displayed element matching the locator
+        :param locator: Locator or XPATH locator of the element
+        :return: ElementState, None if no element is displayed
+        """
+        return next((element for element in self.find_all(locator) if element.displayed), None)
+
+    def is_present(self, locator):
+        """
+        Verify if the element is visible in the snapshot
+        :param locator: Locator or XPATH locator of the element
+        :return: Boolean
+        """
+        return self.find(locator) is not None
+
+    def evaluate(self, locators):
+        """
+        Resolve many locators in one pass
+        :param locators: List of Locator or XPATH locators
+        :return: Dictionary of ElementState (None if not visible) keyed by locator
+        """
+        return {locator: self.find(locator) for locator in locators}
@@ -0,0 +1,50 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+Steps of a phase. A phase which waits, e.g. for the provisioner to boot, is written as a generator which runs its
+blocking calls and yields the time in seconds to wait before it is resumed. run_steps() sleeps the waits in the calling
+thread, while the async engine (src/async_engine.py) runs the calls between two waits in its thread pool and awaits
+the waits on its event loop, so that both run the same phase. Steps yield 0 between the polls of a long loop, e.g. the
+refreshes of Alexa App, to let the engine run the calls of other benches
+"""
+
+import time
+
+
+def run_steps(steps):
+    """
+    Run the steps in the calling thread
+    :param steps: Generator of the steps
+    :return: Value returned by the generator
+    """
+    try:
+        delay = next(steps)
+        while True:
+            if delay > 0:
+                time.sleep(delay)
+            delay = next(steps)
+    except StopIteration as e:
+        return e.value
+
+
+def steps_of(func, *args, **kwargs):
+    """
+    Steps of a blocking function without waits, which runs as one step
+    :param func: Function to call
+    :return: Generator returning the value returned by the function
+    """
+    return func(*args, **kwargs)
+    # The function is a generator by the unreachable yield
+    yield
@@ -0,0 +1,181 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from urllib.request import Request, urlopen
+
+from src.alexa_app_page_objects import SLEEP_TIME_BEFORE_PROVISIONER_POWER_ON_IN_SECOND, PLUG_STATE_ON, \
+    PLUG_STATE_OFF, PLUG_STATE_UNKNOWN
+from src.phase_steps import run_steps
+
+# URL templates of the relay API, "URL" is replaced with the url of the plug
+RELAY_ON_URL_TEMP = 'URL/on'
+RELAY_OFF_URL_TEMP = 'URL/off'
+RELAY_STATE_URL_TEMP = 'URL/state'
+TIMEOUT_RELAY_REQUEST_IN_SECOND = 5
+
+
+class PowerController(ABC):
+    """
+    The class is used to define how the plugs powering DUT and provisioner are switched, subclasses implement a
+    specific backend
+    """
+
+    @abstractmethod
+    def power_on(self, name_of_plug):
+        """
+        Power on the plug, which should be in power off mode, so that the device is actually powered on by the call
+        :param name_of_plug: Name of the plug
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def power_off(self, name_of_plug):
+        """
+        Power off the plug, do nothing if it is in power off mode already
+        :param name_of_plug: Name of the plug
+        """
+        raise NotImplementedError
+
+    def power_off_and_on(self, name_of_plug, off_time=SLEEP_TIME_BEFORE_PROVISIONER_POWER_ON_IN_SECOND,
+                         off_steps=None):
+        """
+        Power cycle the plug
+        :param name_of_plug: Name of the plug
+        :param off_time: Time in seconds to keep the plug off
+        :param off_steps: Steps keeping the plug off instead of waiting off_time, see src/phase_steps.py
+        """
+        run_steps(self.power_off_and_on_steps(name_of_plug, off_time, off_steps))
+
+    def power_off_and_on_steps(self, name_of_plug, off_time=SLEEP_TIME_BEFORE_PROVISIONER_POWER_ON_IN_SECOND,
+                               off_steps=None):
+        """
+        Steps of power_off_and_on(), see src/phase_steps.py
+        """
+        self.power_off(name_of_plug)
+        if off_steps:
+            yield from off_steps
+        else:
+            yield off_time
+        self.power_on(name_of_plug)
+
+    def return_to_devices_page(self):
+        """
+        Bring Alexa App back to "Devices" page if switching a plug navigated away from it
+        """
+        pass
+
+
+class AlexaAppPowerController(PowerController):
+    """
+    The class is used to switch plugs by their pages on Alexa App
+    """
+
+    def __init__(self, alexa_pages):
+        """
+        Initialize the AlexaAppPowerController object
+        :param alexa_pages: AlexaAppPageObjects instance on "Devices" page
+        """
+        self.alexa_pages = alexa_pages
+
+    def power_on(self, name_of_plug):
+        self.alexa_pages.power_on_plug(name_of_plug)
+
+    def power_off(self, name_of_plug):
+        self.alexa_pages.power_off_plug(name_of_plug)
+
+    def power_off_and_on_steps(self, name_of_plug, off_time=SLEEP_TIME_BEFORE_PROVISIONER_POWER_ON_IN_SECOND,
+                               off_steps=None):
+        return self.alexa_pages.power_off_and_on_plug_steps(name_of_plug, off_time, off_steps)
+
+    def return_to_devices_page(self):
+        self.alexa_pages.click_navigate_back_from_plug_device_page()
+
+
+class HttpRelayPowerController(PowerController):
+    """
+    The class is used to switch locally controllable plugs or relays by their HTTP API on LAN, without Alexa App
+    """
+
+    def __init__(self, plug_urls, on_url_temp=RELAY_ON_URL_TEMP, off_url_temp=RELAY_OFF_URL_TEMP,
+                 state_url_temp=RELAY_STATE_URL_TEMP, timeout=TIMEOUT_RELAY_REQUEST_IN_SECOND):
+        """
+        Initialize the HttpRelayPowerController object
+        :param plug_urls: Dictionary of plug urls keyed by plug name
+        :param on_url_temp: URL template to power on a plug, "URL" is replaced with the url of the plug
+        :param off_url_temp: URL template to power off a plug
+        :param state_url_temp: URL template to get the state of a plug, which responds {"state": "on"|"off"} or
+        {"ison": true|false}
+        :param timeout: Timeout of each request in seconds
+        """
+        self.plug_urls = plug_urls
+        self.on_url_temp = on_url_temp
+        self.off_url_temp = off_url_temp
+        self.state_url_temp = state_url_temp
+        self.timeout = timeout
+
+    def power_on(self, name_of_plug):
+        state = self.get_state(name_of_plug)
+        assert state == PLUG_STATE_OFF, f'Plug "{name_of_plug}" should be off before it is powered on, it is {state}'
+        self._switch(name_of_plug, self.on_url_temp, PLUG_STATE_ON)
+
+    def power_off(self, name_of_plug):
+        self._switch(name_of_plug, self.off_url_temp, PLUG_STATE_OFF)
+
+    def get_state(self, name_of_plug):
+        """
+        Get the state of the plug
+        :param name_of_plug: Name of the plug
+        :return: String, one of PLUG_STATE_ON, PLUG_STATE_OFF and PLUG_STATE_UNKNOWN
+        """
+        status = self._request(name_of_plug, self.state_url_temp)
+        if "state" in status:
+            return status["state"] if status["state"] in (PLUG_STATE_ON, PLUG_STATE_OFF) else PLUG_STATE_UNKNOWN
+        if "ison" in status:
+            return PLUG_STATE_ON if status["ison"] else PLUG_STATE_OFF
+        return PLUG_STATE_UNKNOWN
+
+    def _switch(self, name_of_plug, url_temp, expected_state):
+        logging.info(f'[Relay] Switching plug "{name_of_plug}" {expected_state}')
+        time_start = time.time()
+        self._request(name_of_plug, url_temp, method='POST')
+        state = self.get_state(name_of_plug)
+        assert state == expected_state, f'Cannot switch plug "{name_of_plug}" {expected_state}, it is {state}'
+        logging.info(f'[Relay] Plug "{name_of_plug}" is {state} in {(time.time() - time_start) * 1000:.0f} ms')
+
+    def _request(self, name_of_plug, url_temp, method='GET'):
+        assert name_of_plug in self.plug_urls, f'No relay url is configured for plug "{name_of_plug}"'
+        request = Request(url_temp.replace('URL', self.plug_urls[name_of_plug].rstrip('/')), method=method)
+        with urlopen(request, timeout=self.timeout) as response:
+            body = response.read().decode('utf-8')
+        return json.loads(body) if body else {}
+
+
+def load_power_controller(config_file):
+    """
+    Load the power controller from a json config file as below, the url templates are optional
+    {"plugs": {"First plug": "http://192.168.1.20:8080/plugs/1", "Second plug": "http://192.168.1.21:8080/plugs/2"},
+     "on_url_temp": "URL/on", "off_url_temp": "URL/off", "state_url_temp": "URL/state"}
+    :param config_file: Path of the config file, None to switch plugs on Alexa App
+    :return: HttpRelayPowerController, None if config file is not given
+    """
+    if not config_file:
+        return None
+    with open(config_file) as f:
+        config = json.load(f)
+    return HttpRelayPowerController(config.pop("plugs"), **config)
@@ -0,0 +1,245 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+import errno
+import logging
+import socket
+import time
+from abc import ABC, abstractmethod
+
+from src.phase_steps import run_steps
+
+INTERVAL_READINESS_PROBE_IN_SECOND = 2
+TIMEOUT_TCP_PROBE_IN_SECOND = 1
+# Time to wait after the provisioner is detected online, for its setup services to come up
+SLEEP_TIME_AFTER_PROVISIONER_ONLINE_IN_SECOND = 5
+# Bounds of the time to keep the provisioner off during a power cycle
+MIN_TIME_PROVISIONER_OFF_IN_SECOND = 2
+DEFAULT_PROVISIONER_PROBE_PORT = 80
+
+
+class ReadinessProbe(ABC):
+    """
+    The class is used to define a check whether the provisioner/commissioner is online
+    """
+
+    name = 'probe'
+
+    def reset(self):
+        """
+        Forget the states observed before, called when the provisioner is powered off
+        """
+        pass
+
+    @abstractmethod
+    def is_ready(self):
+        """
+        Check whether the provisioner is online
+        :return: Boolean
+        """
+        raise NotImplementedError
+
+
+class TcpReachabilityProbe(ReadinessProbe):
+    """
+    The class is used to check whether the provisioner is reachable on LAN by a TCP connection, a refused connection
+    also proves that the provisioner is up. It is only taken as ready once it has been seen unreachable since the power
+    cycle, as a host which never drops off (e.g. a wrong host, or another host answering for it) cannot tell the boot
+    """
+
+    name = 'lan'
+
+    def __init__(self, host, port=DEFAULT_PROVISIONER_PROBE_PORT, timeout=TIMEOUT_TCP_PROBE_IN_SECOND):
+        """
+        Initialize the TcpReachabilityProbe object
+        :param host: IP address or host name of the provisioner
+        :param port: Any TCP port of the provisioner
+        :param timeout: Timeout of the connection in seconds
+        """
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.seen_offline = False
+
+    def reset(self):
+        self.seen_offline = False
+
+    def is_reachable(self):
+        """
+        Check whether the provisioner is reachable on LAN, and remember if it is not
+        :return: Boolean
+        """
+        try:
+            with socket.create_connection((self.host, self.port), self.timeout):
+                reachable = True
+        except ConnectionRefusedError:
+            reachable = True
+        except OSError as e:
+            reachable = e.errno == errno.ECONNREFUSED
+        self.seen_offline = self.seen_offline or not reachable
+        return reachable
+
+    def is_ready(self):
+        return self.is_reachable() and self.seen_offline
+
+
+class AlexaAppOnlineProbe(ReadinessProbe):
+    """
+    The class is used to check whether the provisioner is online by its device page on Alexa App. Alexa App might
+    show the provisioner online for a while after it is powered off, so it is only taken as ready once it has been
+    seen offline since the power cycle
+    """
+
+    name = 'alexa_app'
+
+    def __init__(self, device, name_of_provisioner):
+        """
+        Initialize the AlexaAppOnlineProbe object
+        :param device: Device instance whose appium session is used, it should reuse its appium session
+        :param name_of_provisioner: Name of the provisioner displayed on Alexa App
+        """
+        self.device = device
+        self.name_of_provisioner = name_of_provisioner
+        self.seen_offline = False
+
+    def reset(self):
+        self.seen_offline = False
+
+    def is_ready(self):
+        with self.device.alexa_app_pages_context() as alexa_pages:
+            online = alexa_pages.is_smart_device_online(self.name_of_provisioner)
+        self.seen_offline = self.seen_offline or not online
+        return online and self.seen_offline
+
+
+def is_provisioner_ready(probes):
+    """
+    Check the provisioner by all probes, a failing probe is logged and taken as not ready
+    :param probes: List of ReadinessProbe
+    :return: Boolean
+    """
+    for probe in probes:
+        try:
+            if not probe.is_ready():
+                return False
+        except Exception as e:
+            logging.debug(f'Readiness probe "{probe.name}" failed: {type(e).__name__}:{e}')
+            return False
+    return True
+
+
+def is_seen_offline(probes):
+    """
+    Check that the LAN probes have seen the provisioner offline since its power cycle, otherwise its boot cannot be
+    detected by them
+    :param probes: List of ReadinessProbe, the ones other than TcpReachabilityProbe are not checked
+    :return: Boolean, False is logged as a warning
+    """
+    unseen = [f'{p.host}:{p.port}' for p in probes if isinstance(p, TcpReachabilityProbe) and not p.seen_offline]
+    if unseen:
+        logging.warning(f'The provisioner/commissioner is never seen offline at {", ".join(unseen)} during its power '
+                        f'cycle, the probe cannot detect its boot and the fixed wait is used')
+    return not unseen
+
+
+def is_provisioner_offline(probes):
+    """
+    Check whether any LAN probe cannot reach the provisioner
+    :param probes: List of TcpReachabilityProbe
+    :return: Boolean
+    """
+    return not all(probe.is_reachable() for probe in probes)
+
+
+def wait_for_provisioner_ready(probes, time_power_on, timeout, interval=INTERVAL_READINESS_PROBE_IN_SECOND):
+    """
+    Wait until all probes report the provisioner online, or timeout since it was powered on
+    :param probes: List of ReadinessProbe
+    :param time_power_on: Time when the provisioner was powered on
+    :param timeout: Upper bound of the wait in seconds since the provisioner was powered on
+    :param interval: Interval between probes in seconds
+    :return: Observed boot time in seconds, None if the provisioner is not detected online within timeout, or it is
+    never seen offline by the LAN probes, in both cases after the timeout
+    """
+    return run_steps(provisioner_ready_steps(probes, time_power_on, timeout, interval))
+
+
+def provisioner_ready_steps(probes, time_power_on, timeout, interval=INTERVAL_READINESS_PROBE_IN_SECOND):
+    """
+    Steps of wait_for_provisioner_ready(), see src/phase_steps.py
+    """
+    time_stop = time_power_on + timeout
+    if not is_seen_offline(probes):
+        yield max(time_stop - time.time(), 0)
+        return None
+    while time.time() < time_stop:
+        if is_provisioner_ready(probes):
+            boot_time = time.time() - time_power_on
+            logging.info(f'The provisioner/commissioner is online {boot_time:.2f} seconds after power on')
+            yield min(SLEEP_TIME_AFTER_PROVISIONER_ONLINE_IN_SECOND, max(time_stop - time.time(), 0))
+            return boot_time
+        yield min(interval, max(time_stop - time.time(), 0))
+    logging.warning(f'The provisioner/commissioner is not detected online within {timeout} seconds')
+    return None
+
+
+def wait_for_provisioner_offline(probes, max_time, min_time=MIN_TIME_PROVISIONER_OFF_IN_SECOND,
+                                 interval=INTERVAL_READINESS_PROBE_IN_SECOND / 2):
+    """
+    Keep the provisioner off until the probes report it offline, at least min_time and at most max_time
+    :param probes: List of TcpReachabilityProbe
+    :param max_time: Max time in seconds to keep it off
+    :param min_time: Min time in seconds to keep it off
+    :param interval: Interval between probes in seconds
+    :return: Boolean, False if it is not seen offline within max_time
+    """
+    return run_steps(provisioner_offline_steps(probes, max_time, min_time, interval))
+
+
+def provisioner_offline_steps(probes, max_time, min_time=MIN_TIME_PROVISIONER_OFF_IN_SECOND,
+                              interval=INTERVAL_READINESS_PROBE_IN_SECOND / 2):
+    """
+    Steps of wait_for_provisioner_offline(), see src/phase_steps.py
+    """
+    time_start = time.time()
+    yield min_time
+    while time.time() - time_start < max_time:
+        if is_provisioner_offline(probes):
+            logging.info(f'The provisioner/commissioner is offline {time.time() - time_start:.2f} seconds after '
+                         f'power off')
+            return True
+        yield min(interval, max(max_time - (time.time() - time_start), 0))
+    logging.warning(f'The provisioner/commissioner is not seen offline within {max_time} seconds after power off')
+    return False
+
+
+def get_provisioner_probes(device, provisioner_host=None, probe_port=None, probe_alexa_app=False):
+    """
+    Build the readiness probes of the provisioner of the device
+    :param device: Device instance of the bench under test
+    :param provisioner_host: IP address or host name of the provisioner to probe on LAN
+    :param probe_port: TCP port to probe on LAN, DEFAULT_PROVISIONER_PROBE_PORT if not given
+    :param probe_alexa_app: Also check that the provisioner is online on Alexa App, which needs the appium session of
+    the device to be reused, as every probe would start a new session otherwise
+    :return: List of ReadinessProbe, empty to fall back to the fixed wait
+    """
+    assert not probe_alexa_app or device.alexa_app.reuse_session, \
+        'Probing the provisioner on Alexa App needs a reused appium session, e.g. by --reuse_appium_session'
+    probes = []
+    if provisioner_host:
+        probes.append(TcpReachabilityProbe(provisioner_host, probe_port or DEFAULT_PROVISIONER_PROBE_PORT))
+    if probe_alexa_app:
+        probes.append(AlexaAppOnlineProbe(device, device.names[1]))
+    return probes
@@ -0,0 +1,117 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+import argparse
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote
+
+
+class RelayStubServer:
+    """
+    The class is used to define a local HTTP relay server which keeps plug states in memory, serving the relay API of
+    HttpRelayPowerController for tests without real plugs
+    """
+
+    def __init__(self, plugs, host='127.0.0.1', port=0):
+        """
+        Initialize the RelayStubServer object
+        :param plugs: Dictionary of initial plug states ("on" or "off") keyed by plug name
+        :param host: Host to listen on
+        :param port: Port to listen on, a free port if 0
+        """
+        self.states = dict(plugs)
+        self.transitions = []
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def plug_urls(self):
+        """
+        Urls of the plugs for HttpRelayPowerController
+        :return: Dictionary of plug urls keyed by plug name
+        """
+        return {name: f'{self.url}/plugs/{quote(name)}' for name in self.states}
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='relay-stub-server', daemon=True)
+        self._thread.start()
+        logging.info(f'Relay stub server is up on {self.url}')
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _handler_class(self):
+        server = self
+
+        class RelayRequestHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                self._handle()
+
+            def do_POST(self):
+                self._handle()
+
+            def _handle(self):
+                parts = self.path.strip('/').split('/')
+                if len(parts) != 3 or parts[0] != 'plugs' or unquote(parts[1]) not in server.states:
+                    self.send_error(404)
+                    return
+                name, command = unquote(parts[1]), parts[2]
+                with server._lock:
+                    if command in ('on', 'off'):
+                        if server.states[name] != command:
+                            server.transitions.append((time.time(), name, command))
+                        server.states[name] = command
+                    elif command != 'state':
+                        self.send_error(404)
+                        return
+                    body = json.dumps({"state": server.states[name]}).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logging.debug(f'[Relay stub] {format % args}')
+
+        return RelayRequestHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local HTTP relay stub server keeping plug states in memory')
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on')
+    parser.add_argument('--plug', action='append', default=[], help='Name of a plug, initially off')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+    server = RelayStubServer({name: 'off' for name in args.plug}, port=args.port)
+    logging.info(f'Plug urls: {json.dumps(server.plug_urls())}')
+    server.httpd.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
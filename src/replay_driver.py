@@ -0,0 +1,282 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+import re
+import time
+from collections import Counter
+
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.remote.command import Command
+from src.locators import MobileBy
+from src.page_snapshot import PageSnapshot
+
+# Text of the element to scroll into view from a UiScrollable selector
+UI_SCROLLABLE_TEXT_PATTERN = re.compile(r'scrollIntoView\(new UiSelector\(\)\.text\("(.*?)"\)')
+UI_SELECTOR_METHOD_PATTERN = re.compile(r'\.(\w+)\("(.*?)"\)')
+# Attributes of the page source matched by UiSelector methods
+UI_SELECTOR_ATTRIBUTES = {
+    'text': 'text',
+    'description': 'content-desc',
+    'resourceId': 'resource-id'
+}
+
+
+def ui_selector_to_xpath(selector):
+    """
+    Translate a UiSelector of exact matches to XPath
+    :param selector: UiSelector, e.g. 'new UiSelector().className("android.widget.Switch").text("on")'
+    :return: XPATH locator
+    """
+    tag = '*'
+    predicates = ''
+    for method, value in UI_SELECTOR_METHOD_PATTERN.findall(selector):
+        if method == 'className':
+            tag = value
+        elif method in UI_SELECTOR_ATTRIBUTES:
+            predicates += f'[@{UI_SELECTOR_ATTRIBUTES[method]}="{value}"]'
+        else:
+            raise NotImplementedError(f'UiSelector method "{method}" is not supported by replay driver')
+    return f'//{tag}{predicates}'
+
+
+class ReplayTransition:
+    """
+    The class is used to define a scripted transition from one recorded screen to another
+    """
+
+    def __init__(self, screen, to, on, locator=None, times=1, after=None):
+        """
+        Initialize the ReplayTransition object
+        :param screen: Name of the screen the transition starts from
+        :param to: Name of the screen the transition goes to
+        :param on: Trigger of the transition, one of "click", "swipe", "back" and "time"
+        :param locator: Locator or XPATH locator of the element whose click triggers the transition, for "click"
+        trigger
+        :param times: Num of triggers on the screen needed to fire the transition
+        :param after: Seconds after entering the screen to fire the transition, for "time" trigger
+        """
+        self.screen = screen
+        self.to = to
+        self.on = on
+        self.locator = locator
+        self.times = times
+        self.after = after
+
+
+class ReplayElement:
+    """
+    The class is used to define an element found on a recorded screen, implementing the subset of WebElement API
+    used by this tool
+    """
+
+    def __init__(self, driver, state, locator):
+        self._driver = driver
+        self._state = state
+        self._locator = locator
+
+    @property
+    def text(self):
+        self._driver.execute('getElementText')
+        return self._state.attributes.get('text', '')
+
+    @property
+    def rect(self):
+        self._driver.execute('getElementRect')
+        left, top, right, bottom = self._state.bounds or (0, 0, 0, 0)
+        return {'x': left, 'y': top, 'width': right - left, 'height': bottom - top}
+
+    def get_attribute(self, name):
+        self._driver.execute('getElementAttribute')
+        return self._state.attributes.get(name)
+
+    def is_displayed(self):
+        self._driver.execute('isElementDisplayed')
+        return self._state.displayed
+
+    def click(self):
+        self._driver.execute('clickElement')
+        self._driver.trigger('click', self._state)
+
+
+class ReplayDriver:
+    """
+    The class is used to define a fake WebDriver which replays recorded UI hierarchy XML snapshots with scripted
+    transitions and configurable latency, counting every command as a driver round trip
+    """
+
+    def __init__(self, screens, initial_screen, transitions=(), latency=0.0, window_size=(1080, 2340)):
+        """
+        Initialize the ReplayDriver object
+        :param screens: Dictionary of recorded UI hierarchy XML keyed by screen name
+        :param initial_screen: Name of the screen to start from
+        :param transitions: List of ReplayTransition
+        :param latency: Latency of each command in seconds, or dictionary of latency keyed by command name
+        :param window_size: Tuple of (width, height) of the screen
+        """
+        self.screens = {name: PageSnapshot(source) for name, source in screens.items()}
+        self.sources = dict(screens)
+        self.transitions = list(transitions)
+        self.latency = latency
+        self.window_size = window_size
+        self.session_id = 'replay'
+        self.commands = Counter()
+        self.screen_history = []
+        self._enter_screen(initial_screen)
+
+    @property
+    def round_trips(self):
+        return sum(self.commands.values())
+
+    def execute(self, name, params=None):
+        """
+        Count the command and simulate its latency, like WebDriver.execute() sending a command to appium server
+        :param name: Name of the command
+        :param params: Parameters of the command, unused
+        """
+        self.commands[name] += 1
+        latency = self.latency.get(name, 0.0) if isinstance(self.latency, dict) else self.latency
+        if latency:
+            time.sleep(latency)
+        self._fire_timed_transitions()
+        if name == Command.W3C_ACTIONS:
+            self._perform_actions(params["actions"])
+
+    def _perform_actions(self, sources):
+        """
+        Replay the pointer actions of a W3C actions command, a press released where it started is a tap and the
+        others are swipes
+        :param sources: Input sources of the W3C actions command
+        """
+        for source in sources:
+            pressed_at = position = None
+            for action in source.get("actions", []):
+                if action["type"] == "pointerMove":
+                    position = (action["x"], action["y"])
+                elif action["type"] == "pointerDown":
+                    pressed_at = position
+                elif action["type"] == "pointerUp" and pressed_at is not None:
+                    if position == pressed_at:
+                        self._tap_at(*position)
+                    else:
+                        self._drag(*pressed_at, *position)
+                    pressed_at = None
+
+    def trigger(self, on, state=None):
+        """
+        Fire the first transition of the current screen matching the trigger
+        :param on: Trigger of the transition, one of "click", "swipe" and "back"
+        :param state: ElementState of the clicked element for "click" trigger
+        """
+        for transition in self.transitions:
+            if transition.screen != self.screen or transition.on != on:
+                continue
+            if on == 'click' and state.attributes not in \
+                    [e.attributes for e in self.screens[self.screen].find_all(transition.locator)]:
+                continue
+            self._triggers[id(transition)] += 1
+            if self._triggers[id(transition)] >= transition.times:
+                self._enter_screen(transition.to)
+            return
+
+    def _enter_screen(self, screen):
+        assert screen in self.screens, f'Unknown screen "{screen}"'
+        self.screen = screen
+        self.screen_history.append(screen)
+        self._entered_at = time.time()
+        self._triggers = Counter()
+
+    def _fire_timed_transitions(self):
+        for transition in self.transitions:
+            if transition.screen == self.screen and transition.on == 'time' and \
+                    time.time() - self._entered_at >= transition.after:
+                self._enter_screen(transition.to)
+                return
+
+    def _snapshot(self):
+        return self.screens[self.screen]
+
+    def find_elements(self, by=By.XPATH, value=None):
+        self.execute('findElements')
+        return self._find(by, value)
+
+    def find_element(self, by=By.XPATH, value=None):
+        self.execute('findElement')
+        elements = self._find(by, value)
+        if not elements:
+            raise NoSuchElementException(f'No element found by {by}: {value}')
+        return elements[0]
+
+    def _find(self, by, value):
+        if by == By.XPATH:
+            locator = value
+        elif by == MobileBy.ACCESSIBILITY_ID:
+            locator = f'//*[@content-desc="{value}"]'
+        elif by == By.ID:
+            locator = f'//*[@resource-id="{value}"]'
+        elif by == MobileBy.ANDROID_UIAUTOMATOR and UI_SCROLLABLE_TEXT_PATTERN.search(value):
+            # Scrolling is instant on recorded screens, the element is found if it is on the screen
+            locator = f'//*[@text="{UI_SCROLLABLE_TEXT_PATTERN.search(value).group(1)}"]'
+        elif by == MobileBy.ANDROID_UIAUTOMATOR:
+            locator = ui_selector_to_xpath(value)
+        else:
+            raise NotImplementedError(f'Locator strategy "{by}" is not supported by replay driver')
+        return [ReplayElement(self, state, locator) for state in self._snapshot().find_all(locator)]
+
+    @property
+    def page_source(self):
+        self.execute('getPageSource')
+        return self.sources[self.screen]
+
+    def get_window_size(self):
+        self.execute('getWindowSize')
+        return {'width': self.window_size[0], 'height': self.window_size[1]}
+
+    def swipe(self, start_x, start_y, end_x, end_y, duration=0):
+        self.execute('swipe')
+        self._drag(start_x, start_y, end_x, end_y)
+        return self
+
+    def _drag(self, start_x, start_y, end_x, end_y):
+        # Recorded screens do not scroll, any drag is a swipe trigger
+        self.trigger('swipe')
+
+    def tap(self, positions, duration=None):
+        self.execute('tap')
+        self._tap_at(*positions[0])
+        return self
+
+    def _tap_at(self, x, y):
+        # The smallest element containing the point is the one tapped
+        hits = [e for e in self._snapshot().find_all('//*')
+                if e.bounds and e.bounds[0] <= x < e.bounds[2] and e.bounds[1] <= y < e.bounds[3]]
+        if hits:
+            self.trigger('click', min(hits, key=lambda e: (e.bounds[2] - e.bounds[0]) * (e.bounds[3] - e.bounds[1])))
+
+    def back(self):
+        self.execute('back')
+        self.trigger('back')
+
+    @property
+    def current_package(self):
+        self.execute('getCurrentPackage')
+        return 'com.amazon.dee.app'
+
+    def activate_app(self, app_id):
+        self.execute('activateApp')
+        return self
+
+    def quit(self):
+        self.execute('deleteSession')
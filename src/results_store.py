@@ -0,0 +1,360 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+Results store of rounds across runs, benches and firmware versions, backed by a local SQLite database in WAL mode.
+Rounds are queued by the test and written in batches by a background writer, so that storing a result never delays a
+timed phase. Percentiles are calculated by window functions, which need SQLite 3.25 or later.
+
+Query and export the stored rounds, e.g. p95 setup time per firmware over the last 10000 rounds
+python -m src.results_store --results_db=results.db percentiles --group_by=firmware --percentile=95 --last=10000
+python -m src.results_store --results_db=results.db export --output=rounds.csv --firmware=1.2.3
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+from src.certification_round import ROUND_PHASES
+
+SCHEMA_VERSION = 3
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS rounds (
+        id INTEGER PRIMARY KEY,
+        run_id TEXT NOT NULL,
+        round_id TEXT,
+        bench TEXT,
+        ffs_type TEXT,
+        name_of_dut TEXT,
+        firmware TEXT,
+        round_index INTEGER,
+        started_at REAL,
+        passed INTEGER NOT NULL,
+        setup_time REAL,
+        discovery_delay REAL,
+        provisioner_boot_time REAL,
+        failed_phase TEXT,
+        failure_category TEXT,
+        error TEXT
+    )''',
+    '''CREATE TABLE IF NOT EXISTS phase_timings (
+        round_id INTEGER NOT NULL REFERENCES rounds(id),
+        phase TEXT NOT NULL,
+        duration REAL NOT NULL,
+        retries INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (round_id, phase)
+    )''',
+    'CREATE INDEX IF NOT EXISTS rounds_by_firmware ON rounds(firmware, started_at)',
+    'CREATE INDEX IF NOT EXISTS rounds_by_dut ON rounds(ffs_type, name_of_dut, started_at)',
+    'CREATE INDEX IF NOT EXISTS rounds_by_bench ON rounds(bench, started_at)',
+    'CREATE INDEX IF NOT EXISTS rounds_by_time ON rounds(started_at)',
+    'CREATE INDEX IF NOT EXISTS rounds_by_round_id ON rounds(round_id)',
+    'CREATE INDEX IF NOT EXISTS phase_timings_by_phase ON phase_timings(phase, duration)'
+]
+# Statements upgrading a database of the previous schema version, keyed by the version they upgrade to
+MIGRATIONS = {
+    2: ['ALTER TABLE rounds ADD COLUMN round_id TEXT'],
+    3: ['ALTER TABLE rounds ADD COLUMN discovery_delay REAL']
+}
+ROUND_COLUMNS = ['run_id', 'round_id', 'bench', 'ffs_type', 'name_of_dut', 'firmware', 'round_index', 'started_at',
+                 'passed', 'setup_time', 'discovery_delay', 'provisioner_boot_time', 'failed_phase', 'failure_category',
+                 'error']
+# Columns to group percentiles by, and metrics to calculate them of besides the phases in ROUND_PHASES
+GROUP_BY_COLUMNS = ['firmware', 'bench', 'ffs_type', 'name_of_dut', 'run_id']
+ROUND_METRICS = ['setup_time', 'provisioner_boot_time']
+
+MAX_ROUNDS_PER_WRITE = 500
+INTERVAL_WRITER_FLUSH_IN_SECOND = 1
+TIMEOUT_DATABASE_LOCK_IN_SECOND = 30
+
+
+def connect(path):
+    """
+    Connect to the results database, the schema is created if it does not exist
+    :param path: Path of the database file
+    :return: sqlite3.Connection
+    """
+    conn = sqlite3.connect(path, timeout=TIMEOUT_DATABASE_LOCK_IN_SECOND)
+    # Readers do not block the writer and the other way around
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version < SCHEMA_VERSION:
+        with conn:
+            if version:
+                for statement in sum([MIGRATIONS[v] for v in range(version + 1, SCHEMA_VERSION + 1)], []):
+                    conn.execute(statement)
+            for statement in SCHEMA:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+    return conn
+
+
+class ResultsStore:
+    """
+    The class is used to store rounds to the results database by a background writer, which writes the queued rounds
+    in one transaction per batch
+    """
+
+    def __init__(self, path, run_id=None):
+        """
+        Initialize the ResultsStore object and start its writer
+        :param path: Path of the database file
+        :param run_id: Id of this run shared by all its rounds, made of the start time and process id if not given
+        """
+        self.path = path
+        self.run_id = run_id or f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}'
+        self.written = 0
+        self._queue = queue.Queue()
+        # The schema is created before the writer starts, so that a bad path fails the test at once
+        connect(path).close()
+        self._writer = threading.Thread(target=self._write, name='results-writer', daemon=True)
+        self._writer.start()
+
+    def add(self, result, bench=None, ffs_type=None, firmware=None, name_of_dut=None):
+        """
+        Queue the round to be written, it never blocks
+        :param result: RoundResult of the round
+        :param bench: Name of the bench
+        :param ffs_type: FFS protocol type of DUT, one of "ack", "bss", "wss", "zss" and "mss"
+        :param firmware: Firmware tag of DUT
+        :param name_of_dut: Name of DUT if the result does not name it
+        """
+        row = {
+            "run_id": self.run_id,
+            "round_id": result.round_id,
+            "bench": bench,
+            "ffs_type": ffs_type.lower() if ffs_type else None,
+            "name_of_dut": result.name_of_dut or name_of_dut,
+            "firmware": firmware,
+            "round_index": result.round_index,
+            "started_at": result.started_at,
+            "passed": int(result.passed),
+            "setup_time": result.setup_time,
+            "discovery_delay": result.discovery_delay,
+            "provisioner_boot_time": result.provisioner_boot_time,
+            "failed_phase": result.failed_phase,
+            "failure_category": result.failure_category,
+            "error": result.error
+        }
+        phases = [(phase, duration, result.retries.get(phase, 0)) for phase, duration in result.phase_timings.items()]
+        self._queue.put((row, phases))
+
+    def recorder(self, bench=None, ffs_type=None, firmware=None, name_of_dut=None):
+        """
+        Get a function to store the RoundResult of every round of one bench
+        :param bench: Name of the bench
+        :param ffs_type: FFS protocol type of DUT
+        :param firmware: Firmware tag of DUT
+        :param name_of_dut: Name of DUT if the results do not name it
+        :return: Function taking a RoundResult
+        """
+        return lambda result: self.add(result, bench, ffs_type, firmware, name_of_dut)
+
+    def flush(self):
+        """
+        Wait until all queued rounds are written
+        """
+        self._queue.join()
+
+    def close(self):
+        """
+        Write the queued rounds and stop the writer
+        """
+        self._queue.put(None)
+        self._writer.join()
+        logging.info(f'[Results] {self.written} rounds of run {self.run_id} are stored to "{self.path}"')
+
+    def _write(self):
+        conn = connect(self.path)
+        stopping = False
+        while not stopping:
+            items = [self._queue.get()]
+            # Rounds queued within the flush interval are written in the same transaction
+            time_stop = time.monotonic() + INTERVAL_WRITER_FLUSH_IN_SECOND
+            while items[-1] is not None and len(items) < MAX_ROUNDS_PER_WRITE:
+                try:
+                    items.append(self._queue.get(timeout=max(time_stop - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            stopping = items[-1] is None
+            rounds = [item for item in items if item is not None]
+            try:
+                with conn:
+                    for row, phases in rounds:
+                        cursor = conn.execute(f'INSERT INTO rounds ({", ".join(ROUND_COLUMNS)}) VALUES '
+                                              f'({", ".join("?" * len(ROUND_COLUMNS))})',
+                                              [row[column] for column in ROUND_COLUMNS])
+                        conn.executemany('INSERT INTO phase_timings (round_id, phase, duration, retries) '
+                                         'VALUES (?, ?, ?, ?)', [(cursor.lastrowid, *phase) for phase in phases])
+                self.written += len(rounds)
+            except sqlite3.Error as e:
+                logging.error(f'[Results] Failed to store {len(rounds)} rounds to "{self.path}": {e}')
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+        conn.close()
+
+
+def _filters(firmware=None, bench=None, ffs_type=None, name_of_dut=None, since=None):
+    conditions, params = [], []
+    for column, value in [('firmware', firmware), ('bench', bench), ('ffs_type', ffs_type and ffs_type.lower()),
+                          ('name_of_dut', name_of_dut)]:
+        if value is not None:
+            conditions.append(f'{column} = ?')
+            params.append(value)
+    if since is not None:
+        conditions.append('started_at >= ?')
+        params.append(since)
+    return conditions, params
+
+
+def query_rounds(conn, columns, **filters):
+    """
+    Query the columns of the rounds matching the filters in the order they started
+    :param conn: Connection to the results database
+    :param columns: List of ROUND_COLUMNS to query
+    :param filters: Filters of firmware, bench, ffs_type, name_of_dut and since (epoch time)
+    :return: Cursor of the rows
+    """
+    unknown = [column for column in columns if column not in ROUND_COLUMNS]
+    assert not unknown, f'Unknown column(s) {unknown}, columns are {ROUND_COLUMNS}'
+    conditions, params = _filters(**filters)
+    where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+    return conn.execute(f'SELECT {", ".join(columns)} FROM rounds {where} ORDER BY started_at', params)
+
+
+def query_percentiles(conn, metric='setup_time', group_by='firmware', percentile=95, last=None, **filters):
+    """
+    Calculate the percentile of a metric of the passed rounds per group by nearest rank
+    :param conn: Connection to the results database
+    :param metric: One of ROUND_METRICS, or a phase in ROUND_PHASES
+    :param group_by: One of GROUP_BY_COLUMNS
+    :param percentile: Percentile between 0 and 100
+    :param last: Only the latest num of rounds matching the filters are included, all of them if not given
+    :param filters: Filters of firmware, bench, ffs_type, name_of_dut and since (epoch time)
+    :return: List of dictionaries of group, rounds, min, percentile, max, e.g. {"firmware": "1.2.3", "rounds": 1000,
+    "min": 40.1, "p95": 61.5, "max": 75.0}
+    """
+    phases = [phase for phase, _ in ROUND_PHASES]
+    assert metric in ROUND_METRICS + phases, f'Unknown metric "{metric}", one of {ROUND_METRICS + phases}'
+    assert group_by in GROUP_BY_COLUMNS, f'Unknown column to group by "{group_by}", one of {GROUP_BY_COLUMNS}'
+    assert 0 < percentile <= 100, 'Percentile should be between 0 and 100'
+    conditions, params = _filters(**filters)
+    conditions.append('passed = 1')
+    if metric in ROUND_METRICS:
+        source = f'SELECT {group_by} AS grp, {metric} AS value, started_at FROM rounds'
+        conditions.append(f'{metric} IS NOT NULL')
+    else:
+        source = 'SELECT rounds.{0} AS grp, duration AS value, started_at FROM rounds ' \
+                 'JOIN phase_timings ON phase_timings.round_id = rounds.id AND phase = ?'.format(group_by)
+        params.insert(0, metric)
+    sql = f'''
+        WITH recent AS (
+            {source} WHERE {" AND ".join(conditions)} ORDER BY started_at DESC {"LIMIT ?" if last else ""}
+        ), ranked AS (
+            SELECT grp, value, ROW_NUMBER() OVER (PARTITION BY grp ORDER BY value) AS position,
+                   COUNT(*) OVER (PARTITION BY grp) AS n
+            FROM recent
+        )
+        SELECT grp, n, MIN(value), MIN(CASE WHEN position * 100 >= ? * n THEN value END), MAX(value)
+        FROM ranked GROUP BY grp ORDER BY grp'''
+    params += ([last] if last else []) + [percentile]
+    return [{group_by: grp, "rounds": n, "min": low, f'p{percentile:g}': value, "max": high}
+            for grp, n, low, value, high in conn.execute(sql, params)]
+
+
+def export_rounds(conn, output, **filters):
+    """
+    Export the rounds with their phase timings to a CSV or JSONL file by the extension of the file
+    :param conn: Connection to the results database
+    :param output: Path of the file, "-" to write CSV to stdout
+    :param filters: Filters of firmware, bench, ffs_type, name_of_dut and since (epoch time)
+    :return: Num of rounds exported
+    """
+    conditions, params = _filters(**filters)
+    where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+    phases = [phase for phase, _ in ROUND_PHASES]
+    phase_columns = ', '.join(f"MAX(CASE WHEN phase = '{phase}' THEN duration END)" for phase in phases)
+    rows = conn.execute(f'SELECT {", ".join("rounds." + c for c in ROUND_COLUMNS)}, {phase_columns} FROM rounds '
+                        f'LEFT JOIN phase_timings ON phase_timings.round_id = rounds.id {where} '
+                        f'GROUP BY rounds.id ORDER BY started_at', params)
+    columns = ROUND_COLUMNS + phases
+    f = open(output, 'w', newline='') if output != '-' else sys.stdout
+    count = 0
+    try:
+        if output.endswith('.jsonl'):
+            for row in rows:
+                f.write(json.dumps(dict(zip(columns, row))) + '\n')
+                count += 1
+        else:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query and export the rounds stored in the results database')
+    parser.add_argument('--results_db', required=True, help='SQLite database file of the results')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, description in [('percentiles', 'Percentile of a metric of passed rounds per group'),
+                              ('export', 'Export rounds to a CSV or JSONL file')]:
+        subparser = subparsers.add_parser(name, help=description)
+        subparser.add_argument('--firmware', help='Only the rounds of the firmware tag')
+        subparser.add_argument('--bench', help='Only the rounds of the bench')
+        subparser.add_argument('--ffs_type', help='Only the rounds of the FFS type')
+        subparser.add_argument('--name_of_dut', help='Only the rounds of the DUT')
+        subparser.add_argument('--since_days', type=float, help='Only the rounds started within the num of days')
+        if name == 'percentiles':
+            subparser.add_argument('--metric', default='setup_time',
+                                   help=f'One of {ROUND_METRICS + [phase for phase, _ in ROUND_PHASES]}')
+            subparser.add_argument('--group_by', default='firmware', choices=GROUP_BY_COLUMNS)
+            subparser.add_argument('--percentile', type=float, default=95)
+            subparser.add_argument('--last', type=int, help='Only the latest num of rounds')
+        else:
+            subparser.add_argument('--output', default='-', help='File to export to, CSV unless it ends with .jsonl')
+    args = parser.parse_args()
+    assert os.path.exists(args.results_db), f'Results database "{args.results_db}" does not exist'
+    filters = {"firmware": args.firmware, "bench": args.bench, "ffs_type": args.ffs_type,
+               "name_of_dut": args.name_of_dut,
+               "since": time.time() - args.since_days * 86400 if args.since_days else None}
+    conn = connect(args.results_db)
+    try:
+        if args.command == 'percentiles':
+            rows = query_percentiles(conn, args.metric, args.group_by, args.percentile, args.last, **filters)
+            print(json.dumps(rows, indent=2))
+        else:
+            count = export_rounds(conn, args.output, **filters)
+            if args.output != '-':
+                print(f'{count} rounds are exported to "{args.output}"')
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
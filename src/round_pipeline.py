@@ -0,0 +1,245 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from src.certification_round import RoundResult, categorize_failure
+from src.device import is_phase_overridden
+from src.readiness import AlexaAppOnlineProbe
+from src.tracing import tracer
+
+# Resource held by the steps driving Alexa App, as there is one appium session per phone
+RESOURCE_ALEXA_APP = 'alexa_app'
+MAX_PIPELINE_WORKERS = 4
+
+# Locks of the resources of every device, shared by the pipelines of all its rounds
+_resource_locks = weakref.WeakKeyDictionary()
+_resource_locks_lock = threading.Lock()
+
+
+def get_resource_lock(device, resource):
+    with _resource_locks_lock:
+        return _resource_locks.setdefault(device, {}).setdefault(resource, threading.Lock())
+
+
+class PipelineStep:
+    """
+    The class is used to define a step of a round, run once the steps it depends on have completed
+    """
+
+    def __init__(self, name, func, phase, depends_on=(), resources=(), background=False):
+        """
+        Initialize the PipelineStep object
+        :param name: Name of the step
+        :param func: Function to run the step, its return value is kept as the value of the step
+        :param phase: Phase of the round in ROUND_PHASES the step belongs to
+        :param depends_on: Names of the steps to complete before this one
+        :param resources: Resources held exclusively while the step runs, e.g. RESOURCE_ALEXA_APP
+        :param background: The round is complete without waiting for the step, which is joined by the next round
+        """
+        self.name = name
+        self.func = func
+        self.phase = phase
+        self.depends_on = list(depends_on)
+        self.resources = sorted(resources)
+        self.background = background
+        self.time_start = None
+        self.time_end = None
+        self.value = None
+
+
+def plan_round(device, previous=None):
+    """
+    Plan one round as a dependency graph of steps, so that the appium session is warmed up and the page of the plug
+    of DUT is opened while the provisioner/commissioner boots, and DUT is powered off while the next round power
+    cycles the provisioner. Steps overridden by the device type are planned as whole phases
+    :param device: Device instance of the bench under test
+    :param previous: RoundPipeline of the previous round whose background steps are joined before DUT is powered on
+    :return: List of PipelineStep
+    """
+    ui = [RESOURCE_ALEXA_APP]
+    # Plugs are switched on Alexa App unless a power controller is given
+    plug_resources = [] if device.power_controller else ui
+    probe_resources = ui if any(isinstance(p, AlexaAppOnlineProbe) for p in device.provisioner_probes) else []
+    steps = []
+    if is_phase_overridden(device, 'power_cycle_provisioner'):
+        steps.append(PipelineStep('power_cycle_provisioner', device.power_cycle_provisioner,
+                                  'power_cycle_provisioner', resources=ui))
+        provisioner_ready = 'power_cycle_provisioner'
+    else:
+        steps += [
+            PipelineStep('power_cycle_provisioner', lambda: device.power_cycle_provisioner(wait_ready=False),
+                         'power_cycle_provisioner', resources=plug_resources),
+            PipelineStep('wait_for_provisioner', device.wait_for_provisioner, 'power_cycle_provisioner',
+                         ['power_cycle_provisioner'], probe_resources)
+        ]
+        provisioner_ready = 'wait_for_provisioner'
+
+    def join_previous_round():
+        if previous:
+            assert previous.join(), f'DUT is not powered off by round {previous.result.round_index}'
+    # DUT has to be powered off by the previous round before it is powered on again
+    steps.append(PipelineStep('join_previous_round', join_previous_round, 'power_on_and_check_setup'))
+
+    if is_phase_overridden(device, 'power_on_and_check_setup'):
+        steps.append(PipelineStep('power_on_and_check_setup', device.power_on_and_check_setup,
+                                  'power_on_and_check_setup', ['join_previous_round', provisioner_ready], ui))
+    else:
+        # The page of the plug is left open only if nothing else drives Alexa App before DUT is powered on
+        prepare_after = ['join_previous_round', 'power_cycle_provisioner'] + \
+            ([provisioner_ready] if probe_resources else [])
+        steps += [
+            PipelineStep('prepare_dut_plug', device.prepare_dut_plug, 'power_on_and_check_setup', prepare_after, ui),
+            PipelineStep('power_on_and_check_setup', lambda: device.power_on_and_check_setup(prepared=True),
+                         'power_on_and_check_setup', ['prepare_dut_plug', provisioner_ready], ui)
+        ]
+    if is_phase_overridden(device, 'factory_reset_and_power_off'):
+        steps.append(PipelineStep('factory_reset_and_power_off', device.factory_reset_and_power_off,
+                                  'factory_reset_and_power_off', ['power_on_and_check_setup'], ui))
+    else:
+        steps += [
+            PipelineStep('factory_reset', device.factory_reset, 'factory_reset_and_power_off',
+                         ['power_on_and_check_setup'], ui),
+            PipelineStep('power_off', device.power_off, 'factory_reset_and_power_off', ['factory_reset'],
+                         plug_resources, background=True)
+        ]
+    return steps
+
+
+class RoundPipeline:
+    """
+    The class is used to run the steps of a round in a worker pool as soon as the steps they depend on complete,
+    with the steps holding the same resource run one at a time. What is certified and how the setup time is
+    measured stay the same as run_round()
+    """
+
+    def __init__(self, device, result=None, previous=None, max_workers=MAX_PIPELINE_WORKERS):
+        """
+        Initialize the RoundPipeline object
+        :param device: Device instance of the bench under test, it should reuse its appium session
+        :param result: RoundResult to record the round into, a new one if not given
+        :param previous: RoundPipeline of the previous round
+        :param max_workers: Max num of steps running at the same time
+        """
+        self.device = device
+        self.result = result or RoundResult()
+        self.previous = previous
+        self.steps = plan_round(device, previous)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pipeline')
+        self.background = {}
+
+    def run(self):
+        """
+        Run the steps until all steps but the background ones complete
+        :return: RoundResult
+        :raise Exception: The exception of the first failed step, after the running steps complete
+        """
+        self.device.round_id = self.result.round_id
+        pending = {step.name: step for step in self.steps}
+        running = {}
+        done = set()
+        failure = None
+        while True:
+            if failure is None:
+                for step in list(pending.values()):
+                    if all(name in done for name in step.depends_on):
+                        running[self.executor.submit(self._run_step, step)] = step
+                        del pending[step.name]
+            if not any(not step.background for step in running.values()) and (failure or not pending):
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                step = running.pop(future)
+                if future.exception():
+                    failure = failure or (step, future.exception())
+                else:
+                    done.add(step.name)
+        self.background = {future: step for future, step in running.items()}
+        self._record_timings()
+        if failure:
+            self.join()
+            if self.previous:
+                self.previous.join()
+            self._record_failure(*failure)
+            raise failure[1]
+        self.result.provisioner_boot_time = getattr(self.device, 'provisioner_boot_time', None)
+        self.result.setup_time = next(step.value for step in self.steps if step.name == 'power_on_and_check_setup')
+        self.result.passed = True
+        return self.result
+
+    def join(self):
+        """
+        Wait for the background steps of the round
+        :return: Boolean, False if a background step failed, which fails the round
+        """
+        passed = True
+        for future, step in self.background.items():
+            if future.exception():
+                if self.result.passed:
+                    self.result.passed = False
+                    self._record_failure(step, future.exception())
+                logging.error(f'Step "{step.name}" of round {self.result.round_index} failed: {future.exception()}')
+                passed = False
+        self.background = {}
+        self._record_timings()
+        self.executor.shutdown(wait=True)
+        return passed
+
+    def _run_step(self, step):
+        locks = [get_resource_lock(self.device, resource) for resource in step.resources]
+        for lock in locks:
+            lock.acquire()
+        try:
+            step.time_start = time.monotonic()
+            with tracer.span(step.name, 'step', round_index=self.result.round_index):
+                step.value = step.func()
+            return step.value
+        finally:
+            step.time_end = time.monotonic()
+            for lock in reversed(locks):
+                lock.release()
+
+    def _record_timings(self):
+        # Steps of a phase might overlap with other phases, so a phase takes from its first step to its last one
+        spans = {}
+        for step in self.steps:
+            if step.time_start is None or step.time_end is None:
+                continue
+            time_start, time_end = spans.get(step.phase, (step.time_start, step.time_end))
+            spans[step.phase] = (min(time_start, step.time_start), max(time_end, step.time_end))
+        for phase, (time_start, time_end) in spans.items():
+            self.result.phase_timings[phase] = time_end - time_start
+
+    def _record_failure(self, step, exception):
+        self.result.failed_phase = step.phase
+        self.result.failure_category = categorize_failure(exception)
+        self.result.error = f'{type(exception).__name__}:{exception}'
+
+
+def run_round_pipelined(device, result=None, previous=None):
+    """
+    Run one round as a pipeline, see run_round()
+    :param device: Device instance of the bench under test
+    :param result: RoundResult to record the round into
+    :param previous: RoundPipeline of the previous round
+    :return: RoundPipeline, to be joined by the next round or at the end
+    :raise Exception: The exception of the first failed step
+    """
+    pipeline = RoundPipeline(device, result, previous)
+    pipeline.run()
+    return pipeline
@@ -0,0 +1,333 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+Checkpointed rounds. A round is run as a state machine of steps, and the completed steps and the state of the bench
+(plug states, DUT registered or not) are saved to a local state file after every step. A step failed by a transient
+UI or session failure is retried alone with a fresh appium session, and a round interrupted by a crash or Ctrl+C is
+resumed from its last checkpoint by the next run, instead of starting over from the provisioner power cycle.
+"""
+
+import json
+import logging
+import os
+import time
+
+from src.alexa_app_page_objects import PLUG_STATE_OFF, PLUG_STATE_ON
+from src.certification_round import FAILURE_SESSION, FAILURE_UI, ROUND_PHASES, RoundResult, categorize_failure
+from src.device import is_phase_overridden
+from src.tracing import tracer
+
+MAX_PHASE_RETRIES = 2
+# Failures worth retrying, a DUT failure is the result of the round and is never retried
+RETRYABLE_FAILURES = [FAILURE_UI, FAILURE_SESSION]
+# DUT is kept off for a while after it is reset, so that it boots from scratch when the step is retried
+SLEEP_TIME_DUT_OFF_BEFORE_RETRY_IN_SECOND = 10
+
+# Status of a round and its steps in the state file
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+# How a step is retried, or resumed if it was interrupted
+RETRY_RERUN = 'rerun'
+# DUT might have been powered on or registered by the failed attempt, which would spoil the setup time measured
+RETRY_RESET_DUT_AND_RERUN = 'reset_dut_and_rerun'
+# Resetting DUT completes the step
+RETRY_RESET_DUT = 'reset_dut'
+
+# Facts of the bench state, None if unknown
+BENCH_PROVISIONER_PLUG = 'provisioner_plug'
+BENCH_DUT_PLUG = 'dut_plug'
+BENCH_DUT_REGISTERED = 'dut_registered'
+
+
+class RoundState:
+    """
+    The class is used to define the checkpoint of the current round and the state of its bench, saved to a json file
+    whenever it changes. Without a file the state is only kept in memory
+    """
+
+    def __init__(self, path=None, names=None):
+        """
+        Initialize the RoundState object
+        :param path: Path of the state file
+        :param names: Name of plug to control DUT, plug to control provisioner and DUT, a state file of other names is
+        not resumed
+        """
+        self.path = path
+        self.names = names
+        self.round_index = None
+        self.status = None
+        self.steps = {}
+        self.bench = {}
+        self.result = {}
+
+    @staticmethod
+    def load(path, names):
+        """
+        Load the state from the state file if it exists
+        :param path: Path of the state file, None to keep the state in memory
+        :param names: Name of plug to control DUT, plug to control provisioner and DUT
+        :return: RoundState
+        """
+        state = RoundState(path, names)
+        if not path or not os.path.exists(path):
+            return state
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("names") != names:
+            logging.warning(f'State file "{path}" is saved for {data.get("names")}, not resumed for {names}')
+            return state
+        state.round_index = data["round_index"]
+        state.status = data["status"]
+        state.steps = data["steps"]
+        state.bench = data["bench"]
+        state.result = data["result"]
+        return state
+
+    @property
+    def resumable(self):
+        """
+        A round is resumable if it was interrupted, a failed round is run again from scratch
+        """
+        return self.status == STATUS_RUNNING
+
+    def start_round(self, round_index):
+        self.round_index = round_index
+        self.status = STATUS_RUNNING
+        self.steps = {}
+        self.result = {}
+        self.save()
+
+    def mark_step(self, name, status, bench=None):
+        """
+        Checkpoint the status of the step
+        :param name: Name of the step
+        :param status: Status of the step
+        :param bench: Dictionary of bench facts to update
+        """
+        self.steps[name] = status
+        self.bench.update(bench or {})
+        self.save()
+
+    def record_result(self, result):
+        """
+        Keep the measurements of the round so far, to restore them when the round is resumed
+        :param result: RoundResult of the round
+        """
+        self.result = {
+            "round_id": result.round_id,
+            "setup_time": result.setup_time,
+            "provisioner_boot_time": result.provisioner_boot_time,
+            "phase_timings": result.phase_timings,
+            "retries": result.retries
+        }
+
+    def finish_round(self, status, result):
+        self.status = status
+        self.record_result(result)
+        self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        data = {
+            "names": self.names,
+            "round_index": self.round_index,
+            "status": self.status,
+            "steps": self.steps,
+            "bench": self.bench,
+            "result": self.result,
+            "updated_at": time.time()
+        }
+        # Write to a temporary file first, so that an interrupted write never corrupts the checkpoint
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(temp_path, self.path)
+
+
+class RoundStep:
+    """
+    The class is used to define a step of a checkpointed round
+    """
+
+    def __init__(self, name, func, phase, bench, retry=RETRY_RERUN):
+        """
+        Initialize the RoundStep object
+        :param name: Name of the step
+        :param func: Function to run the step
+        :param phase: Phase of the round in ROUND_PHASES the step belongs to
+        :param bench: Dictionary of bench facts once the step completes, they are unknown while it runs
+        :param retry: How the step is retried, one of RETRY_RERUN, RETRY_RESET_DUT_AND_RERUN and RETRY_RESET_DUT
+        """
+        self.name = name
+        self.func = func
+        self.phase = phase
+        self.bench = bench
+        self.retry = retry
+
+
+def plan_steps(device):
+    """
+    Plan the steps of a round, phases overridden by the device type are whole steps which are simply rerun
+    :param device: Device instance of the bench under test
+    :return: List of RoundStep
+    """
+    dut_on = {BENCH_DUT_PLUG: PLUG_STATE_ON, BENCH_DUT_REGISTERED: True}
+    steps = [RoundStep('power_cycle_provisioner', device.power_cycle_provisioner, 'power_cycle_provisioner',
+                       {BENCH_PROVISIONER_PLUG: PLUG_STATE_ON})]
+    if is_phase_overridden(device, 'power_on_and_check_setup'):
+        steps.append(RoundStep('power_on_and_check_setup', device.power_on_and_check_setup,
+                               'power_on_and_check_setup', dut_on))
+    else:
+        steps.append(RoundStep('power_on_and_check_setup', device.power_on_and_check_setup,
+                               'power_on_and_check_setup', dut_on, RETRY_RESET_DUT_AND_RERUN))
+    if is_phase_overridden(device, 'factory_reset_and_power_off'):
+        steps.append(RoundStep('factory_reset_and_power_off', device.factory_reset_and_power_off,
+                               'factory_reset_and_power_off',
+                               {BENCH_DUT_PLUG: PLUG_STATE_OFF, BENCH_DUT_REGISTERED: False}))
+    else:
+        steps += [
+            RoundStep('factory_reset', device.factory_reset, 'factory_reset_and_power_off',
+                      {BENCH_DUT_REGISTERED: False}, RETRY_RESET_DUT),
+            RoundStep('power_off', device.power_off, 'factory_reset_and_power_off', {BENCH_DUT_PLUG: PLUG_STATE_OFF})
+        ]
+    return steps
+
+
+class CheckpointedRound:
+    """
+    The class is used to run one round as a state machine of steps checkpointed to a RoundState, see run_round().
+    What is certified and how the setup time is measured stay the same
+    """
+
+    def __init__(self, device, result=None, state=None, max_phase_retries=MAX_PHASE_RETRIES):
+        """
+        Initialize the CheckpointedRound object
+        :param device: Device instance of the bench under test
+        :param result: RoundResult to record the round into, a new one if not given
+        :param state: RoundState to checkpoint to and resume from, kept in memory if not given
+        :param max_phase_retries: Max num of retries of a step failed by a transient UI or session failure
+        """
+        self.device = device
+        self.result = result or RoundResult()
+        self.state = state or RoundState(names=device.names)
+        self.max_phase_retries = max_phase_retries
+        self.steps = plan_steps(device)
+
+    def run(self):
+        """
+        Run the steps not completed yet, resuming the interrupted round of the state if any
+        :return: RoundResult
+        :raise Exception: The exception of the failed step once its retries are used up
+        """
+        state = self.state
+        result = self.result
+        if state.resumable:
+            completed = [name for name, status in state.steps.items() if status == STATUS_DONE]
+            logging.info(f'Resuming round {state.round_index} from its checkpoint, completed steps: {completed}, '
+                         f'bench: {state.bench}')
+            result.round_index = state.round_index
+            result.round_id = state.result.get("round_id", result.round_id)
+            result.setup_time = state.result.get("setup_time")
+            result.provisioner_boot_time = state.result.get("provisioner_boot_time")
+            result.phase_timings.update(state.result.get("phase_timings", {}))
+            result.retries.update(state.result.get("retries", {}))
+        else:
+            state.start_round(result.round_index)
+            state.record_result(result)
+        self.device.round_id = result.round_id
+        name_of_dut = self.device.names[2]
+        phases_logged = set()
+        with tracer.span('round', 'round', round_index=result.round_index, name_of_dut=name_of_dut):
+            for step in self.steps:
+                if state.steps.get(step.name) == STATUS_DONE:
+                    continue
+                if step.phase not in phases_logged:
+                    phases_logged.add(step.phase)
+                    logging.info(dict(ROUND_PHASES)[step.phase].replace('NAME', name_of_dut))
+                self._run_step(step)
+        result.passed = True
+        state.finish_round(STATUS_DONE, result)
+        return result
+
+    def _run_step(self, step):
+        state = self.state
+        result = self.result
+        # A step left running by an interrupted run is resumed the same way as a retry
+        retrying = state.steps.get(step.name) in (STATUS_RUNNING, STATUS_FAILED)
+        attempt = 0
+        while True:
+            unknown = {fact: None for fact in step.bench}
+            state.mark_step(step.name, STATUS_RUNNING, unknown)
+            time_start = time.monotonic()
+            try:
+                with tracer.span(step.name, 'phase', attempt=attempt):
+                    value = self._retry_step(step) if retrying else step.func()
+            except Exception as e:
+                category = categorize_failure(e)
+                if category in RETRYABLE_FAILURES and attempt < self.max_phase_retries:
+                    attempt += 1
+                    retrying = True
+                    result.retries[step.phase] = result.retries.get(step.phase, 0) + 1
+                    state.mark_step(step.name, STATUS_FAILED)
+                    # The failed session is dropped by its connection context, so the retry starts a fresh one
+                    logging.warning(f'Step "{step.name}" failed by {category} failure {type(e).__name__}:{e}, '
+                                    f'retrying it with a fresh session ({attempt}/{self.max_phase_retries})')
+                    continue
+                result.failed_phase = step.phase
+                result.failure_category = category
+                result.error = f'{type(e).__name__}:{e}'
+                state.mark_step(step.name, STATUS_FAILED)
+                state.finish_round(STATUS_FAILED, result)
+                raise
+            finally:
+                result.phase_timings[step.phase] = result.phase_timings.get(step.phase, 0) + \
+                                                   time.monotonic() - time_start
+            if step.name == 'power_cycle_provisioner':
+                result.provisioner_boot_time = getattr(self.device, 'provisioner_boot_time', None)
+            elif step.name == 'power_on_and_check_setup':
+                result.setup_time = value
+            state.record_result(result)
+            state.mark_step(step.name, STATUS_DONE, step.bench)
+            return value
+
+    def _retry_step(self, step):
+        if step.retry == RETRY_RERUN:
+            return step.func()
+        state = self.state
+        if state.bench.get(BENCH_DUT_PLUG) != PLUG_STATE_OFF or state.bench.get(BENCH_DUT_REGISTERED) is not False:
+            logging.info(f'Resetting smart device "{self.device.names[2]}" before retrying step "{step.name}"')
+            self.device.reset_dut()
+            state.mark_step(step.name, state.steps[step.name],
+                            {BENCH_DUT_PLUG: PLUG_STATE_OFF, BENCH_DUT_REGISTERED: False})
+            if step.retry == RETRY_RESET_DUT_AND_RERUN:
+                time.sleep(SLEEP_TIME_DUT_OFF_BEFORE_RETRY_IN_SECOND)
+        if step.retry == RETRY_RESET_DUT:
+            return None
+        return step.func()
+
+
+def run_round_checkpointed(device, result=None, state=None, max_phase_retries=MAX_PHASE_RETRIES):
+    """
+    Run one round as a checkpointed state machine, see CheckpointedRound
+    :param device: Device instance of the bench under test
+    :param result: RoundResult to record the round into
+    :param state: RoundState to checkpoint to and resume from
+    :param max_phase_retries: Max num of retries of a step failed by a transient UI or session failure
+    :return: RoundResult
+    """
+    return CheckpointedRound(device, result, state, max_phase_retries).run()
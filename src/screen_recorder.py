@@ -0,0 +1,108 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+Screen recordings of the phone during the setup time window, for the frame accurate setup time found offline by
+src/frame_analyzer.py. The phone records by itself through the appium session, so the recording adds no UI polling
+while the setup time is measured, and the video is only fetched once DUT is found
+"""
+
+import base64
+import json
+import logging
+import os
+import re
+import time
+
+from selenium.common.exceptions import WebDriverException
+
+# Android screenrecord stops by itself after the time limit, up to 30 minutes by appium
+SCREEN_RECORDING_TIME_LIMIT_IN_SECOND = 600
+SCREEN_RECORDING_BIT_RATE = 4000000
+# NAME is the round ID and the name of DUT
+SCREEN_RECORDING_FILE_TEMP = 'NAME.mp4'
+SCREEN_RECORDING_META_FILE_TEMP = 'NAME.json'
+
+
+class ScreenRecorder:
+    """
+    The class is used to record the phone screen through an appium session and save the video with the times needed
+    to measure the setup time from it: when the recording and the power on of DUT happened, and when DUT was found on
+    Alexa App by the UI polling
+    """
+
+    def __init__(self, driver, folder, time_limit=SCREEN_RECORDING_TIME_LIMIT_IN_SECOND):
+        """
+        Initialize the ScreenRecorder object
+        :param driver: WebDriver instance of the session
+        :param folder: Folder to save the recordings to
+        :param time_limit: Max time in seconds to record
+        """
+        self.driver = driver
+        self.folder = folder
+        self.time_limit = time_limit
+        self.time_start_requested = None
+        self.time_started = None
+
+    def start(self):
+        """
+        Start recording, the recording starts between the request and the return of the command, both times are kept
+        :return: Boolean, False if the phone cannot record
+        """
+        time_start_requested = time.time()
+        try:
+            self.driver.start_recording_screen(timeLimit=str(self.time_limit), bitRate=str(SCREEN_RECORDING_BIT_RATE),
+                                               forceRestart=True)
+        except WebDriverException as e:
+            logging.warning(f'[Recorder] Cannot start recording the screen: {e.msg}')
+            return False
+        self.time_start_requested, self.time_started = time_start_requested, time.time()
+        return True
+
+    def stop(self, round_id, name_of_dut, time_power_on, time_found):
+        """
+        Stop recording and save the video with its times to the folder
+        :param round_id: Id of the round, which names the files
+        :param name_of_dut: Name of DUT
+        :param time_power_on: Time when DUT was powered on, None to discard the video as there is no setup time in it
+        :param time_found: Time when DUT was found on Alexa App, None if not found
+        :return: Path of the video, None if not recorded or discarded
+        """
+        time_start_requested, time_started = self.time_start_requested, self.time_started
+        if time_started is None:
+            return None
+        try:
+            # The phone keeps recording up to the time limit unless it is stopped, even if the video is not needed
+            video = self.driver.stop_recording_screen()
+        except WebDriverException as e:
+            logging.warning(f'[Recorder] Cannot stop recording the screen: {e.msg}')
+            return None
+        finally:
+            self.time_start_requested, self.time_started = None, None
+        if time_power_on is None:
+            logging.info(f'[Recorder] The screen recording of round {round_id} is discarded, DUT is not powered on')
+            return None
+        video = base64.b64decode(video)
+        name = re.sub(r'[^\w.-]', '_', f'{round_id or "unknown"}_{name_of_dut}')
+        path = os.path.join(self.folder, SCREEN_RECORDING_FILE_TEMP.replace('NAME', name))
+        os.makedirs(self.folder, exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(video)
+        meta = {"round_id": round_id, "name_of_dut": name_of_dut, "video": os.path.basename(path),
+                "time_recording_start_requested": time_start_requested, "time_recording_started": time_started,
+                "time_power_on": time_power_on, "time_found_on_alexa_app": time_found}
+        with open(os.path.join(self.folder, SCREEN_RECORDING_META_FILE_TEMP.replace('NAME', name)), 'w') as f:
+            json.dump(meta, f, indent=2)
+        logging.info(f'[Recorder] The screen recording of round {round_id} is saved to "{path}"')
+        return path
@@ -0,0 +1,119 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import logging
+import threading
+from collections import Counter
+
+from selenium.webdriver.remote.command import Command
+
+# Pause between the drags of a batched gesture, in ms
+PAUSE_BETWEEN_DRAGS_IN_MS = 100
+
+# Round trips saved by all session drivers, keyed by the reason
+_saved_round_trips = Counter()
+_saved_round_trips_lock = threading.Lock()
+
+
+class SessionDriver:
+    """
+    The class is used to wrap a WebDriver to cut the round trips to appium server, each of which goes across adb to
+    the phone. Facts which do not change within a session are cached, and compound gestures are sent as one command.
+    Any other attribute is delegated to the wrapped driver
+    """
+
+    def __init__(self, driver):
+        """
+        Initialize the SessionDriver object
+        :param driver: WebDriver instance of the session
+        """
+        self.driver = driver
+        self.saved = Counter()
+        self._window_size = None
+
+    def __getattr__(self, name):
+        return getattr(self.driver, name)
+
+    def record_saved(self, reason, count=1):
+        """
+        Record the round trips saved
+        :param reason: Reason why the round trips are not needed, e.g. "window_size"
+        :param count: Num of round trips saved
+        """
+        self.saved[reason] += count
+        with _saved_round_trips_lock:
+            _saved_round_trips[reason] += count
+
+    def get_window_size(self):
+        if self._window_size is None:
+            self._window_size = dict(self.driver.get_window_size())
+        else:
+            self.record_saved('window_size')
+        return dict(self._window_size)
+
+    def swipes(self, drags, duration=0):
+        """
+        Perform the drags one after another by one W3C actions command instead of one command per drag
+        :param drags: List of (start_x, start_y, end_x, end_y)
+        :param duration: Time to take every drag, in ms
+        """
+        if len(drags) == 1:
+            self.driver.swipe(*drags[0], duration)
+            return
+        actions = []
+        for start_x, start_y, end_x, end_y in drags:
+            actions += [
+                {"type": "pointerMove", "duration": 0, "x": start_x, "y": start_y, "origin": "viewport"},
+                {"type": "pointerDown", "button": 0},
+                {"type": "pointerMove", "duration": duration, "x": end_x, "y": end_y, "origin": "viewport"},
+                {"type": "pointerUp", "button": 0},
+                {"type": "pause", "duration": PAUSE_BETWEEN_DRAGS_IN_MS}
+            ]
+        self.driver.execute(Command.W3C_ACTIONS, {"actions": [
+            {"type": "pointer", "id": "finger1", "parameters": {"pointerType": "touch"}, "actions": actions}]})
+        if drags:
+            self.record_saved('batched_gesture', len(drags) - 1)
+
+
+def session_driver(driver):
+    """
+    Get the session driver wrapping the driver, the same one for the same driver so that the cache is kept for the
+    whole session
+    :param driver: WebDriver or SessionDriver instance
+    :return: SessionDriver
+    """
+    if isinstance(driver, SessionDriver):
+        return driver
+    wrapper = getattr(driver, '_session_driver', None)
+    if wrapper is None:
+        wrapper = SessionDriver(driver)
+        driver._session_driver = wrapper
+    return wrapper
+
+
+def record_saved_round_trips(driver, reason, count=1):
+    if isinstance(driver, SessionDriver):
+        driver.record_saved(reason, count)
+
+
+def saved_round_trips():
+    with _saved_round_trips_lock:
+        return dict(_saved_round_trips)
+
+
+def log_round_trip_stats():
+    saved = saved_round_trips()
+    if saved:
+        logging.info(f'[Driver] {sum(saved.values())} round trips saved, ' +
+                     ', '.join(f'{reason}: {count}' for reason, count in sorted(saved.items())))
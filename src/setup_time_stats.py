@@ -0,0 +1,359 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+Statistics of setup time series for certification decisions, vectorized by numpy: nearest rank percentiles with
+bootstrap confidence intervals, success rates with Wilson intervals and outlier flags per group (e.g. per firmware or
+FFS type), and a regression test between two groups (e.g. a baseline and a candidate firmware build). The bootstrap of
+a nearest rank percentile is drawn exactly from the order statistics: the k-th smallest index of n indices resampled
+uniformly is ceil(n * u) where u follows Beta(k, n + 1 - k), so the cost does not grow with the num of rounds
+"""
+
+import argparse
+import csv
+import json
+import logging
+import math
+import os
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is only needed for the statistics of stored results
+    np = None
+
+from src.results_store import GROUP_BY_COLUMNS, connect, query_rounds
+
+STATS_PERCENTILES = [50, 90, 95, 99]
+BOOTSTRAP_RESAMPLES = 10000
+CONFIDENCE_LEVEL = 0.95
+# Rounds whose modified z-score (by median absolute deviation) is beyond the value are flagged as outliers
+OUTLIER_MODIFIED_Z_SCORE = 3.5
+# A candidate regresses if it is slower by the one-sided Mann-Whitney U test at the significance level, and its median
+# setup time is slower by the ratio at least, so that tiny differences over many rounds are not flagged
+REGRESSION_SIGNIFICANCE_LEVEL = 0.01
+MIN_REGRESSION_MEDIAN_RATIO = 0.05
+# A candidate regresses if its success rate is lower by the one-sided two proportion z-test and by the difference
+MIN_REGRESSION_SUCCESS_RATE_DROP = 0.01
+ROUND_FIELDS = ['round_id', 'firmware', 'bench', 'ffs_type', 'name_of_dut', 'run_id', 'started_at', 'passed',
+                'setup_time']
+
+
+def load_rounds(results_db=None, input_file=None, **filters):
+    """
+    Load rounds from the results database, or from a CSV or JSONL file exported from it
+    :param results_db: SQLite database file of the results
+    :param input_file: CSV or JSONL file exported by src/results_store.py
+    :param filters: Filters of firmware, bench, ffs_type, name_of_dut and since (epoch time)
+    :return: Dictionary of arrays keyed by ROUND_FIELDS, setup_time is nan if not measured
+    """
+    assert np is not None, 'numpy is needed for the statistics, please install it by "pip install numpy"'
+    if results_db:
+        conn = connect(results_db)
+        try:
+            rows = query_rounds(conn, ROUND_FIELDS, **filters).fetchall()
+        finally:
+            conn.close()
+    else:
+        with open(input_file, newline='') as f:
+            records = [json.loads(line) for line in f if line.strip()] if input_file.endswith('.jsonl') \
+                else list(csv.DictReader(f))
+        rows = [tuple(record.get(field) for field in ROUND_FIELDS) for record in records]
+    columns = dict(zip(ROUND_FIELDS, zip(*rows))) if rows else {field: () for field in ROUND_FIELDS}
+    rounds = {field: np.array(columns[field], dtype=object) for field in ROUND_FIELDS}
+    rounds["started_at"] = np.array([float(v) if v not in (None, '') else np.nan for v in columns["started_at"]])
+    rounds["passed"] = np.array([str(v) in ('1', 'True', 'true') for v in columns["passed"]], dtype=bool)
+    rounds["setup_time"] = np.array([float(v) if v not in (None, '') else np.nan for v in columns["setup_time"]])
+    if input_file:
+        mask = np.ones(len(rows), dtype=bool)
+        for field in ['firmware', 'bench', 'ffs_type', 'name_of_dut']:
+            if filters.get(field) is not None:
+                values = rounds[field].astype(str)
+                mask &= np.char.lower(values) == filters[field].lower() if field == 'ffs_type' \
+                    else values == filters[field]
+        if filters.get("since") is not None:
+            mask &= rounds["started_at"] >= filters["since"]
+        rounds = {field: values[mask] for field, values in rounds.items()}
+    return rounds
+
+
+def nearest_rank_percentiles(sorted_values, percentiles):
+    """
+    Percentiles by nearest rank, the same as src/results_store.py
+    :param sorted_values: Sorted array of values
+    :param percentiles: List of percentiles between 0 and 100
+    :return: Array of the percentiles
+    """
+    ranks = np.maximum(np.ceil(np.asarray(percentiles) / 100 * len(sorted_values)).astype(int), 1)
+    return sorted_values[ranks - 1]
+
+
+def bootstrap_percentiles(sorted_values, percentiles, resamples=BOOTSTRAP_RESAMPLES, rng=None):
+    """
+    Bootstrap replicates of nearest rank percentiles, drawn exactly from the distribution of order statistics
+    :param sorted_values: Sorted array of values
+    :param percentiles: List of percentiles between 0 and 100
+    :param resamples: Num of bootstrap replicates
+    :param rng: numpy Generator, a new one if not given
+    :return: Array of the replicates in shape (num of percentiles, resamples)
+    """
+    rng = rng or np.random.default_rng()
+    n = len(sorted_values)
+    ranks = np.maximum(np.ceil(np.asarray(percentiles) / 100 * n).astype(int), 1)
+    # The rank-th smallest of n uniforms follows Beta(rank, n + 1 - rank)
+    uniforms = rng.beta(ranks[:, None], n + 1 - ranks[:, None], size=(len(ranks), resamples))
+    indices = np.clip(np.ceil(uniforms * n).astype(int), 1, n) - 1
+    return sorted_values[indices]
+
+
+def confidence_interval(replicates, confidence=CONFIDENCE_LEVEL):
+    """
+    Percentile confidence interval of bootstrap replicates along the last axis
+    :return: Tuple of the arrays of lower and upper bounds
+    """
+    tail = (1 - confidence) / 2 * 100
+    lower, upper = np.percentile(replicates, [tail, 100 - tail], axis=-1)
+    return lower, upper
+
+
+def wilson_interval(successes, trials, confidence=CONFIDENCE_LEVEL):
+    """
+    Wilson score interval of a success rate
+    :return: Tuple of lower and upper bounds, None if there is no trial
+    """
+    if not trials:
+        return None
+    z = _normal_quantile(1 - (1 - confidence) / 2)
+    rate = successes / trials
+    center = (rate + z ** 2 / (2 * trials)) / (1 + z ** 2 / trials)
+    margin = z / (1 + z ** 2 / trials) * math.sqrt(rate * (1 - rate) / trials + z ** 2 / (4 * trials ** 2))
+    return max(center - margin, 0.0), min(center + margin, 1.0)
+
+
+def outlier_mask(values, threshold=OUTLIER_MODIFIED_Z_SCORE):
+    """
+    Flag outliers by the modified z-score, which is robust to the outliers themselves unlike mean and stdev
+    :param values: Array of values
+    :param threshold: Modified z-score beyond which a value is an outlier
+    :return: Boolean array, True for outliers
+    """
+    median = np.median(values)
+    mad = np.median(np.abs(values - median))
+    if mad == 0:
+        return values != median
+    return np.abs(0.6745 * (values - median) / mad) > threshold
+
+
+def describe(rounds, mask=None, percentiles=STATS_PERCENTILES, resamples=BOOTSTRAP_RESAMPLES,
+             confidence=CONFIDENCE_LEVEL, rng=None):
+    """
+    Statistics of the setup time of rounds
+    :param rounds: Dictionary of arrays loaded by load_rounds()
+    :param mask: Boolean array selecting the rounds, all rounds if not given
+    :param percentiles: List of percentiles between 0 and 100
+    :param resamples: Num of bootstrap replicates of the percentile confidence intervals
+    :param confidence: Confidence level of the intervals
+    :param rng: numpy Generator, a new one if not given
+    :return: Dictionary of rounds, success rate with its interval, setup time percentiles with their intervals and
+    outliers of the passed rounds
+    """
+    mask = np.ones(len(rounds["passed"]), dtype=bool) if mask is None else mask
+    passed = rounds["passed"][mask]
+    times = rounds["setup_time"][mask]
+    times = times[passed & ~np.isnan(times)]
+    successes, trials = int(passed.sum()), int(passed.size)
+    item = {"rounds": trials, "passed": successes, "success_rate": successes / trials if trials else None,
+            "success_rate_ci": wilson_interval(successes, trials, confidence), "setup_times": int(times.size)}
+    if not times.size:
+        return item
+    sorted_times = np.sort(times)
+    values = nearest_rank_percentiles(sorted_times, percentiles)
+    lower, upper = confidence_interval(bootstrap_percentiles(sorted_times, percentiles, resamples, rng), confidence)
+    for p, value, low, high in zip(percentiles, values, lower, upper):
+        item[f'p{p:g}'] = float(value)
+        item[f'p{p:g}_ci'] = (float(low), float(high))
+    item["mean"] = float(times.mean())
+    outliers = outlier_mask(times)
+    item["outliers"] = int(outliers.sum())
+    item["outlier_threshold"] = float(times[~outliers].max()) if (~outliers).any() else None
+    return item
+
+
+def summarize_groups(rounds, group_by='firmware', **kwargs):
+    """
+    Statistics of every group of rounds, see describe()
+    :param rounds: Dictionary of arrays loaded by load_rounds()
+    :param group_by: One of GROUP_BY_COLUMNS
+    :return: Dictionary of the statistics keyed by group
+    """
+    assert group_by in GROUP_BY_COLUMNS, f'Unknown column to group by "{group_by}", one of {GROUP_BY_COLUMNS}'
+    keys = rounds[group_by].astype(str)
+    groups, inverse = np.unique(keys, return_inverse=True)
+    return {group: describe(rounds, inverse == index, **kwargs) for index, group in enumerate(groups)}
+
+
+def mann_whitney_greater(baseline, candidate):
+    """
+    One-sided Mann-Whitney U test of the candidate being greater (slower) than the baseline, by normal approximation
+    with tie correction, which is accurate for the num of rounds compared here
+    :param baseline: Array of values of the baseline
+    :param candidate: Array of values of the candidate
+    :return: Tuple of the p-value, and the probability that a candidate value is greater than a baseline value
+    """
+    n1, n2 = len(baseline), len(candidate)
+    combined = np.concatenate([baseline, candidate])
+    order = np.argsort(combined, kind='mergesort')
+    _, starts, counts = np.unique(combined[order], return_index=True, return_counts=True)
+    ranks = np.empty(len(combined))
+    # Tied values share the mean of their ranks
+    ranks[order] = np.repeat(starts + (counts + 1) / 2, counts)
+    u = ranks[n1:].sum() - n2 * (n2 + 1) / 2
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - (counts ** 3 - counts).sum() / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0, 0.5
+    z = (u - n1 * n2 / 2 - 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2)), float(u / (n1 * n2))
+
+
+def proportion_lower(successes_1, trials_1, successes_2, trials_2):
+    """
+    One-sided two proportion z-test of the second success rate being lower than the first
+    :return: p-value
+    """
+    pooled = (successes_1 + successes_2) / (trials_1 + trials_2)
+    variance = pooled * (1 - pooled) * (1 / trials_1 + 1 / trials_2)
+    if variance <= 0:
+        return 1.0
+    z = (successes_1 / trials_1 - successes_2 / trials_2) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def compare(rounds, baseline, candidate, compare_by='firmware', significance=REGRESSION_SIGNIFICANCE_LEVEL,
+            min_median_ratio=MIN_REGRESSION_MEDIAN_RATIO, min_rate_drop=MIN_REGRESSION_SUCCESS_RATE_DROP,
+            resamples=BOOTSTRAP_RESAMPLES, rng=None):
+    """
+    Compare the setup time and success rate of a candidate group with a baseline group, e.g. two firmware builds
+    :param rounds: Dictionary of arrays loaded by load_rounds()
+    :param baseline: Value of the column of the baseline rounds
+    :param candidate: Value of the column of the candidate rounds
+    :param compare_by: One of GROUP_BY_COLUMNS
+    :param significance: Significance level of the tests
+    :param min_median_ratio: Min ratio the median setup time is slower by to be a regression
+    :param min_rate_drop: Min difference the success rate is lower by to be a regression
+    :param resamples: Num of bootstrap replicates of the median shift interval
+    :param rng: numpy Generator, a new one if not given
+    :return: Dictionary of the statistics of both groups, the tests and "regression" (Boolean) with its reasons
+    """
+    assert compare_by in GROUP_BY_COLUMNS, f'Unknown column to compare by "{compare_by}", one of {GROUP_BY_COLUMNS}'
+    rng = rng or np.random.default_rng()
+    keys = rounds[compare_by].astype(str)
+    values = {"baseline": baseline, "candidate": candidate}
+    masks = {name: keys == str(value) for name, value in values.items()}
+    for name, mask in masks.items():
+        assert mask.any(), f'No round of the {name} {compare_by} "{values[name]}" is found'
+    item = {name: describe(rounds, mask, resamples=resamples, rng=rng) for name, mask in masks.items()}
+    item["regression"] = False
+    item["reasons"] = []
+    times = {}
+    for name, mask in masks.items():
+        selected = rounds["setup_time"][mask]
+        times[name] = np.sort(selected[rounds["passed"][mask] & ~np.isnan(selected)])
+    if times["baseline"].size and times["candidate"].size:
+        p_value, superiority = mann_whitney_greater(times["baseline"], times["candidate"])
+        medians = {name: nearest_rank_percentiles(values, [50])[0] for name, values in times.items()}
+        shifts = bootstrap_percentiles(times["candidate"], [50], resamples, rng)[0] - \
+            bootstrap_percentiles(times["baseline"], [50], resamples, rng)[0]
+        low, high = confidence_interval(shifts)
+        ratio = (medians["candidate"] - medians["baseline"]) / medians["baseline"] if medians["baseline"] else 0
+        item["setup_time_test"] = {"p_value": p_value, "probability_slower": superiority,
+                                   "median_shift": float(medians["candidate"] - medians["baseline"]),
+                                   "median_shift_ci": (float(low), float(high)), "median_ratio": float(ratio)}
+        if p_value < significance and ratio >= min_median_ratio:
+            item["regression"] = True
+            item["reasons"].append(f'Median setup time is {ratio:.1%} slower (p={p_value:.2g})')
+    base, cand = item["baseline"], item["candidate"]
+    p_value = proportion_lower(base["passed"], base["rounds"], cand["passed"], cand["rounds"])
+    drop = base["success_rate"] - cand["success_rate"]
+    item["success_rate_test"] = {"p_value": p_value, "drop": drop}
+    if p_value < significance and drop >= min_rate_drop:
+        item["regression"] = True
+        item["reasons"].append(f'Success rate is {drop:.1%} lower (p={p_value:.2g})')
+    return item
+
+
+def _normal_quantile(q):
+    # Inverse of the standard normal CDF by bisection, only needed for a few confidence levels
+    low, high = -10.0, 10.0
+    for _ in range(100):
+        middle = (low + high) / 2
+        if 0.5 * math.erfc(-middle / math.sqrt(2)) < q:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Statistics and regression test of setup time series')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--results_db', help='SQLite database file of the results')
+    source.add_argument('--input', help='CSV or JSONL file exported by src/results_store.py')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    summary = subparsers.add_parser('summary', help='Statistics of every group of rounds')
+    summary.add_argument('--group_by', default='firmware', choices=GROUP_BY_COLUMNS)
+    regression = subparsers.add_parser('compare', help='Test a candidate for a regression from a baseline, '
+                                                       'exits with 1 if it regresses')
+    regression.add_argument('--compare_by', default='firmware', choices=GROUP_BY_COLUMNS)
+    regression.add_argument('--baseline', required=True, help='Value of the column of the baseline, e.g. a firmware')
+    regression.add_argument('--candidate', required=True, help='Value of the column of the candidate')
+    regression.add_argument('--significance', type=float, default=REGRESSION_SIGNIFICANCE_LEVEL)
+    regression.add_argument('--min_median_ratio', type=float, default=MIN_REGRESSION_MEDIAN_RATIO,
+                            help='Min ratio the median setup time is slower by to be a regression')
+    regression.add_argument('--min_rate_drop', type=float, default=MIN_REGRESSION_SUCCESS_RATE_DROP,
+                            help='Min difference the success rate is lower by to be a regression')
+    for subparser in [summary, regression]:
+        subparser.add_argument('--firmware', help='Only the rounds of the firmware tag')
+        subparser.add_argument('--bench', help='Only the rounds of the bench')
+        subparser.add_argument('--ffs_type', help='Only the rounds of the FFS type')
+        subparser.add_argument('--name_of_dut', help='Only the rounds of the DUT')
+        subparser.add_argument('--since_days', type=float, help='Only the rounds started within the num of days')
+        subparser.add_argument('--resamples', type=int, default=BOOTSTRAP_RESAMPLES,
+                               help='Num of bootstrap replicates of the confidence intervals')
+        subparser.add_argument('--seed', type=int, help='Seed of the bootstrap, for reproducible intervals')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+    assert np is not None, 'numpy is needed for the statistics, please install it by "pip install numpy"'
+    if args.results_db:
+        assert os.path.exists(args.results_db), f'Results database "{args.results_db}" does not exist'
+    rounds = load_rounds(args.results_db, args.input, firmware=args.firmware, bench=args.bench,
+                         ffs_type=args.ffs_type, name_of_dut=args.name_of_dut,
+                         since=time.time() - args.since_days * 86400 if args.since_days else None)
+    rng = np.random.default_rng(args.seed)
+    if args.command == 'summary':
+        print(json.dumps(summarize_groups(rounds, args.group_by, resamples=args.resamples, rng=rng), indent=2))
+        return 0
+    item = compare(rounds, args.baseline, args.candidate, args.compare_by, args.significance, args.min_median_ratio,
+                   args.min_rate_drop, args.resamples, rng)
+    print(json.dumps(item, indent=2))
+    if item["regression"]:
+        logging.error(f'[Stats] {args.candidate} regresses from {args.baseline}: {"; ".join(item["reasons"])}')
+    return 1 if item["regression"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+import logging
+import time
+from collections import Counter
+
+from src.certification_round import ROUND_PHASES, RoundResult, run_round
+from src.locators import log_locator_stats
+from src.round_pipeline import run_round_pipelined
+from src.round_state import run_round_checkpointed
+from src.session_driver import log_round_trip_stats
+from src.stats import percentile
+
+SOAK_PERCENTILES = [50, 90, 99]
+
+
+class SoakSeries:
+    """
+    The class is used to collect the results of rounds in a soak run and calculate their statistics
+    """
+
+    def __init__(self):
+        self.results = []
+
+    def add(self, result):
+        self.results.append(result)
+
+    def summary(self):
+        """
+        Calculate the statistics of the collected rounds
+        :return: Dictionary of rounds, success rate, setup time and phase timing percentiles and failure categories
+        """
+        passed = [r for r in self.results if r.passed]
+        setup_times = [r.setup_time for r in passed if r.setup_time is not None]
+        boot_times = [r.provisioner_boot_time for r in passed if r.provisioner_boot_time is not None]
+        summary = {
+            "rounds": len(self.results),
+            "passed": len(passed),
+            "success_rate": len(passed) / len(self.results) if self.results else None,
+            "setup_time": self._stats(setup_times),
+            "provisioner_boot_time": self._stats(boot_times),
+            "phase_timings": {},
+            "failures": dict(Counter(f'{r.failed_phase}/{r.failure_category}' for r in self.results if not r.passed))
+        }
+        for phase, _ in ROUND_PHASES:
+            timings = [r.phase_timings[phase] for r in passed if phase in r.phase_timings]
+            summary["phase_timings"][phase] = self._stats(timings)
+        return summary
+
+    @staticmethod
+    def _stats(values):
+        stats = {f'p{p}': percentile(values, p) for p in SOAK_PERCENTILES}
+        stats["max"] = max(values) if values else None
+        return stats
+
+    def log_summary(self):
+        summary = self.summary()
+        if not summary["rounds"]:
+            logging.info('[Soak] No round was run')
+            return
+        logging.info(f'[Soak] rounds: {summary["rounds"]}, passed: {summary["passed"]}, '
+                     f'success rate: {summary["success_rate"] * 100:.1f}%')
+        for name, stats in [('setup time', summary["setup_time"]),
+                            ('provisioner boot time', summary["provisioner_boot_time"])] + \
+                list(summary["phase_timings"].items()):
+            if stats["max"] is None:
+                continue
+            logging.info(f'[Soak] {name} (seconds): ' + ', '.join(f'{k}: {v:.2f}' for k, v in stats.items()))
+        for failure, count in summary["failures"].items():
+            logging.info(f'[Soak] failures in phase/category {failure}: {count}')
+
+
+class SoakRunner:
+    """
+    The class is used to run rounds on one device repeatedly in the same process, with the appium server and session
+    kept warm between rounds
+    """
+
+    def __init__(self, device, rounds=None, duration=None, stop_on_failure=False, pipeline=False, state=None,
+                 max_phase_retries=0, record_result=None):
+        """
+        Initialize the SoakRunner object
+        :param device: Device instance of the bench under test, it should reuse its appium session
+        :param rounds: Num of rounds to run
+        :param duration: Duration in minutes to keep starting new rounds, the running round is always completed
+        :param stop_on_failure: Stop the soak run once a round failed
+        :param pipeline: Run rounds as pipelines, where DUT of a round is powered off while the next round power cycles
+        the provisioner
+        :param state: RoundState to checkpoint rounds to, the interrupted round of the state is resumed first
+        :param max_phase_retries: Max num of retries of a phase failed by a transient failure, with a state only
+        :param record_result: Function to call with the RoundResult of every round once it is final, e.g. to store it
+        """
+        assert rounds or duration, 'Either num of rounds or duration is needed for soak run'
+        self.device = device
+        self.rounds = rounds
+        self.duration = duration
+        self.stop_on_failure = stop_on_failure
+        self.pipeline = pipeline
+        self.state = state
+        self.max_phase_retries = max_phase_retries
+        self.record_result = record_result
+        self.series = SoakSeries()
+
+    def run(self):
+        """
+        Run rounds until the num of rounds is reached or duration elapsed
+        :return: SoakSeries
+        """
+        time_stop = time.monotonic() + self.duration * 60 if self.duration else None
+        round_index = 0
+        if self.state and self.state.resumable:
+            # Continue the soak run with the interrupted round
+            round_index = self.state.round_index - 1
+        previous = None
+        while (not self.rounds or round_index < self.rounds) and (not time_stop or time.monotonic() < time_stop):
+            round_index += 1
+            logging.info(f'========== Soak round {round_index}{f" of {self.rounds}" if self.rounds else ""} '
+                         f'==========')
+            result = RoundResult(round_index)
+            try:
+                if self.pipeline:
+                    # A failed pipeline has joined the previous one and its own background steps
+                    pipeline, previous = previous, None
+                    previous = run_round_pipelined(self.device, result, pipeline)
+                elif self.state:
+                    run_round_checkpointed(self.device, result, self.state, self.max_phase_retries)
+                else:
+                    run_round(self.device, result)
+            except Exception:
+                logging.exception(f'Soak round {round_index} failed in phase {result.failed_phase}')
+            self.series.add(result)
+            # The result of a pipelined round is final once the next round has joined its background steps
+            self._record(self.series.results[-2:-1] if self.pipeline else [result])
+            if not result.passed and self.stop_on_failure:
+                break
+        if previous:
+            # DUT of the last round is powered off in the background
+            previous.join()
+        if self.pipeline:
+            self._record(self.series.results[-1:])
+        self.series.log_summary()
+        log_locator_stats()
+        log_round_trip_stats()
+        return self.series
+
+    def _record(self, results):
+        if self.record_result:
+            for result in results:
+                self.record_result(result)
@@ -0,0 +1,222 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+
+import csv
+import functools
+import inspect
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+SPAN_FIELDS = ['span_id', 'parent_id', 'name', 'category', 'thread', 'start', 'duration', 'attributes']
+
+
+class Span:
+    """
+    The class is used to define a timed step, measured by monotonic clock and nested in its parent span
+    """
+
+    def __init__(self, span_id, parent_id, name, category, attributes):
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.category = category
+        self.thread = threading.current_thread().name
+        self.attributes = attributes
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = None
+
+    @property
+    def duration(self):
+        return (self.end_ns - self.start_ns) / 1e9 if self.end_ns is not None else None
+
+
+class Tracer:
+    """
+    The class is used to record nested spans of rounds, phases, page object methods and driver commands, and export
+    them as JSONL, CSV or Chrome trace format
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.spans = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Wall clock time of perf counter zero, to export monotonic timestamps as epoch time
+        self._epoch_offset_ns = time.time_ns() - time.perf_counter_ns()
+
+    def enable(self):
+        self.enabled = True
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+
+    @contextmanager
+    def span(self, name, category='', **attributes):
+        """
+        Define a context measured as a span, nested in the current span of the thread
+        :param name: Name of the span
+        :param category: Category of the span, e.g. "round", "phase", "page_object" or "driver"
+        :param attributes: Attributes of the span
+        """
+        if not self.enabled:
+            yield None
+            return
+        stack = self._stack()
+        span = Span(next(self._ids), stack[-1].span_id if stack else None, name, category, attributes)
+        stack.append(span)
+        try:
+            yield span
+        except Exception as e:
+            span.attributes["error"] = type(e).__name__
+            raise
+        finally:
+            span.end_ns = time.perf_counter_ns()
+            # Not popped, the steps of a phase might be resumed and end the span in another thread of the async engine
+            stack.remove(span)
+            with self._lock:
+                self.spans.append(span)
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _rows(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start_ns)
+        for span in spans:
+            yield {
+                "span_id": span.span_id,
+                "parent_id": span.parent_id,
+                "name": span.name,
+                "category": span.category,
+                "thread": span.thread,
+                "start": (span.start_ns + self._epoch_offset_ns) / 1e9,
+                "duration": span.duration,
+                "attributes": span.attributes
+            }
+
+    def export_jsonl(self, path):
+        with open(path, 'w') as f:
+            for row in self._rows():
+                f.write(json.dumps(row, default=str) + '\n')
+
+    def export_csv(self, path):
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=SPAN_FIELDS)
+            writer.writeheader()
+            for row in self._rows():
+                writer.writerow(dict(row, attributes=json.dumps(row["attributes"], default=str)))
+
+    def export_chrome_trace(self, path):
+        """
+        Export spans in Chrome trace format, which can be loaded by chrome://tracing or Perfetto
+        :param path: Path of the json file
+        """
+        thread_ids = {}
+        events = []
+        for row in self._rows():
+            events.append({
+                "name": row["name"],
+                "cat": row["category"],
+                "ph": "X",
+                "ts": row["start"] * 1e6,
+                "dur": row["duration"] * 1e6,
+                "pid": 1,
+                "tid": thread_ids.setdefault(row["thread"], len(thread_ids) + 1),
+                "args": row["attributes"]
+            })
+        for thread, tid in thread_ids.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": thread}})
+        with open(path, 'w') as f:
+            json.dump({"traceEvents": events}, f, default=str)
+
+    def export(self, trace_dir, prefix='trace'):
+        """
+        Export spans to JSONL, CSV and Chrome trace files in the folder
+        :param trace_dir: Folder to save the files
+        :param prefix: Prefix of the file names
+        """
+        os.makedirs(trace_dir, exist_ok=True)
+        base = os.path.join(trace_dir, f'{prefix}_{time.strftime("%Y%m%d_%H%M%S")}')
+        self.export_jsonl(base + '.jsonl')
+        self.export_csv(base + '.csv')
+        self.export_chrome_trace(base + '.chrome.json')
+        logging.info(f'Exported {len(self.spans)} spans to {base}.[jsonl|csv|chrome.json]')
+
+
+tracer = Tracer()
+
+
+def traced(category):
+    """
+    Decorator to measure every call of the function as a span named by its qualified name
+    :param category: Category of the span
+    """
+    def decorator(func):
+        if inspect.isgeneratorfunction(func):
+            # The steps of a phase (see src/phase_steps.py) are measured until they are exhausted
+            @functools.wraps(func)
+            def steps_wrapper(*args, **kwargs):
+                if not tracer.enabled:
+                    return (yield from func(*args, **kwargs))
+                with tracer.span(func.__qualname__, category):
+                    return (yield from func(*args, **kwargs))
+            return steps_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(func.__qualname__, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def traced_methods(category):
+    """
+    Class decorator to measure every call of the public methods as spans
+    :param category: Category of the spans
+    """
+    def decorator(cls):
+        for name, member in list(vars(cls).items()):
+            if callable(member) and not name.startswith('_'):
+                setattr(cls, name, traced(category)(member))
+        return cls
+    return decorator
+
+
+def instrument_driver(driver):
+    """
+    Measure every command the driver sends to appium server as a span, element commands included
+    :param driver: WebDriver instance
+    :return: WebDriver instance
+    """
+    execute = driver.execute
+
+    @functools.wraps(execute)
+    def traced_execute(driver_command, params=None):
+        with tracer.span(driver_command, 'driver'):
+            return execute(driver_command, params)
+    driver.execute = traced_execute
+    return driver
@@ -12,6 +12,9 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 
+import pytest
+
+
 def pytest_addoption(parser):
     """
     Parse the input arguments
@@ -37,8 +40,7 @@ def pytest_addoption(parser):
     parser.addoption(
         "--name_of_dut",
         action="store",
-        help='Name of the device under test displayed on Alexa App after the setup',
-        required=True
+        help='Name of the device under test displayed on Alexa App after the setup, test_zts is skipped if not given'
     )
     parser.addoption(
         "--appium_server_port",
@@ -46,6 +48,126 @@ def pytest_addoption(parser):
         default=4723,
         help='Port used to start appium server'
     )
+    parser.addoption(
+        "--reuse_appium_session",
+        action="store_true",
+        default=False,
+        help='Keep one appium session alive for all phases of a round instead of starting one per phase'
+    )
+    parser.addoption(
+        "--keep_appium_server",
+        action="store_true",
+        default=False,
+        help='Keep appium server (and the reused appium session) warm across rounds instead of restarting it'
+    )
+    parser.addoption(
+        "--logcat_discovery_pattern",
+        action="append",
+        help='Regex of the DUT discovery/registration event in phone logcat to measure the setup time from, "NAME" is '
+             'replaced with the name of DUT'
+    )
+    parser.addoption(
+        "--rounds",
+        action="store",
+        type=int,
+        help='Num of rounds to run in soak mode, where appium server and session are kept warm between rounds'
+    )
+    parser.addoption(
+        "--duration",
+        action="store",
+        type=float,
+        help='Duration in minutes to keep starting new rounds in soak mode'
+    )
+    parser.addoption(
+        "--power_controller_config",
+        action="store",
+        help='Json file configuring HTTP relay urls of the plugs to switch them on LAN instead of on Alexa App'
+    )
+    parser.addoption(
+        "--provisioner_host",
+        action="store",
+        help='IP address or host name of the provisioner/commissioner to detect when it is back online on LAN after '
+             'its power cycle, instead of waiting a fixed 60 seconds'
+    )
+    parser.addoption(
+        "--provisioner_probe_port",
+        action="store",
+        type=int,
+        help='TCP port of the provisioner/commissioner to probe on LAN, 80 by default'
+    )
+    parser.addoption(
+        "--probe_provisioner_on_alexa_app",
+        action="store_true",
+        default=False,
+        help='Detect when the provisioner/commissioner is back online on Alexa App after its power cycle'
+    )
+    parser.addoption(
+        "--pipeline",
+        action="store_true",
+        default=False,
+        help='Open the page of the plug of DUT while the provisioner/commissioner boots, and power off DUT while the '
+             'next round power cycles the provisioner/commissioner. The appium session is reused'
+    )
+    parser.addoption(
+        "--state_file",
+        action="store",
+        help='Json file to checkpoint the completed phases of rounds and the bench state to, an interrupted round is '
+             'resumed from it by the next run'
+    )
+    parser.addoption(
+        "--max_phase_retries",
+        action="store",
+        type=int,
+        help='Max num of retries of a phase failed by a transient UI or session failure, 2 by default with '
+             '--state_file'
+    )
+    parser.addoption(
+        "--results_db",
+        action="store",
+        help='SQLite database file to store every round to, for queries across runs and firmware versions'
+    )
+    parser.addoption(
+        "--firmware_tag",
+        action="store",
+        help='Firmware version of DUT to store with its rounds'
+    )
+    parser.addoption(
+        "--trace_dir",
+        action="store",
+        help='Folder to export the timeline of rounds, phases, page object methods and driver commands to'
+    )
+    parser.addoption(
+        "--artifact_dir",
+        action="store",
+        help='Folder to save the screenshot, page source and logcat window of failed Alexa App operations to'
+    )
+    parser.addoption(
+        "--artifact_max_mb",
+        action="store",
+        type=float,
+        default=500,
+        help='Max disk usage of --artifact_dir in MB, the oldest artifacts are removed beyond it'
+    )
+    parser.addoption(
+        "--artifact_sample_rate",
+        action="store",
+        type=float,
+        default=0,
+        help='Ratio of passed Alexa App operations to save the artifacts of as well, between 0 and 1'
+    )
+    parser.addoption(
+        "--profile_appium_log",
+        action="store_true",
+        default=False,
+        help='Tail the appium server log while the test runs and log the latency of every appium command, split '
+             'into appium side and device side time'
+    )
+    parser.addoption(
+        "--screen_recording_dir",
+        action="store",
+        help='Folder to save screen recordings of the setup time window to, for the frame accurate setup time by '
+             'src/frame_analyzer.py'
+    )
 
 
 def pytest_generate_tests(metafunc):
@@ -53,7 +175,22 @@ def pytest_generate_tests(metafunc):
     Convert input arguments into python test parameters
     """
     options = ['ffs_type', 'name_of_plug_to_control_dut', 'name_of_plug_to_control_provisioner', 'name_of_dut',
-               'appium_server_port']
+               'appium_server_port', 'reuse_appium_session', 'keep_appium_server', 'logcat_discovery_pattern', 'rounds',
+               'duration', 'power_controller_config', 'provisioner_host', 'provisioner_probe_port',
+               'probe_provisioner_on_alexa_app', 'pipeline', 'state_file', 'max_phase_retries',
+               'results_db', 'firmware_tag', 'trace_dir', 'artifact_dir', 'artifact_max_mb', 'artifact_sample_rate',
+               'profile_appium_log', 'screen_recording_dir']
     for option in options:
-        if metafunc.config.getoption(option):
+        if option in metafunc.fixturenames:
             metafunc.parametrize(option, [metafunc.config.getoption(option)])
+
+
+def pytest_collection_modifyitems(config, items):
+    """
+    Skip the certification flow if DUT is not given, so that the offline tests run without a bench
+    """
+    if config.getoption('name_of_dut'):
+        return
+    for item in items:
+        if 'name_of_dut' in item.fixturenames:
+            item.add_marker(pytest.mark.skip(reason='--name_of_dut is not given'))
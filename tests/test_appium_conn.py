@@ -0,0 +1,86 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import pytest
+from selenium.common.exceptions import WebDriverException
+from urllib3.exceptions import MaxRetryError, ProtocolError
+
+from src.appium_conn import AppiumConn
+
+CAPS = {"platformName": "Android", "udid": "emulator-5554", "appPackage": "com.amazon.dee.app"}
+
+
+class FakeDriver:
+    """
+    Fake WebDriver of a kept alive session, failing every command by the error if given
+    """
+
+    def __init__(self, session_id, error=None):
+        self.session_id = session_id
+        self.error = error
+        self.quits = 0
+
+    @property
+    def current_package(self):
+        if self.error:
+            raise self.error
+        return CAPS["appPackage"]
+
+    def quit(self):
+        self.quits += 1
+        if self.error:
+            raise self.error
+
+
+@pytest.fixture
+def new_sessions(monkeypatch):
+    sessions = []
+
+    def start_session(conn, url):
+        sessions.append(FakeDriver(f'new-{len(sessions)}'))
+        return sessions[-1]
+    monkeypatch.setattr(AppiumConn, 'start_session', start_session)
+    yield sessions
+    AppiumConn.close_sessions()
+
+
+def test_healthy_session_is_reused(new_sessions):
+    with AppiumConn(CAPS, 4723, reuse_session=True).appium_conn_context() as driver:
+        first = driver
+    conn = AppiumConn(CAPS, 4723, reuse_session=True)
+    with conn.appium_conn_context() as driver:
+        assert driver is first
+    assert conn.session_reused
+    assert len(new_sessions) == 1
+
+
+@pytest.mark.parametrize('error', [
+    WebDriverException('A session is either terminated or not started'),
+    MaxRetryError(None, '/session/dead/appium/device/current_package', 'Connection refused'),
+    ProtocolError('Connection aborted.', ConnectionResetError(104, 'Connection reset by peer')),
+    ConnectionRefusedError(111, 'Connection refused')
+])
+def test_dead_session_is_replaced(new_sessions, error):
+    """
+    A session whose appium server crashed or restarted is replaced by a new session instead of failing the round
+    """
+    with AppiumConn(CAPS, 4723, reuse_session=True).appium_conn_context():
+        pass
+    dead = new_sessions[0]
+    dead.error = error
+    conn = AppiumConn(CAPS, 4723, reuse_session=True)
+    with conn.appium_conn_context() as driver:
+        assert driver is new_sessions[1]
+    assert not conn.session_reused
+    assert dead.quits == 1
@@ -0,0 +1,100 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import os
+
+import pytest
+
+from src.appium_log_parser import AppiumLogParser, command_name_of_path
+
+SESSION = '5c3b4ad2-80a2-4f1e-9d3c-1b2f7a6e0c11'
+ELEMENT = '00000000-0000-0011-ffff-ffff0000001a'
+# Lines of an appium server started with --log-timestamp
+FIND_ELEMENT_LOG = f'''2024-05-01 10:00:00:000 - [HTTP] --> POST /session/{SESSION}/element
+2024-05-01 10:00:00:001 - [HTTP] {{"using":"xpath","value":"//*[@text='First plug']"}}
+2024-05-01 10:00:00:002 - [debug] [AndroidUiautomator2Driver@1a2b] Calling AppiumDriver.findElement() with args: \
+["xpath","//*[@text='First plug']","{SESSION}"]
+2024-05-01 10:00:00:005 - [debug] [WD Proxy] Proxying [POST /element] to [POST http://127.0.0.1:8200/session/x/element]
+2024-05-01 10:00:00:035 - [debug] [WD Proxy] Got response with status 200: {{"value":{{"ELEMENT":"{ELEMENT}"}}}}
+2024-05-01 10:00:00:045 - [HTTP] <-- POST /session/{SESSION}/element 200 45 ms - 137
+'''
+GET_TEXT_LOG = f'''2024-05-01 10:00:01:000 - [HTTP] --> GET /session/{SESSION}/element/{ELEMENT}/text
+2024-05-01 10:00:01:010 - [HTTP] <-- GET /session/{SESSION}/element/{ELEMENT}/text 200 10 ms - 20
+'''
+
+
+def write_log(path, text, mode='w'):
+    with open(path, mode) as f:
+        f.write(text)
+
+
+def test_find_element_is_paired_and_split(tmp_path):
+    log_file = tmp_path / 'appium_server_log.txt'
+    write_log(log_file, FIND_ELEMENT_LOG * 2 + GET_TEXT_LOG)
+    parser = AppiumLogParser(str(log_file), from_end=False)
+    assert parser.poll() == 3
+    summary = parser.summary()
+    assert list(summary) == ['findElement(xpath)', 'GET element/text']
+    item = summary["findElement(xpath)"]
+    assert (item["count"], item["sum_ms"], item["p50_ms"]) == (2, 90, 45)
+    assert item["device_ms"] == pytest.approx(30, abs=0.01)
+    assert item["appium_ms"] == pytest.approx(15, abs=0.01)
+    assert item["histogram"] == {"<=50": 2}
+    # Not proxied to the phone, so all the time is spent by appium
+    assert summary["GET element/text"]["device_ms"] == 0
+    assert parser.unmatched == 0
+
+
+def test_unmatched_response(tmp_path):
+    log_file = tmp_path / 'appium_server_log.txt'
+    write_log(log_file, FIND_ELEMENT_LOG.splitlines(keepends=True)[-1])
+    parser = AppiumLogParser(str(log_file), from_end=False)
+    assert parser.poll() == 0
+    assert parser.unmatched == 1
+    assert parser.summary() == {}
+
+
+def test_poll_keeps_partial_line(tmp_path):
+    log_file = tmp_path / 'appium_server_log.txt'
+    write_log(log_file, 'previous round\n')
+    parser = AppiumLogParser(str(log_file))
+    lines = FIND_ELEMENT_LOG.splitlines(keepends=True)
+    write_log(log_file, ''.join(lines[:-1]) + lines[-1][:30], 'a')
+    assert parser.poll() == 0
+    write_log(log_file, lines[-1][30:], 'a')
+    assert parser.poll() == 1
+    assert parser.summary()["findElement(xpath)"]["count"] == 1
+
+
+def test_poll_rereads_truncated_or_replaced_log(tmp_path):
+    log_file = tmp_path / 'appium_server_log.txt'
+    write_log(log_file, FIND_ELEMENT_LOG + GET_TEXT_LOG + FIND_ELEMENT_LOG.splitlines(keepends=True)[0])
+    parser = AppiumLogParser(str(log_file), from_end=False)
+    assert parser.poll() == 2
+    # Truncated by a new appium server on the same file, the request left pending by the old server is dropped
+    write_log(log_file, GET_TEXT_LOG)
+    assert parser.poll() == 1
+    assert parser.unmatched == 0
+    # Replaced by a new file, which is larger than the offset read so far
+    new_file = tmp_path / 'new_log.txt'
+    write_log(new_file, FIND_ELEMENT_LOG * 3)
+    os.replace(new_file, log_file)
+    assert parser.poll() == 3
+    assert parser.summary()["findElement(xpath)"]["count"] == 4
+
+
+def test_command_name_of_path():
+    assert command_name_of_path('POST', f'/wd/hub/session/{SESSION}/element/{ELEMENT}/click') == 'POST element/click'
+    assert command_name_of_path('GET', f'/session/{SESSION}') == 'GET session'
+    assert command_name_of_path('GET', '/status') == 'GET status'
@@ -12,47 +12,85 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 
-import logging
-import time
+from src.devices.device_types import DEVICE_TYPES
+from src.appium_conn import APPIUM_SERVER_LOG_FILE, AppiumConn
+from src.appium_log_parser import AppiumLogTailer
+from src.artifacts import ArtifactCollector
+from src.certification_round import RoundResult, run_round
+from src.power_controller import load_power_controller
+from src.round_pipeline import run_round_pipelined
+from src.round_state import MAX_PHASE_RETRIES, RoundState, run_round_checkpointed
+from src.soak import SoakRunner
+from src.readiness import get_provisioner_probes
+from src.results_store import ResultsStore
+from src.tracing import tracer
 
-from src.devices.ack_device import ACKDevice
-from src.devices.bss_device import BSSDevice
-from src.devices.wss_device import WSSDevice
-from src.devices.zss_device import ZSSDevice
-from src.devices.mss_device import MSSDevice
-from src.appium_conn import AppiumConn
 
-SLEEP_TIME_BETWEEN_ROUNDS_IN_SECOND = 10
-
-
-def test_zts(ffs_type, name_of_plug_to_control_dut, name_of_plug_to_control_provisioner, name_of_dut, appium_server_port):
+def test_zts(ffs_type, name_of_plug_to_control_dut, name_of_plug_to_control_provisioner, name_of_dut, appium_server_port,
+             reuse_appium_session, keep_appium_server, logcat_discovery_pattern, rounds, duration,
+             power_controller_config, provisioner_host, provisioner_probe_port, probe_provisioner_on_alexa_app,
+             pipeline, state_file, max_phase_retries, results_db, firmware_tag, trace_dir, artifact_dir,
+             artifact_max_mb, artifact_sample_rate, profile_appium_log, screen_recording_dir, pytestconfig):
     """
     The test method defines the main test flow as below
     1. Setup Appium connection
     2. Deregister the DUT and power it off
     3. Power cycle/reboot the echo device (provisioner)
     4. Power on DUT and check the registration
-
+    The flow is repeated in soak mode if num of rounds or duration is given, and the statistics of all rounds are
+    logged at the end. In pipeline mode step 4 is prepared while the provisioner boots in step 3. If checkpointed, a
+    phase failed by a transient failure is retried alone and an interrupted round is resumed
     """
-    device_type = {
-        "ack": ACKDevice,
-        "bss": BSSDevice,
-        "wss": WSSDevice,
-        "zss": ZSSDevice,
-        "mss": MSSDevice
-    }
     names = [name_of_plug_to_control_dut, name_of_plug_to_control_provisioner, name_of_dut]
-    device = device_type[ffs_type.lower()](names)
+    soak = bool(rounds or duration)
+    checkpointed = bool(state_file or max_phase_retries)
+    if checkpointed and max_phase_retries is None:
+        max_phase_retries = MAX_PHASE_RETRIES
+    assert not (checkpointed and pipeline), 'Pipelined rounds cannot be checkpointed'
+    device = DEVICE_TYPES[ffs_type.lower()](names, reuse_session=reuse_appium_session or soak or pipeline,
+                                            logcat_patterns=logcat_discovery_pattern,
+                                            power_controller=load_power_controller(power_controller_config))
+    device.provisioner_probes = get_provisioner_probes(device, provisioner_host, provisioner_probe_port,
+                                                       probe_provisioner_on_alexa_app)
+
+    results_store = ResultsStore(results_db) if results_db else None
+    # The phone stands for the bench in the results of a single bench
+    record_result = results_store.recorder(device.alexa_app_desired_caps["udid"], ffs_type, firmware_tag,
+                                           name_of_dut) if results_store else None
 
+    device.screen_recording_dir = screen_recording_dir
+    if artifact_dir:
+        device.artifact_collector = ArtifactCollector(artifact_dir, artifact_max_mb, artifact_sample_rate)
+    if trace_dir:
+        tracer.enable()
     AppiumConn.start_appium_server(appium_server_port)
+    log_tailer = AppiumLogTailer(APPIUM_SERVER_LOG_FILE).start() if profile_appium_log else None
+    result = RoundResult()
     try:
-        logging.info('========== Before Test: Power cycle the provisioner/commissioner for BSS, ZSS or MSS ===========')
-        device.power_cycle_provisioner()
-        logging.info(f'================= Test Run: Power on "{name_of_dut}" and observe the behavior =================')
-        device.power_on_and_check_setup()
-        logging.info(f'============ After Test: Remove "{name_of_dut}" from Alexa App to factory reset it ============')
-        device.factory_reset_and_power_off()
+        if soak:
+            summary = SoakRunner(device, rounds, duration, pytestconfig.getoption('exitfirst'), pipeline,
+                                 RoundState.load(state_file, names) if checkpointed else None,
+                                 max_phase_retries, record_result).run().summary()
+            assert summary["passed"] == summary["rounds"], \
+                f'{summary["rounds"] - summary["passed"]} of {summary["rounds"]} soak rounds failed'
+        elif checkpointed:
+            run_round_checkpointed(device, result, RoundState.load(state_file, names), max_phase_retries)
+        elif pipeline:
+            assert run_round_pipelined(device, result).join(), f'DUT "{name_of_dut}" is not powered off'
+        else:
+            run_round(device, result)
     finally:
-        AppiumConn.stop_appium_server()
-        # Sleep some time to allow previous appium session closed properly for next round of test
-        time.sleep(SLEEP_TIME_BETWEEN_ROUNDS_IN_SECOND)
+        if log_tailer:
+            log_tailer.stop()
+        if record_result and not soak:
+            record_result(result)
+        if results_store:
+            results_store.close()
+        if device.artifact_collector:
+            device.artifact_collector.close()
+        # The server is stopped at exit if kept warm, otherwise stop it and wait for it to exit before next round
+        if not keep_appium_server:
+            AppiumConn.stop_appium_server(appium_server_port)
+        if trace_dir:
+            tracer.export(trace_dir)
+            tracer.clear()
@@ -0,0 +1,93 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import pytest
+
+from src.frame_analyzer import find_first_appearance, frame_differences, match_template, recording_start_of
+
+np = pytest.importorskip('numpy')
+
+HEIGHT, WIDTH = 120, 80
+FRAME_RATE = 30
+# Position (y, x) of the card and the frame from which it is shown
+CARD_POSITION = (70, 25)
+CARD_FRAME = 12
+
+
+def synthetic_frames(num=30, card_frame=CARD_FRAME, position=CARD_POSITION, seed=0):
+    """
+    Gray frames of a screen with a smooth background, where a textured card is shown from a frame on
+    :return: Tuple of the frames, the timestamps and the card
+    """
+    rng = np.random.default_rng(seed)
+    background = np.tile(np.linspace(40, 120, WIDTH), (HEIGHT, 1)).astype(np.uint8)
+    card = rng.integers(0, 256, size=(16, 24)).astype(np.uint8)
+    frames = np.repeat(background[None], num, axis=0)
+    y, x = position
+    frames[card_frame:, y:y + card.shape[0], x:x + card.shape[1]] = card
+    return frames, np.arange(num) / FRAME_RATE, card
+
+
+def test_frame_differences():
+    frames, _, _ = synthetic_frames()
+    changes = frame_differences(frames)
+    assert np.isinf(changes[0])
+    assert np.flatnonzero(changes[1:] > 0).tolist() == [CARD_FRAME - 1]
+
+
+def test_match_template_finds_card():
+    frames, _, card = synthetic_frames()
+    scores, positions = match_template(frames[CARD_FRAME - 1:CARD_FRAME + 1], card)
+    assert scores[0] < 0.5
+    assert scores[1] == pytest.approx(1.0)
+    assert tuple(positions[1]) == CARD_POSITION
+
+
+def test_match_template_rejects_flat_template():
+    frames, _, _ = synthetic_frames()
+    with pytest.raises(AssertionError, match='flat'):
+        match_template(frames, np.full((8, 8), 100, dtype=np.uint8))
+
+
+def test_find_first_appearance():
+    frames, timestamps, card = synthetic_frames()
+    other_card = np.random.default_rng(1).integers(0, 256, size=(16, 24)).astype(np.uint8)
+    appearance = find_first_appearance(frames, timestamps, [other_card, card])
+    assert appearance["frame"] == CARD_FRAME
+    assert appearance["time"] == pytest.approx(CARD_FRAME / FRAME_RATE)
+    assert appearance["template"] == 1
+    assert appearance["score"] == pytest.approx(1.0)
+    assert appearance["position"] == CARD_POSITION
+
+
+def test_find_first_appearance_from_start_time():
+    """
+    A card already shown at the start time is found at the first frame from the start time, though it does not change
+    """
+    frames, timestamps, card = synthetic_frames()
+    appearance = find_first_appearance(frames, timestamps, [card], start_time=20.5 / FRAME_RATE)
+    assert appearance["frame"] == 21
+    assert find_first_appearance(frames, timestamps, [card], start_time=1.0 + 1 / FRAME_RATE) is None
+
+
+def test_find_first_appearance_without_card():
+    frames, timestamps, card = synthetic_frames(card_frame=30)
+    assert find_first_appearance(frames, timestamps, [card]) is None
+
+
+def test_recording_start_of():
+    meta = {"time_recording_start_requested": 100.0, "time_recording_started": 100.4}
+    assert recording_start_of(meta) == pytest.approx((100.2, 0.2))
+    # Saved without the request time
+    assert recording_start_of({"time_recording_started": 100.4}) == (100.4, 0.0)
@@ -0,0 +1,124 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import time
+
+import pytest
+
+from src.certification_round import RoundResult
+from src.lab_coordinator import (JOB_STATUS_DONE, JOB_STATUS_FAILED, JOB_STATUS_LEASED, JOB_STATUS_QUEUED,
+                                 MAX_JOB_ATTEMPTS, CoordinatorClient, LabCoordinator, LeaseLost)
+
+LEASE_TIME_IN_SECOND = 0.2
+TOKEN = 'lab-token'
+BENCH = {"bench": "bench-1", "ffs_type": "MSS", "name_of_dut": "First switch",
+         "name_of_plug_to_control_dut": "First plug", "name_of_plug_to_control_provisioner": "Second plug"}
+SPEC = {"name_of_dut": "First switch", "rounds": 3}
+
+
+@pytest.fixture
+def coordinator():
+    coordinator = LabCoordinator(lease_time=LEASE_TIME_IN_SECOND, token=TOKEN).start()
+    yield coordinator
+    coordinator.stop()
+
+
+def round_result(round_index, passed=True):
+    result = RoundResult(round_index, "First switch")
+    result.passed = passed
+    return result
+
+
+def test_job_runs_on_matching_bench(coordinator):
+    job = coordinator.submit(SPEC)
+    assert coordinator.lease('worker-1', dict(BENCH, name_of_dut="Second switch")) is None
+    lease = coordinator.lease('worker-1', BENCH)
+    assert lease["job_id"] == job["job_id"] and lease["rounds"] == 3
+    for round_index in range(1, 4):
+        coordinator.add_result(job["job_id"], lease["lease_id"], round_result(round_index).to_dict())
+    coordinator.complete(job["job_id"], lease["lease_id"])
+    job = coordinator.job(job["job_id"])
+    assert job["status"] == JOB_STATUS_DONE
+    assert [r["round_index"] for r in job["results"]] == [1, 2, 3]
+
+
+def test_expired_lease_is_requeued_and_continues_rounds(coordinator):
+    job_id = coordinator.submit(SPEC)["job_id"]
+    lease = coordinator.lease('worker-1', BENCH)
+    coordinator.add_result(job_id, lease["lease_id"], round_result(1).to_dict())
+    time.sleep(LEASE_TIME_IN_SECOND * 2)
+    assert coordinator.job(job_id)["status"] == JOB_STATUS_QUEUED
+    with pytest.raises(LeaseLost):
+        coordinator.add_result(job_id, lease["lease_id"], round_result(2).to_dict())
+
+    # The round indexes of the new lease count from 1, they continue the round done by the expired lease
+    lease = coordinator.lease('worker-2', BENCH)
+    assert lease["rounds"] == 2
+    for round_index in range(1, 3):
+        coordinator.add_result(job_id, lease["lease_id"], round_result(round_index).to_dict())
+    coordinator.complete(job_id, lease["lease_id"])
+    job = coordinator.job(job_id)
+    assert job["status"] == JOB_STATUS_DONE and job["worker"] == 'worker-2' and job["attempts"] == 2
+    assert [r["round_index"] for r in job["results"]] == [1, 2, 3]
+
+
+def test_renew_keeps_lease(coordinator):
+    job_id = coordinator.submit(SPEC)["job_id"]
+    lease = coordinator.lease('worker-1', BENCH)
+    for _ in range(8):
+        time.sleep(LEASE_TIME_IN_SECOND / 4)
+        coordinator.renew(job_id, lease["lease_id"])
+    assert coordinator.job(job_id)["status"] == JOB_STATUS_LEASED
+
+
+def test_job_fails_after_max_attempts(coordinator):
+    job_id = coordinator.submit(SPEC)["job_id"]
+    for _ in range(MAX_JOB_ATTEMPTS):
+        assert coordinator.lease('worker-1', BENCH)["job_id"] == job_id
+        time.sleep(LEASE_TIME_IN_SECOND * 2)
+    job = coordinator.job(job_id)
+    assert job["status"] == JOB_STATUS_FAILED
+    assert job["error"] == f'Lease expired {MAX_JOB_ATTEMPTS} times'
+    assert coordinator.lease('worker-1', BENCH) is None
+
+
+def test_invalid_spec(coordinator):
+    with pytest.raises(AssertionError, match='should give'):
+        coordinator.submit({"rounds": 1})
+    with pytest.raises(AssertionError, match='Unknown job field'):
+        coordinator.submit(dict(SPEC, phone="Pixel"))
+
+
+def test_client(coordinator):
+    client = CoordinatorClient(coordinator.url, token=TOKEN)
+    job_id, = client.submit([SPEC])
+    client.heartbeat_worker('worker-1', [BENCH])
+    lease = client.lease('worker-1', BENCH)
+    client.add_result(job_id, lease["lease_id"], round_result(1, passed=False))
+    client.complete(job_id, lease["lease_id"], error='Bench is offline')
+    status = client.status()
+    assert status["workers"]["worker-1"]["online"]
+    assert status["jobs"][0]["status"] == JOB_STATUS_FAILED and status["jobs"][0]["passed"] == 0
+    with pytest.raises(LeaseLost):
+        client.renew(job_id, lease["lease_id"])
+
+
+def test_client_without_token_is_refused(coordinator):
+    with pytest.raises(AssertionError, match='401'):
+        CoordinatorClient(coordinator.url).submit([SPEC])
+    with pytest.raises(AssertionError, match='401'):
+        CoordinatorClient(coordinator.url, token='wrong-token').submit([SPEC])
+    assert coordinator.jobs == []
+    # Reading the status needs no token
+    assert CoordinatorClient(coordinator.url).status()["jobs"] == []
@@ -0,0 +1,81 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import time
+
+import pytest
+
+from src.logcat_detector import LogcatDetector, fake_logcat_stream
+
+TIMEOUT_DETECTION_IN_SECOND = 5
+
+
+def test_detects_first_matching_line():
+    """
+    The first line matching any pattern is the event, timestamped on the host and by logcat
+    """
+    messages = ['Wi-Fi scan done', 'Device "First switch" registered', 'Device "First switch" registered again']
+    time_start = time.time()
+    with LogcatDetector([r'"First switch" registered'], stream=fake_logcat_stream(messages, 0.01)) as detector:
+        event = detector.wait(TIMEOUT_DETECTION_IN_SECOND)
+    assert event is not None
+    assert event.line.endswith('Device "First switch" registered')
+    assert event.pattern == r'"First switch" registered'
+    assert time_start <= event.host_time <= time.time()
+    assert abs(event.device_time - event.host_time) < 1
+
+
+def test_matches_any_pattern():
+    patterns = [r'FFS provisioning of First switch succeeded', r'First switch is online']
+    with LogcatDetector(patterns, stream=fake_logcat_stream(['Boot completed', 'First switch is online'])) as detector:
+        event = detector.wait(TIMEOUT_DETECTION_IN_SECOND)
+    assert event.pattern == 'First switch is online'
+
+
+def test_line_without_epoch_time_is_matched_without_device_time():
+    with LogcatDetector([r'First switch'], stream=iter(['--------- beginning of main\n', 'First switch found\n'])) \
+            as detector:
+        event = detector.wait(TIMEOUT_DETECTION_IN_SECOND)
+    assert event.line == 'First switch found'
+    assert event.device_time is None
+
+
+def test_no_event_without_matching_line():
+    with LogcatDetector([r'First switch'], stream=fake_logcat_stream(['Second switch is online'])) as detector:
+        assert detector.wait(0.1) is None
+
+
+def test_event_before_since_is_ignored():
+    """
+    A line logged before the power on of DUT, e.g. replayed from the logcat buffer, is not the event
+    """
+    time_start = time.time()
+    stale = f'{time_start - 60:.3f}  1234  1234 I FakeTag: First switch is online\n'
+    with LogcatDetector([r'First switch is online'], stream=iter([stale]), clock_offset=0) as detector:
+        assert detector.wait(0.1) is None
+    with LogcatDetector([r'First switch is online'], stream=fake_logcat_stream(['First switch is online'], 0.05)) \
+            as detector:
+        assert detector.wait(0, since=time.time() + 60) is None
+        assert detector.wait(TIMEOUT_DETECTION_IN_SECOND) is not None
+
+
+def test_event_time_by_phone_clock():
+    """
+    The event is timestamped when logged on the phone, corrected by the offset of the phone clock
+    """
+    time_logged = time.time() + 30.0
+    line = f'{time_logged:.3f}  1234  1234 I FakeTag: First switch is online\n'
+    with LogcatDetector([r'First switch is online'], stream=iter([line]), clock_offset=30.0) as detector:
+        event = detector.wait(TIMEOUT_DETECTION_IN_SECOND, since=0)
+    assert event.time == pytest.approx(time_logged - 30.0, abs=1e-3)
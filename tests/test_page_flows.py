@@ -0,0 +1,192 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import json
+
+import pytest
+
+from benchmarks.benchmark_flows import BASELINE_FILE, DEVICE_NAMES, FLOWS, load_screens, run_flow, tile_of
+from src.alexa_app_page_objects import (PLUG_DEVICE_BACK_LOCATOR, PLUG_DEVICE_POWER_OFF_LOCATOR,
+                                        PLUG_DEVICE_POWER_ON_LOCATOR, SMART_DEVICE_CONFIG_LOCATOR,
+                                        SMART_DEVICE_DELETE_CONFIRM_LOCATOR, SMART_DEVICE_DELETE_LOCATOR,
+                                        AlexaAppPageObjects)
+from src.page_snapshot import PageSnapshot
+from src.replay_driver import ReplayDriver, ReplayTransition
+
+# Device list of a rendered "Devices" page, longer than the screen
+LIST_BOUNDS = (0, 700, 1080, 2130)
+TILE_PITCH = 260
+OTHER_DEVICES = [f'Bulb {i:02d}' for i in range(20)] + [f'Switch {i:02d}' for i in range(5)]
+DEVICES_PAGE_TEMP = '''<?xml version='1.0' encoding='UTF-8' standalone='yes' ?>
+<hierarchy class="hierarchy" width="1080" height="2340">
+  <android.view.View class="android.view.View" resource-id="devicePageHeader" bounds="[0,66][1080,260]"
+      displayed="true" />
+  <android.widget.ScrollView class="android.widget.ScrollView" clickable="false" scrollable="true"
+      bounds="[0,700][1080,2130]" displayed="true">TILES</android.widget.ScrollView>
+  <android.widget.LinearLayout class="android.widget.LinearLayout" content-desc="Tab, Devices" clickable="true"
+      bounds="[648,2130][864,2340]" displayed="true" />
+</hierarchy>'''
+TILE_TEMP = '''
+    <android.view.View class="android.view.View" clickable="true" bounds="[40,TOP][1040,BOTTOM]" displayed="true">
+      <android.widget.TextView class="android.widget.TextView" text="NAME" clickable="false"
+          bounds="[200,NAME_TOP][900,NAME_BOTTOM]" displayed="true" />
+    </android.view.View>'''
+
+
+def replay(name):
+    """
+    Replay driver and page objects of a flow of benchmarks/benchmark_flows.py
+    :param name: Name of the flow in FLOWS
+    :return: Tuple of the driver, the page objects and the flow function
+    """
+    initial_screen, transitions, flow = FLOWS[name]()
+    driver = ReplayDriver(load_screens(), initial_screen, transitions)
+    return driver, AlexaAppPageObjects(driver, DEVICE_NAMES), flow
+
+
+@pytest.mark.parametrize('name', sorted(FLOWS))
+def test_round_trips_within_baseline(name):
+    with open(BASELINE_FILE) as f:
+        baseline = json.load(f)
+    assert run_flow(name)["round_trips"] <= baseline[name]
+
+
+def test_delete_dut():
+    driver, pages, flow = replay('delete_dut')
+    flow(pages)
+    assert driver.screen_history == ['devices', 'dut', 'dut_settings', 'dut_delete_confirm', 'devices_without_dut']
+    assert not pages.device_list_index.scanned
+
+
+def test_power_off_plug_off_already():
+    """
+    A plug in power off mode is left as it is, only its page is opened and read
+    """
+    driver, pages, flow = replay('power_off_dut_already_off')
+    flow(pages)
+    assert driver.screen_history == ['devices', 'dut_plug_off']
+    assert driver.commands == {"getPageSource": 3, "tap": 1}
+
+
+def test_power_on_plug_on_already():
+    """
+    DUT left on is never powered on, so it has no setup time to measure
+    """
+    transitions = [ReplayTransition('devices', 'dut_plug_on', 'click', tile_of(DEVICE_NAMES[0]))]
+    driver = ReplayDriver(load_screens(), 'devices', transitions)
+    with pytest.raises(AssertionError, match='power on mode already'):
+        AlexaAppPageObjects(driver, DEVICE_NAMES).power_on_dut()
+    assert 'clickElement' not in driver.commands
+
+
+class ResortingReplayDriver(ReplayDriver):
+    """
+    Replay driver whose device list is re-sorted between the snapshot locating a tile and the tap on it
+    """
+
+    def tap(self, positions, duration=None):
+        if self.screen == 'devices':
+            self._enter_screen('devices_resorted')
+        return super().tap(positions, duration)
+
+
+def test_tap_on_moved_tile_falls_back_to_locator():
+    screens = load_screens()
+    screens["devices_resorted"] = screens["devices"].replace('text="First plug"', 'text="TEMP"') \
+        .replace('text="Second plug"', 'text="First plug"').replace('text="TEMP"', 'text="Second plug"')
+    transitions = [
+        ReplayTransition('devices_resorted', 'provisioner_plug_on', 'click', tile_of(DEVICE_NAMES[1])),
+        ReplayTransition('provisioner_plug_on', 'devices_resorted', 'back'),
+        ReplayTransition('devices_resorted', 'dut_plug_off', 'click', tile_of(DEVICE_NAMES[0]))
+    ]
+    driver = ResortingReplayDriver(screens, 'devices', transitions)
+    pages = AlexaAppPageObjects(driver, DEVICE_NAMES)
+    pages.click_smart_device_from_devices_page(DEVICE_NAMES[0], timeout=0.5)
+    # The tap opened the plug which moved to the indexed position, then the plug is clicked by its locator
+    assert driver.screen_history == ['devices', 'devices_resorted', 'provisioner_plug_on', 'devices_resorted',
+                                     'dut_plug_off']
+    assert not pages.device_list_index.scanned
+
+
+class DeviceListReplayDriver(ReplayDriver):
+    """
+    Replay driver whose "Devices" page is rendered from a device list longer than the screen, scrolled by drags.
+    The list is back at its top after a device is deleted
+    """
+
+    def __init__(self, screens, devices, transitions):
+        self.devices = sorted(devices)
+        self.offset = 0
+        super().__init__(dict(screens, devices=self._render()), 'devices', transitions)
+
+    def set_devices(self, devices):
+        self.devices = sorted(devices)
+        self.sources["devices"] = self._render()
+        self.screens["devices"] = PageSnapshot(self.sources["devices"])
+
+    def _render(self):
+        left, top, right, bottom = LIST_BOUNDS
+        tiles = ''
+        for index, name in enumerate(self.devices):
+            tile_top = top + 20 + index * TILE_PITCH - self.offset
+            if tile_top + TILE_PITCH > top and tile_top < bottom:
+                tiles += TILE_TEMP.replace('NAME_TOP', str(tile_top + 60)).replace('NAME_BOTTOM', str(tile_top + 120)) \
+                    .replace('NAME', name).replace('TOP', str(tile_top)).replace('BOTTOM', str(tile_top + 230))
+        return DEVICES_PAGE_TEMP.replace('TILES', tiles)
+
+    def _drag(self, start_x, start_y, end_x, end_y):
+        if self.screen != 'devices':
+            return super()._drag(start_x, start_y, end_x, end_y)
+        max_offset = max(20 + len(self.devices) * TILE_PITCH - (LIST_BOUNDS[3] - LIST_BOUNDS[1]), 0)
+        self.offset = min(max(self.offset + start_y - end_y, 0), max_offset)
+        self.set_devices(self.devices)
+
+    def trigger(self, on, state=None):
+        deleting = self.screen == 'dut_delete_confirm'
+        super().trigger(on, state)
+        if deleting and self.screen == 'devices':
+            self.offset = 0
+            self.set_devices([name for name in self.devices if name != DEVICE_NAMES[2]])
+
+
+def test_device_list_is_scanned_once_across_rounds():
+    transitions = [
+        ReplayTransition('devices', 'provisioner_plug_on', 'click', tile_of(DEVICE_NAMES[1])),
+        ReplayTransition('provisioner_plug_on', 'provisioner_plug_off', 'click', PLUG_DEVICE_POWER_ON_LOCATOR),
+        ReplayTransition('provisioner_plug_off', 'provisioner_plug_on', 'click', PLUG_DEVICE_POWER_OFF_LOCATOR),
+        ReplayTransition('provisioner_plug_on', 'devices', 'click', PLUG_DEVICE_BACK_LOCATOR),
+        ReplayTransition('devices', 'dut_plug_off', 'click', tile_of(DEVICE_NAMES[0])),
+        ReplayTransition('dut_plug_off', 'dut_plug_on', 'click', PLUG_DEVICE_POWER_OFF_LOCATOR),
+        ReplayTransition('dut_plug_on', 'devices', 'click', PLUG_DEVICE_BACK_LOCATOR),
+        ReplayTransition('devices', 'dut', 'click', tile_of(DEVICE_NAMES[2])),
+        ReplayTransition('dut', 'dut_settings', 'click', SMART_DEVICE_CONFIG_LOCATOR),
+        ReplayTransition('dut_settings', 'dut_delete_confirm', 'click', SMART_DEVICE_DELETE_LOCATOR),
+        ReplayTransition('dut_delete_confirm', 'devices', 'click', SMART_DEVICE_DELETE_CONFIRM_LOCATOR)
+    ]
+    driver = DeviceListReplayDriver(load_screens(), OTHER_DEVICES + DEVICE_NAMES[:2], transitions)
+    pages = AlexaAppPageObjects(driver, DEVICE_NAMES)
+    for _ in range(2):
+        pages.power_off_and_on_plug(DEVICE_NAMES[1], off_time=0)
+        pages.click_navigate_back_from_plug_device_page()
+        pages.power_on_dut()
+        pages.click_navigate_back_from_plug_device_page()
+        driver.set_devices(driver.devices + [DEVICE_NAMES[2]])
+        pages.wait_until_smart_dut_present(60)
+        assert pages.device_list_index.tiles[DEVICE_NAMES[2]].order == len(OTHER_DEVICES) - 5 + 1
+        pages.delete_dut()
+    assert pages.device_list_index.scans == 1
+    assert len(pages.device_list_index.tiles) == len(OTHER_DEVICES) + 2
+    screens = ['provisioner_plug_on', 'provisioner_plug_off', 'provisioner_plug_on', 'devices', 'dut_plug_off',
+               'dut_plug_on', 'devices', 'dut', 'dut_settings', 'dut_delete_confirm', 'devices']
+    assert driver.screen_history == ['devices'] + screens * 2
@@ -0,0 +1,69 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import json
+
+import pytest
+
+from src.power_controller import HttpRelayPowerController, load_power_controller
+from src.relay_stub_server import RelayStubServer
+
+
+@pytest.fixture
+def relay():
+    server = RelayStubServer({"First plug": "off", "Second plug": "on"}).start()
+    yield server
+    server.stop()
+
+
+def test_power_on_and_off(relay):
+    controller = HttpRelayPowerController(relay.plug_urls())
+    controller.power_on('First plug')
+    assert controller.get_state('First plug') == 'on'
+    controller.power_off('First plug')
+    assert relay.states["First plug"] == 'off'
+    assert [(name, command) for _, name, command in relay.transitions] == [('First plug', 'on'), ('First plug', 'off')]
+
+
+def test_power_on_fails_if_plug_is_on(relay):
+    controller = HttpRelayPowerController(relay.plug_urls())
+    with pytest.raises(AssertionError, match='should be off'):
+        controller.power_on('Second plug')
+    assert relay.transitions == []
+
+
+def test_power_off_plug_off_already(relay):
+    HttpRelayPowerController(relay.plug_urls()).power_off('First plug')
+    assert relay.states["First plug"] == 'off'
+    assert relay.transitions == []
+
+
+def test_power_off_and_on(relay):
+    HttpRelayPowerController(relay.plug_urls()).power_off_and_on('Second plug', off_time=0)
+    transitions = [(name, command) for _, name, command in relay.transitions]
+    assert transitions == [('Second plug', 'off'), ('Second plug', 'on')]
+
+
+def test_unknown_plug(relay):
+    with pytest.raises(AssertionError, match='No relay url'):
+        HttpRelayPowerController(relay.plug_urls()).power_on('Third plug')
+
+
+def test_load_power_controller(relay, tmp_path):
+    config_file = tmp_path / 'relays.json'
+    config_file.write_text(json.dumps({"plugs": relay.plug_urls(), "state_url_temp": "URL/state"}))
+    controller = load_power_controller(str(config_file))
+    assert isinstance(controller, HttpRelayPowerController)
+    assert controller.get_state('Second plug') == 'on'
+    assert load_power_controller(None) is None
@@ -0,0 +1,111 @@
+#    Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License").
+#    You may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+import pytest
+
+from src.setup_time_stats import compare, describe, mann_whitney_greater, nearest_rank_percentiles, wilson_interval
+
+np = pytest.importorskip('numpy')
+
+RESAMPLES = 2000
+ROUNDS_PER_FIRMWARE = 200
+
+
+def make_rounds(groups):
+    """
+    Rounds as loaded by load_rounds() from groups of setup times
+    :param groups: Dictionary of the setup times keyed by firmware, nan for a failed round
+    :return: Dictionary of arrays
+    """
+    firmware = np.concatenate([np.full(len(times), name, dtype=object) for name, times in groups.items()])
+    setup_time = np.concatenate([np.asarray(times, dtype=np.float64) for times in groups.values()])
+    return {"firmware": firmware, "passed": ~np.isnan(setup_time), "setup_time": setup_time}
+
+
+def test_mann_whitney_greater():
+    rng = np.random.default_rng(0)
+    baseline = rng.normal(30, 3, 100)
+    p_value, superiority = mann_whitney_greater(baseline, baseline + 10)
+    assert p_value < 1e-10
+    assert superiority > 0.95
+    # The candidate is faster, so it is not greater
+    p_value, superiority = mann_whitney_greater(baseline, baseline - 10)
+    assert p_value > 0.99
+    assert superiority < 0.05
+
+
+def test_mann_whitney_greater_same_distribution():
+    rng = np.random.default_rng(1)
+    p_value, superiority = mann_whitney_greater(rng.normal(30, 3, 200), rng.normal(30, 3, 200))
+    assert p_value > 0.01
+    assert 0.4 < superiority < 0.6
+    # All values tie
+    assert mann_whitney_greater(np.full(5, 30.0), np.full(5, 30.0)) == (1.0, 0.5)
+
+
+def test_nearest_rank_percentiles():
+    values = np.arange(1, 11, dtype=np.float64)
+    assert nearest_rank_percentiles(values, [0, 50, 90, 95, 100]).tolist() == [1, 5, 9, 10, 10]
+
+
+def test_wilson_interval():
+    low, high = wilson_interval(95, 100)
+    assert low < 0.95 < high
+    assert 0.88 < low and high < 0.98
+
+
+def test_describe():
+    rounds = make_rounds({"1.0": [10.0] * 9 + [np.nan] + [100.0]})
+    item = describe(rounds, resamples=RESAMPLES, rng=np.random.default_rng(2))
+    assert (item["rounds"], item["passed"], item["setup_times"]) == (11, 10, 10)
+    assert item["p50"] == 10.0
+    assert item["outliers"] == 1
+
+
+def test_compare_flags_slower_candidate():
+    rng = np.random.default_rng(3)
+    rounds = make_rounds({"1.0": rng.normal(30, 3, ROUNDS_PER_FIRMWARE),
+                          "1.1": rng.normal(36, 3, ROUNDS_PER_FIRMWARE)})
+    item = compare(rounds, "1.0", "1.1", resamples=RESAMPLES, rng=rng)
+    assert item["regression"]
+    assert len(item["reasons"]) == 1 and 'Median setup time' in item["reasons"][0]
+    low, high = item["setup_time_test"]["median_shift_ci"]
+    assert low < 6 < high
+    assert item["setup_time_test"]["median_ratio"] == pytest.approx(0.2, abs=0.05)
+
+
+def test_compare_same_distribution():
+    rng = np.random.default_rng(4)
+    rounds = make_rounds({"1.0": rng.normal(30, 3, ROUNDS_PER_FIRMWARE),
+                          "1.1": rng.normal(30, 3, ROUNDS_PER_FIRMWARE)})
+    item = compare(rounds, "1.0", "1.1", resamples=RESAMPLES, rng=rng)
+    assert not item["regression"]
+    assert item["reasons"] == []
+
+
+def test_compare_flags_lower_success_rate():
+    rng = np.random.default_rng(5)
+    candidate = rng.normal(30, 3, ROUNDS_PER_FIRMWARE)
+    candidate[:40] = np.nan
+    rounds = make_rounds({"1.0": rng.normal(30, 3, ROUNDS_PER_FIRMWARE), "1.1": candidate})
+    item = compare(rounds, "1.0", "1.1", resamples=RESAMPLES, rng=rng)
+    assert item["regression"]
+    assert item["success_rate_test"]["drop"] == pytest.approx(0.2)
+    assert any('Success rate' in reason for reason in item["reasons"])
+
+
+def test_compare_unknown_group():
+    rounds = make_rounds({"1.0": [30.0, 31.0]})
+    with pytest.raises(AssertionError, match='No round of the candidate'):
+        compare(rounds, "1.0", "2.0", resamples=RESAMPLES)